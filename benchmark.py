@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MarkItDown GUI 性能基准
+在本地生成的合成文件（大CSV/XLSX、长DOCX、HTML、带图片的EPUB、多MB文本）上
+测量完整转换流水线（MarkItDown 转换 + 图片提取 + 图片引用处理 + 保存）的耗时，
+按百分位数报告，并可与基准文件比较，在发布前发现性能退化
+
+用法:
+    python benchmark.py                              # 运行全部基准
+    python benchmark.py --save-baseline base.json    # 保存结果作为基准
+    python benchmark.py --baseline base.json         # 与基准比较，退化时返回非0
+    python benchmark.py --only rewrite               # 只运行图片引用改写基准（不需要markitdown）
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import struct
+import random
+import zipfile
+import zlib
+import argparse
+import tempfile
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import markitdown_core
+from markitdown_cache import get_markitdown_version
+from markitdown_stats import ConversionStats
+
+
+# 图片引用改写基准：Markdown大小（MB）和图片数量
+REWRITE_SIZES_MB = (1, 2, 4, 8)
+REWRITE_IMAGE_COUNT = 500
+
+# 每个测量重复的次数（改写基准取最短耗时，流水线基准统计百分位数）
+REPEAT = 3
+PIPELINE_REPEAT = 5
+
+# 报告的百分位数
+PERCENTILES = (50, 90, 99)
+
+# 与基准比较时允许的中位数变慢比例
+DEFAULT_TOLERANCE = 0.25
+
+# 生成语料使用的随机种子（保证每次生成的文件相同）
+CORPUS_SEED = 20241219
+
+# 语料规模（scale=1 时）
+CSV_ROWS = 20000
+XLSX_ROWS = 5000
+DOCX_PARAGRAPHS = 2000
+HTML_PARAGRAPHS = 5000
+EPUB_CHAPTERS = 30
+EPUB_IMAGES = 60
+TEXT_MB = 8
+
+# 压缩包成员的固定时间戳
+ZIP_DATE_TIME = (2024, 12, 1, 0, 0, 0)
+
+
+def best_time(func, repeat=REPEAT):
+    """多次运行取最短耗时（秒）"""
+    best = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def percentile(values, percent):
+    """线性插值计算百分位数"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    position = (len(ordered) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+# ---------------------------------------------------------------- 合成语料
+
+def _words(rng, count):
+    """生成由常用词组成的一段文字"""
+    vocabulary = ("markdown", "转换", "性能", "document", "数据", "table", "图片", "章节",
+                  "benchmark", "测试", "pipeline", "内容", "format", "文件", "quality", "结果")
+    return " ".join(rng.choice(vocabulary) for _ in range(count))
+
+
+def make_png(rng, width=64, height=64):
+    """生成一张随机内容的PNG图片（不依赖Pillow）"""
+    rows = b"".join(b"\x00" + rng.randbytes(width * 3) for _ in range(height))
+
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b""))
+
+
+def _writestr(archive, name, data, compress_type=zipfile.ZIP_DEFLATED):
+    """以固定时间戳写入压缩包成员，保证每次生成的文件字节相同"""
+    info = zipfile.ZipInfo(name, date_time=ZIP_DATE_TIME)
+    info.compress_type = compress_type
+    archive.writestr(info, data)
+
+
+def write_csv(path, rng, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write("id,name,category,price,quantity,region,updated,comment\n")
+        for i in range(rows):
+            f.write(f"{i},item-{rng.randrange(10**6)},{rng.choice('ABCDE')},{rng.random() * 1000:.2f},"
+                    f"{rng.randrange(1000)},{rng.choice(('华东', '华北', 'west', 'east'))},"
+                    f"2024-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d},\"{_words(rng, 6)}\"\n")
+
+
+def write_xlsx(path, rng, rows):
+    """手写最小的XLSX（内联字符串），不依赖openpyxl"""
+    columns = "ABCDEF"
+    sheet_rows = []
+    for r in range(1, rows + 1):
+        cells = [f'<c r="A{r}"><v>{r}</v></c>',
+                 f'<c r="B{r}"><v>{rng.random() * 1000:.3f}</v></c>']
+        for column in columns[2:]:
+            cells.append(f'<c r="{column}{r}" t="inlineStr"><is><t>{escape(_words(rng, 3))}</t></is></c>')
+        sheet_rows.append(f'<row r="{r}">{"".join(cells)}</row>')
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as xlsx:
+        _writestr(xlsx, "[Content_Types].xml", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            '<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            '</Types>'))
+        _writestr(xlsx, "_rels/.rels", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+            '</Relationships>'))
+        _writestr(xlsx, "xl/workbook.xml", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            '<sheets><sheet name="数据" sheetId="1" r:id="rId1"/></sheets></workbook>'))
+        _writestr(xlsx, "xl/_rels/workbook.xml.rels", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>'
+            '</Relationships>'))
+        _writestr(xlsx, "xl/worksheets/sheet1.xml", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            f'<sheetData>{"".join(sheet_rows)}</sheetData></worksheet>'))
+
+
+def write_docx(path, rng, paragraphs):
+    """手写最小的DOCX（标题和正文段落），不依赖python-docx"""
+    body = []
+    for i in range(paragraphs):
+        if i % 40 == 0:
+            body.append(f'<w:p><w:pPr><w:pStyle w:val="Heading1"/></w:pPr>'
+                        f'<w:r><w:t>第 {i // 40 + 1} 章</w:t></w:r></w:p>')
+        body.append(f'<w:p><w:r><w:t>{escape(_words(rng, 40))}</w:t></w:r></w:p>')
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as docx:
+        _writestr(docx, "[Content_Types].xml", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+            '</Types>'))
+        _writestr(docx, "_rels/.rels", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+            '</Relationships>'))
+        _writestr(docx, "word/document.xml", (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f'<w:body>{"".join(body)}</w:body></w:document>'))
+
+
+def write_html(path, rng, paragraphs):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("<!DOCTYPE html><html><head><meta charset='utf-8'><title>基准页面</title></head><body>\n")
+        for i in range(paragraphs):
+            if i % 100 == 0:
+                f.write(f"<h2>小节 {i // 100 + 1}</h2>\n<ul>")
+                f.write("".join(f"<li><a href='#s{i}-{j}'>{_words(rng, 3)}</a></li>" for j in range(5)))
+                f.write("</ul>\n<table><tr><th>键</th><th>值</th></tr>")
+                f.write("".join(f"<tr><td>{j}</td><td>{_words(rng, 4)}</td></tr>" for j in range(10)))
+                f.write("</table>\n")
+            f.write(f"<p>{_words(rng, 30)} <b>{_words(rng, 2)}</b></p>\n")
+        f.write("</body></html>\n")
+
+
+def write_epub(path, rng, chapters, images):
+    """生成带图片的EPUB，各章节的图片同名放在不同目录，与实际电子书类似"""
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as epub:
+        _writestr(epub, "mimetype", "application/epub+zip", zipfile.ZIP_STORED)
+        _writestr(epub, "META-INF/container.xml", (
+            '<?xml version="1.0"?><container version="1.0" '
+            'xmlns="urn:oasis:names:tc:opendocument:xmlns:container"><rootfiles>'
+            '<rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>'
+            '</rootfiles></container>'))
+
+        manifest = []
+        spine = []
+        for c in range(chapters):
+            paragraphs = []
+            for n, i in enumerate(range(c, images, chapters)):
+                href = f"chapter{c}/image{n}.png"
+                _writestr(epub, f"OEBPS/{href}", make_png(rng))
+                paragraphs.append(f'<p><img src="{href}" alt="插图 {i}"/></p>')
+                manifest.append(f'<item id="img{i}" href="{href}" media-type="image/png"/>')
+            paragraphs.extend(f"<p>{_words(rng, 50)}</p>" for _ in range(40))
+            _writestr(epub, f"OEBPS/chapter{c}.xhtml", (
+                '<?xml version="1.0" encoding="utf-8"?><html xmlns="http://www.w3.org/1999/xhtml">'
+                f'<head><title>第 {c + 1} 章</title></head><body><h1>第 {c + 1} 章</h1>'
+                f'{"".join(paragraphs)}</body></html>'))
+            manifest.append(f'<item id="ch{c}" href="chapter{c}.xhtml" media-type="application/xhtml+xml"/>')
+            spine.append(f'<itemref idref="ch{c}"/>')
+
+        _writestr(epub, "OEBPS/content.opf", (
+            '<?xml version="1.0" encoding="utf-8"?>'
+            '<package xmlns="http://www.idpf.org/2007/opf" version="3.0" unique-identifier="id">'
+            '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:title>基准电子书</dc:title>'
+            '<dc:identifier id="id">markitdown-benchmark</dc:identifier><dc:language>zh</dc:language></metadata>'
+            f'<manifest>{"".join(manifest)}</manifest><spine>{"".join(spine)}</spine></package>'))
+
+
+def write_text(path, rng, size_mb):
+    target = size_mb * 1024 * 1024
+    size = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        while size < target:
+            line = f"2024-12-{rng.randrange(1, 32):02d} INFO {_words(rng, 15)}\n"
+            f.write(line)
+            size += len(line.encode('utf-8'))
+
+
+def generate_corpus(corpus_dir, scale=1.0):
+    """生成合成语料（固定随机种子，同一 scale 下每次生成的文件相同），返回文件路径列表"""
+    os.makedirs(corpus_dir, exist_ok=True)
+    rng = random.Random(CORPUS_SEED)
+
+    def scaled(count):
+        return max(1, int(count * scale))
+
+    generators = (
+        ("large.csv", lambda path: write_csv(path, rng, scaled(CSV_ROWS))),
+        ("large.xlsx", lambda path: write_xlsx(path, rng, scaled(XLSX_ROWS))),
+        ("long.docx", lambda path: write_docx(path, rng, scaled(DOCX_PARAGRAPHS))),
+        ("page.html", lambda path: write_html(path, rng, scaled(HTML_PARAGRAPHS))),
+        ("book.epub", lambda path: write_epub(path, rng, scaled(EPUB_CHAPTERS), scaled(EPUB_IMAGES))),
+        ("log.txt", lambda path: write_text(path, rng, max(1, round(TEXT_MB * scale)))),
+    )
+
+    paths = []
+    for name, generate in generators:
+        path = os.path.join(corpus_dir, name)
+        generate(path)
+        paths.append(path)
+    return paths
+
+
+# ---------------------------------------------------------------- 基准
+
+def make_rewrite_fixture(size_mb, image_count=REWRITE_IMAGE_COUNT):
+    """生成带图片引用的Markdown和对应的提取图片列表
+
+    各章节目录中的图片同名（image.jpg），与实际EPUB中常见的情况一致。
+    """
+    images = []
+    for i in range(image_count):
+        filename = f"image-{i:08x}.jpg"
+        images.append({
+            'original_path': f"OEBPS/chapter{i}/image.jpg",
+            'extracted_path': os.path.join("images", filename),
+            'filename': filename,
+            'relative_path': f"images/{filename}",
+        })
+
+    paragraph = "这是一段用于性能测试的正文。" * 8
+    blocks = []
+    size = 0
+    target = size_mb * 1024 * 1024
+    i = 0
+    while size < target:
+        n = i % image_count
+        block = (f"{paragraph}\n\n![插图{n}](../chapter{n}/image.jpg)\n\n"
+                 f"<img src=\"../chapter{n}/image.jpg\" alt=\"插图{n}\"/>\n\n")
+        blocks.append(block)
+        size += len(block.encode('utf-8'))
+        i += 1
+
+    return "".join(blocks), images
+
+
+def bench_image_rewriter(args, results):
+    """图片引用改写：耗时应随Markdown大小线性增长"""
+    print(f"\n图片引用改写（relative 模式，{REWRITE_IMAGE_COUNT} 张图片）")
+    print(f"  {'大小':>6}  {'耗时':>10}  {'每MB耗时':>10}")
+
+    per_mb = []
+    for size_mb in REWRITE_SIZES_MB:
+        markdown, images = make_rewrite_fixture(size_mb)
+        elapsed = best_time(
+            lambda: markitdown_core.process_markdown_images(markdown, images, "", "relative"))
+        per_mb.append(elapsed / size_mb)
+        results[f"rewrite_{size_mb}mb"] = {'p50': elapsed, 'samples': 1}
+        print(f"  {size_mb:>4}MB  {elapsed * 1000:>8.1f}ms  {elapsed / size_mb * 1000:>8.1f}ms")
+
+    # 线性增长时每MB耗时基本不变
+    ratio = per_mb[-1] / per_mb[0]
+    linear = ratio < 2.0
+    mark = "✓" if linear else "✗"
+    print(f"{mark} 最大/最小输入的每MB耗时之比: {ratio:.2f}（小于2视为线性）")
+    return linear
+
+
+def bench_pipeline(args, results):
+    """完整转换流水线：每个合成文件重复转换，报告百分位数和各阶段中位数"""
+    print(f"\n完整转换流水线（每个文件 {args.repeat} 次，规模 {args.scale}）")
+
+    try:
+        md = markitdown_core.get_markitdown_instance()
+    except ImportError:
+        md = None
+    if md is None:
+        print("- 未安装markitdown，跳过流水线基准")
+        return True
+
+    corpus_dir = args.corpus_dir or tempfile.mkdtemp(prefix="markitdown_corpus_")
+    output_dir = tempfile.mkdtemp(prefix="markitdown_bench_")
+    try:
+        start_time = time.perf_counter()
+        corpus = generate_corpus(corpus_dir, args.scale)
+        print(f"  已生成语料: {corpus_dir}（{time.perf_counter() - start_time:.1f}s）")
+
+        # 关闭缓存，每次都实际转换
+        options = markitdown_core.make_options(use_cache=False)
+        header = "  ".join(f"{'p' + str(p):>9}" for p in PERCENTILES)
+        print(f"  {'文件':<12} {'大小':>9}  {header}  各阶段中位数")
+
+        for path in corpus:
+            name = os.path.basename(path)
+            durations = []
+            stage_samples = {}
+            for run in range(args.repeat):
+                run_dir = os.path.join(output_dir, f"{name}-{run}")
+                os.makedirs(run_dir)
+                stats = ConversionStats(path)
+                start_time = time.perf_counter()
+                result = markitdown_core.convert_document(md, path, options, images_output_dir=run_dir,
+                                                          stats=stats)
+                with stats.stage('save'):
+                    markitdown_core.save_markdown(result['markdown'], os.path.join(run_dir, "output.md"))
+                durations.append(time.perf_counter() - start_time)
+                for stage in stats.stages:
+                    stage_samples.setdefault(stage['stage'], []).append(stage['seconds'])
+                shutil.rmtree(run_dir, ignore_errors=True)
+
+            entry = {f"p{p}": percentile(durations, p) for p in PERCENTILES}
+            entry['samples'] = len(durations)
+            entry['stages'] = {stage: percentile(samples, 50) for stage, samples in stage_samples.items()}
+            results[f"pipeline_{name}"] = entry
+
+            size = markitdown_core.format_bytes(os.path.getsize(path))
+            values = "  ".join(f"{entry['p' + str(p)] * 1000:>7.1f}ms" for p in PERCENTILES)
+            stages = "，".join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in entry['stages'].items())
+            print(f"  {name:<12} {size:>9}  {values}  {stages}")
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+        if not args.corpus_dir:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    return True
+
+
+BENCHMARKS = {
+    'rewrite': bench_image_rewriter,
+    'pipeline': bench_pipeline,
+}
+
+
+def compare_with_baseline(results, baseline_path, tolerance, args):
+    """与基准文件比较中位数，返回是否没有退化
+
+    语料规模或转换次数与基准不同时结果不可比，不做比较并返回False。
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    baseline = data['results']
+
+    print(f"\n与基准比较（允许变慢 {tolerance:.0%}）: {baseline_path}")
+    mismatched = [f"{name} 基准为 {data[name]}，本次为 {getattr(args, name)}"
+                  for name in ('scale', 'repeat') if name in data and data[name] != getattr(args, name)]
+    if mismatched:
+        print(f"  ✗ 运行参数与基准不同，无法比较（{'；'.join(mismatched)}）")
+        return False
+
+    ok = True
+    for name, entry in results.items():
+        if name not in baseline:
+            print(f"  - {name}: 基准中没有此项")
+            continue
+        before = baseline[name]['p50']
+        after = entry['p50']
+        change = after / before - 1 if before else 0.0
+        regressed = change > tolerance
+        ok = ok and not regressed
+        mark = "✗" if regressed else "✓"
+        print(f"  {mark} {name}: {before * 1000:.1f}ms -> {after * 1000:.1f}ms ({change:+.0%})")
+    return ok
+
+
+def save_baseline(results, baseline_path, args):
+    """保存本次结果作为基准"""
+    data = {
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': sys.version.split()[0],
+        'markitdown': get_markitdown_version(),
+        'scale': args.scale,
+        'repeat': args.repeat,
+        'results': results,
+    }
+    with open(baseline_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    print(f"\n基准已保存: {baseline_path}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="MarkItDown GUI 性能基准")
+    parser.add_argument("--only", choices=sorted(BENCHMARKS), action="append",
+                        help="只运行指定的基准（可重复）")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="合成语料的规模倍数（默认: 1.0）")
+    parser.add_argument("--repeat", type=int, default=PIPELINE_REPEAT,
+                        help="流水线基准中每个文件的转换次数（默认: %(default)s）")
+    parser.add_argument("--corpus-dir",
+                        help="保存合成语料的目录（默认使用临时目录，结束后删除）")
+    parser.add_argument("--baseline", help="与此基准文件比较，中位数退化超过容差时返回非0")
+    parser.add_argument("--save-baseline", metavar="文件", help="把本次结果保存为基准文件")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help="允许的中位数变慢比例（默认: %(default)s）")
+    return parser
+
+
+def main(argv=None):
+    """运行基准，返回进程退出码"""
+    args = build_parser().parse_args(argv)
+    args.repeat = max(1, args.repeat)
+
+    print("=" * 50)
+    print("MarkItDown GUI 性能基准")
+    print("=" * 50)
+
+    names = args.only or list(BENCHMARKS)
+    results = {}
+    passed = sum(1 for name in names if BENCHMARKS[name](args, results))
+    print(f"\n完成: {passed}/{len(names)} 项符合预期")
+    ok = passed == len(names)
+
+    if args.baseline:
+        ok = compare_with_baseline(results, args.baseline, args.tolerance, args) and ok
+    if args.save_baseline:
+        save_baseline(results, args.save_baseline, args)
+
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -52,6 +52,18 @@ a = Analysis(
     binaries=[],
     datas=magika_datas,
     hiddenimports=[
+        'markitdown_core',
+        'markitdown_cli',
+        'markitdown_cache',
+        'markitdown_sync',
+        'markitdown_images',
+        'markitdown_stats',
+        'markitdown_worker',
+        'markitdown_stream',
+        'markitdown_detect',
+        'markitdown_watch',
+        'markitdown_server',
+        'markitdown_chunks',
         'markitdown',
         'markitdown._markitdown',
         'markitdown.converters',
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MarkItDown 转换缓存
+按文件内容哈希和转换选项缓存 MarkItDown 的转换结果，超出容量时按最近最少使用（LRU）淘汰；
+另按 (路径, 大小, 修改时间) 缓存文件类型检测的结果
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+
+
+# 默认缓存容量（MB）
+DEFAULT_CACHE_MAX_MB = 1024
+
+# 计算内容哈希时每次读取的字节数
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# 文件类型缓存的数据库文件名和最多保存的条目数
+TYPE_CACHE_FILENAME = 'file_types.sqlite'
+TYPE_CACHE_MAX_ENTRIES = 100000
+
+# 影响 MarkItDown 转换结果的选项（图片引用方式等在读取缓存之后才处理，不参与索引）
+CACHE_KEY_OPTIONS = ('keep_data_uris', 'use_plugins')
+
+# 缓存键的格式版本，键的组成变化时加1，旧条目不再命中（按LRU淘汰）
+CACHE_KEY_VERSION = 2
+
+
+def default_cache_dir():
+    """默认缓存目录"""
+    if sys.platform == 'win32':
+        base_dir = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+        return os.path.join(base_dir, 'MarkItDown-GUI', 'cache')
+    base_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base_dir, 'markitdown-gui')
+
+
+def get_markitdown_version():
+    """获取已安装的markitdown版本，版本变化时旧缓存自动失效"""
+    try:
+        from importlib.metadata import version
+        return version('markitdown')
+    except Exception:
+        try:
+            import markitdown
+            return getattr(markitdown, '__version__', 'unknown')
+        except ImportError:
+            return 'unknown'
+
+
+def hash_file(path):
+    """计算文件内容的SHA-256（分块读取，内存占用固定）"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ConversionCache:
+    """Markdown转换结果的磁盘缓存
+
+    每条缓存是缓存目录下的一个 .md 文件，文件的修改时间即最近使用时间，
+    命中时刷新修改时间，超出容量时从最久未使用的条目开始删除。
+    多个进程可以共用同一个缓存目录。
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_CACHE_MAX_MB * 1024 * 1024):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._total_bytes = None  # 首次写入时统计
+        self._version = None
+
+    def make_key(self, input_path, options, content_hash=None):
+        """根据文件内容哈希、扩展名、转换选项和markitdown版本生成缓存键
+
+        内容相同的文件按扩展名可能有不同的转换结果（例如 a.csv 和 a.txt），扩展名也参与索引。
+        """
+        if self._version is None:
+            self._version = get_markitdown_version()
+
+        key_data = {
+            'format': CACHE_KEY_VERSION,
+            'content': content_hash or hash_file(input_path),
+            'extension': os.path.splitext(input_path)[1].lower(),
+            'options': {name: options.get(name) for name in CACHE_KEY_OPTIONS},
+            'markitdown': self._version,
+        }
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.md")
+
+    def get(self, key):
+        """读取缓存，未命中返回None"""
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        # 刷新最近使用时间
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+
+        with self._lock:
+            self.hits += 1
+        return content
+
+    def put(self, key, markdown_content):
+        """写入缓存（先写临时文件再替换，避免其他进程读到半个文件）"""
+        entry_path = self._entry_path(key)
+        entry_dir = os.path.dirname(entry_path)
+
+        try:
+            os.makedirs(entry_dir, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=entry_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(markdown_content)
+            entry_size = os.path.getsize(temp_path)
+            os.replace(temp_path, entry_path)
+        except OSError as e:
+            print(f"写入转换缓存失败: {e}")
+            return
+
+        with self._lock:
+            if self._total_bytes is None:
+                self._total_bytes = self._scan()[1]
+            else:
+                self._total_bytes += entry_size
+            over_limit = self._total_bytes > self.max_bytes
+
+        if over_limit:
+            self.evict()
+
+    def _scan(self):
+        """列出所有缓存条目，返回 ([(最近使用时间, 大小, 路径), ...], 总大小)"""
+        entries = []
+        total_bytes = 0
+        if not os.path.isdir(self.cache_dir):
+            return entries, 0
+
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.name.endswith('.md'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_bytes += stat.st_size
+
+        return entries, total_bytes
+
+    def evict(self):
+        """按LRU删除条目，直到总大小降到容量的90%以下"""
+        with self._lock:
+            entries, total_bytes = self._scan()
+            target_bytes = self.max_bytes * 0.9
+
+            entries.sort()
+            for _mtime, size, path in entries:
+                if total_bytes <= target_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total_bytes -= size
+                except OSError:
+                    pass
+
+            self._total_bytes = total_bytes
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            entries, _total_bytes = self._scan()
+            for _mtime, _size, path in entries:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._total_bytes = 0
+
+    def stats_text(self):
+        """命中统计文字，用于状态栏"""
+        return f"缓存 命中 {self.hits} / 未命中 {self.misses}"
+
+
+# 每个进程共用的缓存实例，按 (目录, 容量) 区分
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_conversion_cache(cache_dir=None, max_mb=DEFAULT_CACHE_MAX_MB):
+    """获取（必要时创建）当前进程中共用的缓存实例"""
+    cache_key = (cache_dir or default_cache_dir(), max_mb)
+    with _caches_lock:
+        cache = _caches.get(cache_key)
+        if cache is None:
+            cache = ConversionCache(cache_key[0], max_mb * 1024 * 1024)
+            _caches[cache_key] = cache
+        return cache
+
+
+class FileTypeCache:
+    """文件类型检测结果的磁盘缓存（SQLite）
+
+    以 (路径, 大小, 修改时间) 为键保存 MarkItDown 的 StreamInfo 猜测列表，
+    文件被修改或markitdown版本变化后自动失效。多个进程可以共用同一个数据库；
+    缓存只用于加速，读写失败时当作未命中。
+    """
+
+    def __init__(self, cache_dir=None, max_entries=TYPE_CACHE_MAX_ENTRIES):
+        self.db_path = os.path.join(cache_dir or default_cache_dir(), TYPE_CACHE_FILENAME)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = None
+        self._version = None
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=5, check_same_thread=False)
+            conn.execute("CREATE TABLE IF NOT EXISTS file_types ("
+                         "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, "
+                         "markitdown TEXT, guesses TEXT, checked_at REAL)")
+            self._conn = conn
+            self._version = get_markitdown_version()
+        return self._conn
+
+    def get(self, path, size, mtime_ns):
+        """读取缓存的猜测列表（字典列表），未命中返回None"""
+        with self._lock:
+            try:
+                row = self._connect().execute(
+                    "SELECT size, mtime_ns, markitdown, guesses FROM file_types WHERE path = ?",
+                    (path,)).fetchone()
+            except sqlite3.Error:
+                return None
+        if row is None or tuple(row[:3]) != (size, mtime_ns, self._version):
+            return None
+        try:
+            return json.loads(row[3])
+        except ValueError:
+            return None
+
+    def put(self, path, size, mtime_ns, guesses):
+        """写入猜测列表（字典列表），超出条目数时删除最早检测的条目"""
+        with self._lock:
+            try:
+                conn = self._connect()
+                with conn:
+                    conn.execute("INSERT OR REPLACE INTO file_types VALUES (?, ?, ?, ?, ?, ?)",
+                                 (path, size, mtime_ns, self._version,
+                                  json.dumps(guesses, ensure_ascii=False), time.time()))
+                    count = conn.execute("SELECT COUNT(*) FROM file_types").fetchone()[0]
+                    if count > self.max_entries:
+                        # 一次多删一成，避免每次写入都要删除
+                        conn.execute("DELETE FROM file_types WHERE path IN (SELECT path FROM file_types "
+                                     "ORDER BY checked_at LIMIT ?)",
+                                     (count - int(self.max_entries * 0.9),))
+            except sqlite3.Error as e:
+                print(f"写入文件类型缓存失败: {e}")
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            try:
+                with self._connect() as conn:
+                    conn.execute("DELETE FROM file_types")
+            except sqlite3.Error:
+                pass
+
+    def close(self):
+        """关闭数据库连接（之后使用时自动重新打开）"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# 每个进程共用的文件类型缓存，按目录区分
+_type_caches = {}
+
+
+def get_type_cache(cache_dir=None):
+    """获取（必要时创建）当前进程中共用的文件类型缓存"""
+    cache_dir = cache_dir or default_cache_dir()
+    with _caches_lock:
+        cache = _type_caches.get(cache_dir)
+        if cache is None:
+            cache = FileTypeCache(cache_dir)
+            _type_caches[cache_dir] = cache
+        return cache
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MarkItDown 分块输出（JSON Lines）
+把转换结果按标题切分为大小有上限的分块（按字符数或估计的词元数，可设置重叠），
+每个分块连同来源文件、标题路径、页码和幻灯片编号写成一行JSON，可直接用于向量检索（RAG）。
+Markdown 逐行读取、逐块写出，内存占用只与分块大小有关
+"""
+
+import os
+import re
+import json
+import shutil
+
+
+# 分块大小的计量单位
+CHUNK_UNITS = ('chars', 'tokens')
+
+# 只指定合并的分块文件、未指定分块大小时使用的大小
+DEFAULT_CHUNK_SIZE = 2000
+
+# 估计词元数时，非中日韩文字平均每个词元的字符数
+CHARS_PER_TOKEN = 4
+
+# 逐行读取时单行的最大字符数（超长的行分段读取）
+LINE_READ_LIMIT = 1024 * 1024
+
+# 合并分块文件时每次复制的字节数
+COPY_BUFFER_SIZE = 1024 * 1024
+
+# 分块文件的后缀（与Markdown文件同名）
+CHUNKS_SUFFIX = '.chunks.jsonl'
+
+HEADING_PATTERN = re.compile(r'^ {0,3}(#{1,6})(?:[ \t]+(.*?))?(?:[ \t]+#+)?[ \t]*$')
+FENCE_PATTERN = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+# MarkItDown 在每张幻灯片开头输出的注释
+SLIDE_PATTERN = re.compile(r'^<!-- Slide number: (\d+) -->$')
+# 中日韩文字（估计词元数时每个字符约1个词元）
+_CJK_PATTERN = re.compile(r'[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]')
+
+
+def estimate_tokens(text):
+    """粗略估计词元数：中日韩字符每个约1个词元，其余约 CHARS_PER_TOKEN 个字符1个词元"""
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk) / CHARS_PER_TOKEN
+
+
+def check_chunk_options(size, overlap, unit):
+    """检查分块参数，不正确时抛出 ValueError"""
+    if unit not in CHUNK_UNITS:
+        raise ValueError(f"不支持的分块单位: {unit}")
+    if size < 0 or overlap < 0:
+        raise ValueError("分块大小和重叠不能为负数")
+    if size and overlap >= size:
+        raise ValueError(f"分块重叠（{overlap}）必须小于分块大小（{size}）")
+
+
+def chunks_path_for(output_path):
+    """Markdown文件对应的分块文件路径"""
+    return os.path.splitext(output_path)[0] + CHUNKS_SUFFIX
+
+
+def iter_lines(stream, limit=LINE_READ_LIMIT):
+    """逐行读取文本流，超过 limit 个字符的行分段返回"""
+    while True:
+        line = stream.readline(limit)
+        if not line:
+            break
+        yield line
+
+
+class MarkdownChunker:
+    """把逐行输入的Markdown切分为分块
+
+    遇到标题或新的幻灯片时结束当前分块，标题路径随之更新（代码块中的 # 不是标题）；
+    同一节中的内容超出 max_size 时，尽量在空行处切开，下一块以上一块末尾的 overlap 开头。
+    page_breaks 为真时按换页符（pdfminer 在每页末尾输出）计算页码。
+    """
+
+    def __init__(self, max_size, overlap=0, unit='chars', page_breaks=False):
+        check_chunk_options(max_size, overlap, unit)
+        if not max_size:
+            raise ValueError("分块大小必须大于0")
+        self.max_size = max_size
+        self.overlap = overlap
+        self.measure = len if unit == 'chars' else estimate_tokens
+        self.page = 1 if page_breaks else None
+        self.slide = None
+        self._headings = []  # [(级别, 标题)]
+        self._pieces = []  # [(文字, 大小, 页码)]
+        self._size = 0
+        self._new_from = 0  # _pieces 中此位置之前是与上一块重叠的内容
+        self._has_content = False  # 是否已有重叠之外的非空内容
+        self._fence = None
+        self._line_start = True
+
+    def feed(self, text):
+        """输入一行（或一行的一段），返回已完成的分块（字典）列表"""
+        at_line_start = self._line_start
+        self._line_start = text.endswith('\n')
+        chunks = []
+        if self.page is not None and '\f' in text:
+            for index, part in enumerate(text.split('\f')):
+                if index:
+                    self.page += 1
+                if part:
+                    self._feed_line(part, at_line_start or index > 0, chunks)
+        else:
+            self._feed_line(text, at_line_start, chunks)
+        return chunks
+
+    def finish(self):
+        """输入结束，返回剩余的分块列表"""
+        chunks = []
+        self._flush(chunks)
+        return chunks
+
+    def _feed_line(self, text, line_start, chunks):
+        if line_start:
+            line = text.rstrip('\r\n')
+            fence = FENCE_PATTERN.match(line)
+            heading = None if self._fence or fence else HEADING_PATTERN.match(line)
+            if self._fence:
+                if fence and fence.group(1)[0] == self._fence[0] and len(fence.group(1)) >= len(self._fence) \
+                        and not line.strip().strip(self._fence[0]):
+                    self._fence = None
+            elif fence:
+                self._fence = fence.group(1)
+            elif heading:
+                self._flush(chunks)
+                level = len(heading.group(1))
+                while self._headings and self._headings[-1][0] >= level:
+                    self._headings.pop()
+                self._headings.append((level, (heading.group(2) or '').strip()))
+            else:
+                slide = SLIDE_PATTERN.match(line)
+                if slide:
+                    # 幻灯片编号记录在分块信息中，注释本身不写入分块
+                    self._flush(chunks)
+                    self.slide = int(slide.group(1))
+                    self._headings = []
+                    return
+
+        size = self.measure(text)
+        if size <= self.max_size - self.overlap:
+            self._add(text, size, chunks)
+        else:
+            # 单行超出分块大小：切成每段加上重叠后不超过上限的几段
+            for part in self._split(text, self.max_size - self.overlap):
+                self._add(part, self.measure(part), chunks)
+
+    def _add(self, text, size, chunks):
+        while self._has_content and self._size + size > self.max_size:
+            self._emit_partial(chunks)
+        if not self._has_content and not text.strip():
+            return  # 分块开头的空行
+        self._pieces.append((text, size, self.page))
+        self._size += size
+        if text.strip():
+            self._has_content = True
+
+    def _split(self, text, limit):
+        """把过长的文字切成大小不超过 limit 的几段，尽量在空白处切开"""
+        parts = []
+        while self.measure(text) > limit:
+            end = max(1, int(len(text) * limit / self.measure(text)))
+            while end > 1 and self.measure(text[:end]) > limit:
+                end = max(1, end - max(1, end // 10))
+            space = max(text.rfind(' ', 0, end), text.rfind('\n', 0, end))
+            if space >= end // 2:
+                end = space + 1
+            parts.append(text[:end])
+            text = text[end:]
+        if text:
+            parts.append(text)
+        return parts
+
+    def _tail(self, text):
+        """text 末尾不超过 overlap 大小的部分，尽量从空白之后开始"""
+        if not self.overlap or not text:
+            return ''
+        start = max(0, len(text) - int(self.overlap * len(text) / max(self.measure(text), 1)))
+        while start < len(text) and self.measure(text[start:]) > self.overlap:
+            start += max(1, (len(text) - start) // 10)
+        space = min((index for index in (text.find(' ', start), text.find('\n', start)) if index >= 0),
+                    default=-1)
+        if 0 <= space < start + (len(text) - start) // 2:
+            start = space + 1
+        return text[start:]
+
+    def _emit_partial(self, chunks):
+        """当前分块已满：尽量在后半部分的空行处切开，切点之后的内容留给下一块"""
+        cut = len(self._pieces)
+        total = 0
+        for index, (text, size, _page) in enumerate(self._pieces):
+            total += size
+            if index >= self._new_from and not text.strip() and total >= self.max_size / 2:
+                cut = index + 1
+        emitted, rest = self._pieces[:cut], self._pieces[cut:]
+        self._emit(emitted, chunks)
+
+        tail = self._tail(''.join(text for text, _size, _page in emitted))
+        self._pieces = [(tail, self.measure(tail), emitted[-1][2])] if tail else []
+        self._new_from = len(self._pieces)
+        self._size = sum(size for _text, size, _page in self._pieces)
+        self._has_content = False
+        for piece in rest:
+            self._add(piece[0], piece[1], chunks)
+
+    def _flush(self, chunks):
+        """结束当前分块（标题或幻灯片处），不与下一节重叠"""
+        if self._has_content:
+            self._emit(self._pieces, chunks)
+        self._pieces = []
+        self._new_from = 0
+        self._size = 0
+        self._has_content = False
+
+    def _emit(self, pieces, chunks):
+        text = ''.join(text for text, _size, _page in pieces).lstrip('\r\n').rstrip()
+        first_page = next((page for text, _size, page in pieces[self._new_from:] if text.strip()), pieces[0][2])
+        chunks.append({
+            'heading_path': [title for _level, title in self._headings],
+            'page': first_page,
+            'page_end': pieces[-1][2],
+            'slide': self.slide,
+            'text': text,
+            'chars': len(text),
+            'tokens': round(estimate_tokens(text)),
+        })
+
+
+def iter_chunks(lines, max_size, overlap=0, unit='chars', page_breaks=False):
+    """逐个返回 lines（逐行的Markdown）切分出的分块字典"""
+    chunker = MarkdownChunker(max_size, overlap, unit, page_breaks)
+    for line in lines:
+        yield from chunker.feed(line)
+    yield from chunker.finish()
+
+
+def write_chunks(lines, output, source, max_size, overlap=0, unit='chars', page_breaks=False):
+    """把分块逐行写入已打开的文本文件 output（JSON Lines），返回分块数"""
+    count = 0
+    for index, chunk in enumerate(iter_chunks(lines, max_size, overlap, unit, page_breaks)):
+        record = {'id': f"{source}#{index}", 'source': source, 'chunk': index}
+        record.update(chunk)
+        output.write(json.dumps(record, ensure_ascii=False) + '\n')
+        count += 1
+    return count
+
+
+def write_markdown_chunks(markdown_path, chunks_path, source, options, page_breaks=False):
+    """读取Markdown文件，按 options 中的分块参数写出分块文件，返回分块数"""
+    temp_path = f"{chunks_path}.{os.getpid()}.tmp"
+    try:
+        with open(markdown_path, 'r', encoding='utf-8') as markdown, \
+                open(temp_path, 'w', encoding='utf-8') as output:
+            count = write_chunks(iter_lines(markdown), output, source, options['chunk_size'],
+                                 options['chunk_overlap'], options['chunk_unit'], page_breaks)
+        os.replace(temp_path, chunks_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return count
+
+
+def append_chunks_file(chunks_path, target):
+    """把单个文件的分块文件追加到已打开的二进制文件 target（合并整个语料的分块）"""
+    with open(chunks_path, 'rb') as source:
+        shutil.copyfileobj(source, target, COPY_BUFFER_SIZE)
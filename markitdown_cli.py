@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MarkItDown 命令行入口
+无需图形界面即可使用与GUI相同的转换流水线，适合在服务器上批量运行
+
+用法示例:
+    python markitdown_cli.py convert 文档目录 -o 输出目录 --jobs 8
+    python markitdown_cli.py watch 投递目录
+    python markitdown_cli.py serve --port 8765 --jobs 4
+    python markitdown_cli.py convert 文档目录 -o 输出目录 --chunks chunks.jsonl --chunk-size 512 --chunk-unit tokens
+    MarkItDown-GUI.exe convert book.epub
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import signal
+import threading
+
+import markitdown_core
+import markitdown_chunks
+import markitdown_sync
+import markitdown_watch
+import markitdown_server
+from markitdown_stats import ConversionStats, StatsLog, format_stage_seconds
+
+
+def build_parser():
+    """创建命令行参数解析器"""
+    parser = argparse.ArgumentParser(
+        prog="markitdown-gui",
+        description="将各种文件格式转换为Markdown（无界面模式）"
+    )
+    subparsers = parser.add_subparsers(dest="command", metavar="命令")
+    subparsers.required = True
+
+    convert_parser = subparsers.add_parser("convert", help="转换文件或目录")
+    convert_parser.add_argument("inputs", nargs="+", metavar="输入",
+                                help="要转换的文件或目录")
+    convert_parser.add_argument("-o", "--output-dir",
+                                help="输出目录（镜像输入目录结构），默认保存到源文件所在目录")
+    convert_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                                help="并行进程数（默认: CPU核心数）")
+    convert_parser.add_argument("--no-recursive", action="store_true",
+                                help="不递归处理子目录")
+    convert_parser.add_argument("--chunks", metavar="文件",
+                                help="把所有文件的分块合并写入此 JSON Lines 文件（不保留各文件的 .chunks.jsonl；"
+                                     f"未指定 --chunk-size 时为 {markitdown_chunks.DEFAULT_CHUNK_SIZE}）")
+    add_conversion_arguments(convert_parser)
+    add_stats_arguments(convert_parser)
+    convert_parser.set_defaults(func=cmd_convert)
+
+    sync_parser = subparsers.add_parser("sync", help="增量同步目录（只转换新增或修改过的文件）")
+    sync_parser.add_argument("source", metavar="源目录", help="要同步的源目录")
+    sync_parser.add_argument("output", metavar="输出目录", help="Markdown输出目录（镜像源目录结构）")
+    sync_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                             help="并行进程数（默认: CPU核心数）")
+    sync_parser.add_argument("--no-delete", action="store_true",
+                             help="不删除源文件已不存在的输出")
+    sync_parser.add_argument("--manifest",
+                             help=f"清单文件路径（默认: 输出目录/{markitdown_sync.MANIFEST_NAME}）")
+    add_conversion_arguments(sync_parser)
+    add_stats_arguments(sync_parser)
+    sync_parser.set_defaults(func=cmd_sync)
+
+    watch_parser = subparsers.add_parser("watch", help="监视目录，自动转换新增或修改的文件（Ctrl+C 停止）")
+    watch_parser.add_argument("source", metavar="监视目录", help="要监视的目录（包括子目录）")
+    watch_parser.add_argument("-o", "--output-dir",
+                              help="输出目录（镜像监视目录结构），默认保存到源文件所在目录")
+    watch_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                              help="并行进程数（默认: CPU核心数）")
+    watch_parser.add_argument("--debounce", type=float, default=markitdown_watch.DEFAULT_DEBOUNCE_SECONDS,
+                              help="文件大小和修改时间保持不变多少秒后才转换（默认: %(default)s）")
+    watch_parser.add_argument("--poll", action="store_true",
+                              help="定时扫描目录而不使用 inotify（例如网络共享目录）")
+    watch_parser.add_argument("--poll-interval", type=float, default=markitdown_watch.DEFAULT_POLL_INTERVAL,
+                              help="定时扫描的间隔秒数（默认: %(default)s）")
+    watch_parser.add_argument("--no-existing", action="store_true",
+                              help="启动时不转换目录中已有的文件")
+    add_conversion_arguments(watch_parser)
+    add_stats_arguments(watch_parser)
+    watch_parser.set_defaults(func=cmd_watch)
+
+    serve_parser = subparsers.add_parser("serve", help="启动本地HTTP转换服务（共用预热的转换进程池）")
+    serve_parser.add_argument("--host", default=markitdown_server.DEFAULT_HOST,
+                              help="监听地址（默认: %(default)s，只接受本机连接）")
+    serve_parser.add_argument("--port", type=int, default=markitdown_server.DEFAULT_PORT,
+                              help="监听端口（默认: %(default)s）")
+    serve_parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                              help="并行进程数（默认: CPU核心数）")
+    serve_parser.add_argument("--max-queue", type=int, default=0,
+                              help=f"排队和正在转换的任务上限，超出时返回 503（默认: 进程数 × "
+                                   f"{markitdown_server.DEFAULT_QUEUE_PER_WORKER}）")
+    serve_parser.add_argument("--max-upload-mb", type=int, default=markitdown_server.DEFAULT_MAX_UPLOAD_MB,
+                              help="单个上传文件的大小上限，超出时返回 413（默认: %(default)s）")
+    serve_parser.add_argument("--job-ttl", type=int, default=markitdown_server.DEFAULT_JOB_TTL,
+                              help="已结束的任务保留的秒数，之后删除其文件（默认: %(default)s）")
+    serve_parser.add_argument("--work-dir",
+                              help="保存上传文件和转换结果的目录（默认: 临时目录，退出时删除）")
+    serve_parser.add_argument("--quiet", action="store_true",
+                              help="不输出每个请求的日志")
+    add_conversion_arguments(serve_parser)
+    serve_parser.set_defaults(func=cmd_serve)
+
+    timing_parser = subparsers.add_parser("timing", help="报告启动耗时（各转换后端的导入耗时）")
+    timing_parser.add_argument("--json", action="store_true",
+                               help="以JSON格式输出，便于记录和比较")
+    timing_parser.set_defaults(func=cmd_timing)
+
+    return parser
+
+
+def add_conversion_arguments(parser):
+    """添加转换选项参数（各命令共用）"""
+    parser.add_argument("--image-mode", choices=markitdown_core.IMAGE_MODES,
+                        default=markitdown_core.DEFAULT_OPTIONS['image_mode'],
+                        help="提取图片的引用方式（默认: relative）")
+    parser.add_argument("--base64-max-kb", type=int,
+                        default=markitdown_core.DEFAULT_OPTIONS['base64_max_kb'],
+                        help="Base64模式下超过此大小（KB）的图片改用相对路径（默认: 0，不限制）")
+    parser.add_argument("--base64-references", action="store_true",
+                        help="Base64模式下以引用式定义输出图片，每张图片的数据只出现一次")
+    parser.add_argument("--image-max-size", type=int,
+                        default=markitdown_core.DEFAULT_OPTIONS['image_max_dimension'],
+                        help="图片最长边超过此像素数时缩小（默认: 0，不缩小；需要Pillow）")
+    parser.add_argument("--image-format", choices=markitdown_core.IMAGE_FORMATS,
+                        default=markitdown_core.DEFAULT_OPTIONS['image_format'],
+                        help="图片重新编码的格式（默认: original，保持原格式）")
+    parser.add_argument("--image-quality", type=int,
+                        default=markitdown_core.DEFAULT_OPTIONS['image_quality'],
+                        help="WebP/JPEG 编码质量 1-100（默认: %(default)s）")
+    parser.add_argument("--no-extract-images", action="store_true",
+                        help="不从EPUB、Office文档和ZIP中提取图片")
+    parser.add_argument("--keep-data-uris", action="store_true",
+                        help="保留数据URI（如base64编码的图片）")
+    parser.add_argument("--use-plugins", action="store_true",
+                        help="启用第三方插件")
+    parser.add_argument("--timeout", type=float,
+                        default=markitdown_core.DEFAULT_OPTIONS['timeout_seconds'],
+                        help="单个文件的转换超时秒数，超时的文件记为失败并跳过（默认: 0，不限制）")
+    parser.add_argument("--memory-limit", type=int, metavar="MB",
+                        default=markitdown_core.DEFAULT_OPTIONS['memory_limit_mb'],
+                        help="每个转换进程的内存（地址空间）上限，超出的文件记为失败并跳过"
+                             "（默认: 0，不限制；仅 Linux/macOS）")
+    parser.add_argument("--stream-threshold", type=int, metavar="MB",
+                        default=markitdown_core.DEFAULT_OPTIONS['stream_threshold_mb'],
+                        help="不小于此大小的文本、CSV、JSON、XML 文件流式转换，内存占用固定"
+                             "（默认: %(default)s，0 表示不使用）")
+    parser.add_argument("--chunk-size", type=int,
+                        default=markitdown_core.DEFAULT_OPTIONS['chunk_size'],
+                        help="按标题和大小切分转换结果，在Markdown旁写出 .chunks.jsonl（每行一个分块，"
+                             "含来源、标题路径、页码、幻灯片编号）；每块不超过此大小（默认: 0，不分块）")
+    parser.add_argument("--chunk-overlap", type=int,
+                        default=markitdown_core.DEFAULT_OPTIONS['chunk_overlap'],
+                        help="同一节中相邻分块重叠的大小（默认: %(default)s）")
+    parser.add_argument("--chunk-unit", choices=markitdown_core.CHUNK_UNITS,
+                        default=markitdown_core.DEFAULT_OPTIONS['chunk_unit'],
+                        help="分块大小的单位：字符数或估计的词元数（默认: chars）")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="不使用转换缓存")
+    parser.add_argument("--cache-dir",
+                        help="转换缓存目录（默认: 用户缓存目录）")
+    parser.add_argument("--cache-size", type=int,
+                        default=markitdown_core.DEFAULT_OPTIONS['cache_max_mb'],
+                        help="转换缓存容量上限，单位MB（默认: %(default)s）")
+
+
+def add_stats_arguments(parser):
+    """添加转换统计参数（各批量命令共用）"""
+    parser.add_argument("--stats", metavar="文件",
+                        help="把每个文件各阶段的耗时和内存追加到 JSON Lines 文件，结束时按格式汇总")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="统计中记录各阶段的Python内存分配峰值（tracemalloc，转换会变慢）")
+
+
+def make_stats_recorder(args):
+    """创建统计记录，返回 (StatsLog, 记录函数)；记录函数在每个文件结束时调用"""
+    stats_log = StatsLog(jsonl_path=args.stats)
+
+    def record(input_path, info, error):
+        if error is None:
+            stats_log.add(ConversionStats.from_dict(info['stats']))
+        else:
+            stats_log.add(ConversionStats(input_path).fail(error))
+
+    return stats_log, record
+
+
+def print_stats_summary(stats_log):
+    """按文件格式输出各阶段耗时汇总（总耗时高的格式在前）"""
+    print("按格式汇总（各阶段总耗时）:")
+    for item in stats_log.summary_by_format():
+        peak = f"，峰值内存 {item['peak_rss_mb']:.0f} MB" if item['peak_rss_mb'] is not None else ""
+        failed = f"，失败 {item['failed']}" if item['failed'] else ""
+        print(f"  {item['format']:<8} {item['count']} 个文件{failed}，共 {item['total_seconds']:.2f}s"
+              f"（{format_stage_seconds(item['stage_seconds'])}）{peak}")
+
+
+def options_from_args(args):
+    """从命令行参数生成转换选项"""
+    return markitdown_core.make_options(
+        extract_images=not args.no_extract_images,
+        image_mode=args.image_mode,
+        base64_max_kb=max(0, args.base64_max_kb),
+        base64_references=args.base64_references,
+        image_max_dimension=max(0, args.image_max_size),
+        image_format=args.image_format,
+        image_quality=min(100, max(1, args.image_quality)),
+        keep_data_uris=args.keep_data_uris,
+        use_plugins=args.use_plugins,
+        use_cache=not args.no_cache,
+        cache_dir=args.cache_dir,
+        cache_max_mb=args.cache_size,
+        timeout_seconds=max(0, args.timeout),
+        memory_limit_mb=max(0, args.memory_limit),
+        stream_threshold_mb=max(0, args.stream_threshold),
+        chunk_size=max(0, args.chunk_size),
+        chunk_overlap=max(0, min(args.chunk_overlap, args.chunk_size - 1)),
+        chunk_unit=args.chunk_unit,
+    )
+
+
+def cmd_convert(args):
+    """convert 命令：批量转换文件或目录"""
+    for path in args.inputs:
+        if not os.path.exists(path):
+            print(f"错误: 输入不存在: {path}", file=sys.stderr)
+            return 2
+
+    output_dir = os.path.abspath(args.output_dir) if args.output_dir else None
+    jobs = markitdown_core.plan_batch_jobs(args.inputs, output_dir, recursive=not args.no_recursive)
+    if not jobs:
+        print("没有找到可转换的文件")
+        return 0
+
+    if args.chunks and not args.chunk_size:
+        args.chunk_size = markitdown_chunks.DEFAULT_CHUNK_SIZE
+    options = options_from_args(args)
+    total = len(jobs)
+    finished = 0
+    total_bytes = 0
+    cache_hits = 0
+    image_bytes_saved = 0
+    total_chunks = 0
+    start_time = time.perf_counter()
+    stats_log, record_stats = make_stats_recorder(args)
+    # 各文件的分块在转换进程中写出，完成后按完成顺序追加到合并的分块文件
+    chunks_file = open(args.chunks, 'wb') if args.chunks else None
+
+    def on_result(input_path, info, error):
+        nonlocal finished, total_bytes, cache_hits, image_bytes_saved, total_chunks
+        finished += 1
+        record_stats(input_path, info, error)
+        if error is None:
+            total_bytes += info['input_bytes']
+            cache_hits += info['cache_hit']
+            image_bytes_saved += info['image_bytes_saved']
+            total_chunks += info['chunks']
+            if chunks_file and info['chunks_path']:
+                markitdown_chunks.append_chunks_file(info['chunks_path'], chunks_file)
+                os.remove(info['chunks_path'])
+            cached = "，缓存" if info['cache_hit'] else ""
+            chunks = f"，{info['chunks']} 个分块" if info['chunks_path'] else ""
+            print(f"[{finished}/{total}] ✓ {input_path} -> {info['output_path']} "
+                  f"({info['elapsed']:.1f}s, {info['output_chars']:,} 字符{cached}{chunks})")
+        else:
+            print(f"[{finished}/{total}] ✗ {input_path}: {error}", file=sys.stderr)
+
+    print(f"开始转换 {total} 个文件，并行进程数: {args.jobs}")
+    try:
+        succeeded, failed = markitdown_core.run_batch(jobs, options, max(1, args.jobs), on_result,
+                                                      trace_memory=args.trace_memory)
+    finally:
+        if chunks_file:
+            chunks_file.close()
+
+    elapsed = max(time.perf_counter() - start_time, 1e-6)
+    print(f"完成: 成功 {succeeded}，失败 {failed}，用时 {elapsed:.1f}s，"
+          f"{succeeded / elapsed:.2f} 文件/秒，{total_bytes / elapsed / (1024 * 1024):.2f} MB/秒")
+    if options['use_cache']:
+        print(f"缓存 命中 {cache_hits} / 未命中 {succeeded - cache_hits}")
+    if image_bytes_saved:
+        print(f"图片压缩节省 {markitdown_core.format_bytes(image_bytes_saved)}")
+    if args.chunks:
+        print(f"{total_chunks} 个分块已写入: {args.chunks}")
+    if args.stats:
+        print_stats_summary(stats_log)
+        print(f"统计已写入: {args.stats}")
+
+    return 1 if failed else 0
+
+
+def cmd_sync(args):
+    """sync 命令：增量同步目录"""
+    if not os.path.isdir(args.source):
+        print(f"错误: 源目录不存在: {args.source}", file=sys.stderr)
+        return 2
+
+    options = options_from_args(args)
+    start_time = time.perf_counter()
+    stats_log, record_stats = make_stats_recorder(args)
+
+    def on_result(input_path, info, error):
+        record_stats(input_path, info, error)
+        if error is None:
+            print(f"✓ {input_path} -> {info['output_path']} ({info['elapsed']:.1f}s)")
+        else:
+            print(f"✗ {input_path}: {error}", file=sys.stderr)
+
+    summary = markitdown_sync.sync_directory(
+        args.source, args.output, options,
+        max_workers=max(1, args.jobs),
+        on_result=on_result,
+        delete_orphans=not args.no_delete,
+        manifest_path=args.manifest,
+        trace_memory=args.trace_memory,
+    )
+
+    elapsed = time.perf_counter() - start_time
+    print(f"同步完成: 转换 {summary['converted']}，未变化 {summary['unchanged']}，"
+          f"失败 {summary['failed']}，删除 {summary['deleted']}，用时 {elapsed:.1f}s")
+    if args.stats and stats_log.records():
+        print_stats_summary(stats_log)
+        print(f"统计已写入: {args.stats}")
+
+    return 1 if summary['failed'] else 0
+
+
+def cmd_watch(args):
+    """watch 命令：监视目录并自动转换，Ctrl+C 停止"""
+    if not os.path.isdir(args.source):
+        print(f"错误: 监视目录不存在: {args.source}", file=sys.stderr)
+        return 2
+
+    options = options_from_args(args)
+    stats_log, record_stats = make_stats_recorder(args)
+    stop_event = threading.Event()
+    signal.signal(signal.SIGINT, lambda _signum, _frame: stop_event.set())
+
+    def on_batch(count, waiting):
+        waiting_text = f"，另有 {waiting} 个文件等待" if waiting else ""
+        print(f"开始转换 {count} 个文件{waiting_text}")
+
+    def on_result(input_path, info, error):
+        record_stats(input_path, info, error)
+        if error is None:
+            print(f"✓ {input_path} -> {info['output_path']} ({info['elapsed']:.1f}s)")
+        else:
+            print(f"✗ {input_path}: {error}", file=sys.stderr)
+
+    print(f"正在监视: {os.path.abspath(args.source)}（Ctrl+C 停止）")
+    summary = markitdown_watch.watch_directory(
+        args.source, options,
+        output_dir=args.output_dir,
+        max_workers=max(1, args.jobs),
+        on_result=on_result,
+        on_batch=on_batch,
+        stop_event=stop_event,
+        debounce=max(0.0, args.debounce),
+        use_inotify=not args.poll,
+        poll_interval=max(0.1, args.poll_interval),
+        convert_existing=not args.no_existing,
+        trace_memory=args.trace_memory,
+    )
+
+    print(f"已停止监视: 转换 {summary['converted']}，失败 {summary['failed']}，共 {summary['batches']} 批")
+    if args.stats and stats_log.records():
+        print_stats_summary(stats_log)
+        print(f"统计已写入: {args.stats}")
+
+    return 1 if summary['failed'] else 0
+
+
+def cmd_serve(args):
+    """serve 命令：启动本地HTTP转换服务，Ctrl+C 停止"""
+    options = options_from_args(args)
+    service = markitdown_server.ConversionService(
+        options,
+        max_workers=max(1, args.jobs),
+        max_queue=max(0, args.max_queue),
+        max_upload_bytes=max(1, args.max_upload_mb) * 1024 * 1024,
+        job_ttl=max(0, args.job_ttl),
+        work_dir=args.work_dir,
+    )
+    try:
+        server = markitdown_server.create_server(service, args.host, args.port, quiet=args.quiet)
+    except OSError as e:
+        service.close()
+        print(f"错误: 无法监听 {args.host}:{args.port}: {e}", file=sys.stderr)
+        return 2
+
+    print(f"转换服务已启动: http://{args.host}:{server.server_port}/"
+          f"（{service.executor.max_workers} 个转换进程，最多排队 {service.max_queue} 个任务，Ctrl+C 停止）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    print("转换服务已停止")
+    return 0
+
+
+def cmd_timing(args):
+    """timing 命令：报告各转换后端的导入耗时"""
+    timings = markitdown_core.measure_startup_timings()
+    total = sum(seconds for _name, seconds, _note in timings if seconds is not None)
+
+    if args.json:
+        report = {
+            'python': sys.version.split()[0],
+            'frozen': bool(getattr(sys, 'frozen', False)),
+            'total_seconds': round(total, 4),
+            'items': [{'name': name, 'seconds': None if seconds is None else round(seconds, 4), 'note': note}
+                      for name, seconds, note in timings],
+        }
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+
+    print("启动耗时报告（按顺序导入，每项为新增耗时）")
+    for name, seconds, note in timings:
+        duration = f"{'-':>10}" if seconds is None else f"{seconds * 1000:8.1f}ms"
+        print(f"  {duration}  {name}{'  ' + note if note else ''}")
+    print(f"  {total * 1000:8.1f}ms  合计")
+    return 0
+
+
+def main(argv=None):
+    """命令行主函数，返回进程退出码"""
+    markitdown_core.setup_magika_paths()
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
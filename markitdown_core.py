@@ -0,0 +1,1440 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MarkItDown 转换核心
+不依赖Tk的转换流水线（转换、EPUB图片提取、图片引用处理、保存），
+供图形界面、命令行和批量转换共用
+"""
+
+import os
+import sys
+import re
+import time
+import base64
+import zlib
+import zipfile
+import shutil
+import filecmp
+import tempfile
+import posixpath
+import contextlib
+import importlib
+import threading
+import tracemalloc
+from pathlib import Path
+from urllib.parse import quote, unquote
+from xml.etree import ElementTree
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from markitdown_chunks import CHUNK_UNITS, check_chunk_options, chunks_path_for, write_markdown_chunks
+from markitdown_cache import DEFAULT_CACHE_MAX_MB, get_conversion_cache, get_type_cache
+from markitdown_detect import convert_local
+from markitdown_images import IMAGE_FORMATS, OPTIMIZE_WORKERS, ImageOptimizer
+from markitdown_stats import ConversionStats
+from markitdown_stream import can_stream, stream_convert
+from markitdown_worker import WorkerPool, memory_limit
+
+
+# 支持转换的文件扩展名（与浏览对话框中的"所有支持的文件"保持一致）
+SUPPORTED_EXTENSIONS = (
+    '.pdf', '.docx', '.pptx', '.xlsx', '.xls', '.html', '.htm', '.txt', '.csv',
+    '.json', '.xml', '.zip', '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.mp3',
+    '.wav', '.m4a', '.epub',
+)
+
+# 可从EPUB中提取的图片扩展名
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.svg', '.webp'}
+
+# 可提取图片的容器格式（都是ZIP文件）
+CONTAINER_EXTENSIONS = ('.epub', '.docx', '.pptx', '.xlsx', '.zip')
+
+# Office文档中图片所在的目录（目录外的图片如文档缩略图不提取）
+OOXML_MEDIA_DIRS = {'.docx': 'word/media/', '.pptx': 'ppt/media/', '.xlsx': 'xl/media/'}
+
+# Office文档关系的XML命名空间
+OOXML_REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+# ZIP中嵌套容器的最大层数；嵌套的ZIP不超过此大小时在内存中打开，否则写入临时文件
+MAX_CONTAINER_DEPTH = 3
+NESTED_SPOOL_SIZE = 64 * 1024 * 1024
+
+# 图片扩展名对应的MIME类型（Base64编码时使用）
+IMAGE_MIME_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.bmp': 'image/bmp',
+    '.webp': 'image/webp',
+    '.svg': 'image/svg+xml'
+}
+
+# 提取图片时每次复制的字节数和并行线程数
+EXTRACT_CHUNK_SIZE = 256 * 1024
+EXTRACT_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+# 保存文件时的缓冲区大小
+SAVE_BUFFER_SIZE = 1024 * 1024
+
+# Linux 的 FICLONE ioctl（btrfs、XFS 等支持写时复制的文件系统上克隆文件）
+FICLONE = 0x40049409
+
+# 超过该字符数的结果只预览开头和结尾，完整内容只保存在结果文件中
+RESULT_PREVIEW_THRESHOLD = 2 * 1024 * 1024
+RESULT_PREVIEW_HEAD_CHARS = 512 * 1024
+RESULT_PREVIEW_TAIL_CHARS = 64 * 1024
+
+# 图片引用方式
+IMAGE_MODES = ('relative', 'absolute', 'base64')
+
+# 默认转换选项
+DEFAULT_OPTIONS = {
+    'extract_images': True,     # 从EPUB提取图片
+    'image_mode': 'relative',   # 图片引用方式，见 IMAGE_MODES
+    'base64_max_kb': 0,         # Base64模式下超过此大小（KB）的图片改用相对路径，0 表示不限制
+    'base64_references': False, # Base64模式下以引用式定义输出，每张图片的数据只出现一次
+    'image_max_dimension': 0,   # 图片最长边超过此像素数时缩小，0 表示不缩小
+    'image_format': 'original', # 图片重新编码的格式，见 IMAGE_FORMATS
+    'image_quality': 85,        # WebP/JPEG 编码质量（1-100）
+    'keep_data_uris': False,    # 保留数据URI（如base64编码的图片）
+    'use_plugins': False,       # 启用第三方插件
+    'use_cache': True,          # 相同内容和选项的文件直接读取缓存的转换结果
+    'cache_dir': None,          # 缓存目录，None 表示默认位置
+    'cache_max_mb': DEFAULT_CACHE_MAX_MB,  # 缓存容量上限（MB）
+    'timeout_seconds': 0,       # 单个文件的转换超时（秒），超时时终止转换进程，0 表示不限制
+    'memory_limit_mb': 0,       # 转换进程的内存（地址空间）上限（MB），超出时该文件失败，0 表示不限制
+    'stream_threshold_mb': 32,  # 不小于此大小（MB）的文本、CSV、JSON、XML 文件流式转换，0 表示不使用
+    'chunk_size': 0,            # 大于0时另外输出分块文件（JSON Lines），每块不超过此大小，见 markitdown_chunks
+    'chunk_overlap': 0,         # 相邻分块重叠的大小
+    'chunk_unit': 'chars',      # 分块大小的单位，见 CHUNK_UNITS
+}
+
+
+# 启动耗时报告中统计的转换后端模块: (显示名称, 模块名)
+# 按顺序导入，每项只统计在前面各项之后新增的导入耗时
+BACKEND_MODULES = (
+    ('markitdown', 'markitdown'),
+    ('magika (文件类型检测)', 'magika'),
+    ('onnxruntime', 'onnxruntime'),
+    ('PDF (pdfminer)', 'pdfminer.high_level'),
+    ('Word (mammoth)', 'mammoth'),
+    ('Excel (openpyxl)', 'openpyxl'),
+    ('Excel (xlrd)', 'xlrd'),
+    ('pandas', 'pandas'),
+    ('PowerPoint (python-pptx)', 'pptx'),
+    ('HTML (BeautifulSoup)', 'bs4'),
+    ('markdownify', 'markdownify'),
+    ('音频 (pydub)', 'pydub'),
+    ('语音识别 (speech_recognition)', 'speech_recognition'),
+    ('Outlook (olefile)', 'olefile'),
+)
+
+
+def make_options(**overrides):
+    """基于默认值生成转换选项字典"""
+    unknown = set(overrides) - set(DEFAULT_OPTIONS)
+    if unknown:
+        raise ValueError(f"未知的转换选项: {', '.join(sorted(unknown))}")
+
+    options = dict(DEFAULT_OPTIONS)
+    options.update(overrides)
+
+    if options['image_mode'] not in IMAGE_MODES:
+        raise ValueError(f"不支持的图片引用方式: {options['image_mode']}")
+    if options['image_format'] not in IMAGE_FORMATS:
+        raise ValueError(f"不支持的图片格式: {options['image_format']}")
+    check_chunk_options(options['chunk_size'], options['chunk_overlap'], options['chunk_unit'])
+    return options
+
+
+# 设置magika模型路径（用于打包后的exe文件）
+def setup_magika_paths():
+    """设置magika的路径和环境变量"""
+    if getattr(sys, 'frozen', False):
+        # 运行在PyInstaller打包的exe中
+        application_path = sys._MEIPASS
+
+        # 检查magika文件是否存在
+        magika_config_path = os.path.join(application_path, 'magika', 'config')
+        magika_models_path = os.path.join(application_path, 'magika', 'models')
+
+        if os.path.exists(magika_config_path) and os.path.exists(magika_models_path):
+            # 设置magika环境变量，让其找到配置文件
+            os.environ['MAGIKA_CONFIG_PATH'] = magika_config_path
+            os.environ['MAGIKA_MODELS_PATH'] = magika_models_path
+            return True
+    return False
+
+
+def get_magika_model_path():
+    """获取magika模型路径"""
+    if getattr(sys, 'frozen', False):
+        # 运行在PyInstaller打包的exe中
+        application_path = sys._MEIPASS
+        magika_models_path = os.path.join(application_path, 'magika', 'models', 'standard_v3_3')
+        if os.path.exists(magika_models_path):
+            return Path(magika_models_path)
+    return None
+
+
+def create_markitdown_instance(enable_plugins=False):
+    """创建MarkItDown实例，处理打包后的magika模型路径"""
+    from markitdown import MarkItDown
+
+    try:
+        # 在打包环境中，尝试特殊处理
+        if getattr(sys, 'frozen', False):
+            try:
+                markitdown_instance = MarkItDown(enable_plugins=enable_plugins)
+
+                # 使用打包进exe的magika模型
+                custom_magika_path = get_magika_model_path()
+                if custom_magika_path:
+                    try:
+                        from magika import Magika
+                        markitdown_instance._magika = Magika(model_dir=custom_magika_path)
+                    except Exception as e:
+                        print(f"加载自定义magika模型失败: {e}")
+
+                # magika出现问题时由 markitdown_detect 在转换时改为按扩展名确定类型，不在启动时试运行
+                return markitdown_instance
+            except Exception as e:
+                print(f"创建MarkItDown实例时出错: {e}")
+                # 最后的降级方案
+                return create_minimal_markitdown()
+        else:
+            # 非打包环境，使用默认设置
+            return MarkItDown(enable_plugins=enable_plugins)
+
+    except Exception as e:
+        print(f"创建MarkItDown实例时出错: {e}")
+        # 降级到最小实例
+        return create_minimal_markitdown()
+
+
+def create_minimal_markitdown():
+    """创建最小化的MarkItDown实例"""
+    try:
+        # 导入MarkItDown内部类
+        from markitdown._markitdown import MarkItDown as _MarkItDown
+
+        # 创建一个不使用magika的实例
+        instance = _MarkItDown()
+        instance._magika = None  # 禁用magika
+
+        return instance
+    except:
+        # 如果这也失败了，返回一个虚拟实例
+        return None
+
+
+# 已创建的MarkItDown实例，按 (启用插件, 自定义magika模型路径) 区分
+# keep_data_uris 是每次转换时传入的参数，不需要单独的实例
+_instance_pool = {}
+_instance_pool_lock = threading.Lock()
+
+
+def get_markitdown_instance(enable_plugins=False):
+    """从实例池获取MarkItDown实例，不存在时创建（加载magika模型较慢，只做一次）"""
+    magika_path = get_magika_model_path()
+    pool_key = (bool(enable_plugins), str(magika_path) if magika_path else None)
+
+    with _instance_pool_lock:
+        instance = _instance_pool.get(pool_key)
+        if instance is None:
+            instance = create_markitdown_instance(enable_plugins)
+            # 创建失败时不缓存，下次重试
+            if instance is not None:
+                _instance_pool[pool_key] = instance
+        return instance
+
+
+def measure_startup_timings():
+    """统计各转换后端的导入耗时和MarkItDown实例创建耗时
+
+    需在尚未导入markitdown的进程中调用，返回 [(名称, 耗时秒数或None, 说明), ...]。
+    """
+    timings = []
+
+    for name, module_name in BACKEND_MODULES:
+        already_loaded = module_name in sys.modules
+        start_time = time.perf_counter()
+        try:
+            importlib.import_module(module_name)
+        except ImportError as e:
+            timings.append((name, None, f"未安装: {e}"))
+            continue
+        except Exception as e:
+            timings.append((name, None, f"导入失败: {e}"))
+            continue
+        note = "已由前面的模块导入" if already_loaded else ""
+        timings.append((name, time.perf_counter() - start_time, note))
+
+    start_time = time.perf_counter()
+    instance = create_markitdown_instance()
+    note = "" if instance is not None else "创建失败"
+    timings.append(("创建MarkItDown实例", time.perf_counter() - start_time, note))
+
+    return timings
+
+
+def content_image_filename(zip_info):
+    """根据原文件名和内容CRC生成图片文件名，同一内容每次都得到同一个名字"""
+    base_name, ext = os.path.splitext(os.path.basename(zip_info.filename))
+    return f"{base_name}-{zip_info.CRC:08x}{ext}"
+
+
+def _extract_zip_entry(zip_file, zip_info, output_path):
+    """以固定大小的块把ZIP条目写入目标文件，内存占用与图片大小无关
+
+    先写入同目录的临时文件再替换，多个进程同时写同一张图片时不会读到半个文件。
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(output_path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as target:
+            with zip_file.open(zip_info) as source:
+                shutil.copyfileobj(source, target, EXTRACT_CHUNK_SIZE)
+        os.replace(temp_path, output_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _matches_zip_entry(path, zip_info):
+    """已存在的文件是否与ZIP条目内容相同（比较大小和分块计算的CRC32），文件不存在时返回False"""
+    try:
+        if os.path.getsize(path) != zip_info.file_size:
+            return False
+        crc = 0
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(EXTRACT_CHUNK_SIZE), b''):
+                crc = zlib.crc32(block, crc)
+        return crc == zip_info.CRC
+    except OSError:
+        return False
+
+
+def _reuse_or_extract_zip_entry(zip_file, zip_info, output_path):
+    """目标文件已是同一图片时直接复用，否则写出"""
+    if not _matches_zip_entry(output_path, zip_info):
+        _extract_zip_entry(zip_file, zip_info, output_path)
+
+
+def _open_nested_zip(zip_file, zip_info, stack):
+    """打开ZIP中嵌套的ZIP文件（复制到可随机访问的临时文件），失败时返回None"""
+    spool = stack.enter_context(tempfile.SpooledTemporaryFile(max_size=NESTED_SPOOL_SIZE))
+    try:
+        with zip_file.open(zip_info) as source:
+            shutil.copyfileobj(source, spool, EXTRACT_CHUNK_SIZE)
+        spool.seek(0)
+        return stack.enter_context(zipfile.ZipFile(spool))
+    except (zipfile.BadZipFile, OSError) as e:
+        print(f"打开嵌套的压缩文件失败 {zip_info.filename}: {e}")
+        return None
+
+
+def _plan_zip_images(zip_file, images_dir, kind='.epub', stack=None, prefix='', depth=0, assigned=None):
+    """为容器中的图片确定文件名（不写文件），返回图片信息列表
+
+    文件名由原文件名和内容CRC组成（见 content_image_filename），不需要查询文件系统
+    就能保证唯一，内容相同的图片共用一个文件，重复转换时名字保持不变。
+    Office文档只取媒体目录中的图片；ZIP中嵌套的容器（传入 stack 时）递归处理。
+    """
+    images = []
+    assigned = {} if assigned is None else assigned  # 文件名 -> (CRC, 大小)
+    media_dir = OOXML_MEDIA_DIRS.get(kind)
+
+    for zip_info in zip_file.infolist():
+        image_file = zip_info.filename
+        if zip_info.is_dir():
+            continue
+        ext = os.path.splitext(image_file.lower())[1]
+
+        if kind == '.zip' and ext in CONTAINER_EXTENSIONS and stack is not None \
+                and depth < MAX_CONTAINER_DEPTH:
+            nested = _open_nested_zip(zip_file, zip_info, stack)
+            if nested is not None:
+                images.extend(_plan_zip_images(nested, images_dir, ext, stack,
+                                               f"{prefix}{image_file}/", depth + 1, assigned))
+            continue
+
+        if ext not in IMAGE_EXTENSIONS or (media_dir and not image_file.startswith(media_dir)):
+            continue
+
+        # 获取文件名
+        filename = os.path.basename(image_file)
+        if not filename:  # 跳过目录
+            continue
+
+        # 只有原文件名和CRC都相同而内容不同时才需要加序号
+        identity = (zip_info.CRC, zip_info.file_size)
+        final_filename = content_image_filename(zip_info)
+        base_name, ext = os.path.splitext(final_filename)
+        counter = 1
+        while assigned.get(final_filename, identity) != identity:
+            final_filename = f"{base_name}_{counter}{ext}"
+            counter += 1
+        assigned[final_filename] = identity
+
+        images.append({
+            'original_path': prefix + image_file,
+            'extracted_path': os.path.join(images_dir, final_filename),
+            'filename': final_filename,
+            'relative_path': f"images/{final_filename}",
+            'zip_file': zip_file,
+            'zip_info': zip_info,
+        })
+
+    return images
+
+
+def _read_relationships(zip_file, part_path):
+    """读取Office文档部件的关系文件，返回 {关系ID: 目标部件路径}"""
+    part_dir, part_name = posixpath.split(part_path)
+    rels_path = posixpath.join(part_dir, '_rels', f"{part_name}.rels")
+    try:
+        root = ElementTree.fromstring(zip_file.read(rels_path))
+    except (KeyError, ElementTree.ParseError):
+        return {}
+
+    relationships = {}
+    for rel in root:
+        target = rel.get('Target')
+        if not target or rel.get('TargetMode') == 'External':
+            continue
+        if target.startswith('/'):
+            target = target.lstrip('/')
+        else:
+            target = posixpath.normpath(posixpath.join(part_dir, target))
+        relationships[rel.get('Id')] = target
+    return relationships
+
+
+def _part_image_targets(zip_file, part_path):
+    """按出现顺序列出Office文档部件中引用的图片部件路径（流式解析XML）"""
+    relationships = _read_relationships(zip_file, part_path)
+    if not relationships:
+        return []
+
+    targets = []
+    try:
+        with zip_file.open(part_path) as part:
+            for _event, element in ElementTree.iterparse(part, events=('start',)):
+                tag = element.tag.rsplit('}', 1)[-1]
+                if tag == 'blip':
+                    rel_id = element.get(f"{{{OOXML_REL_NS}}}embed")
+                elif tag == 'imagedata':
+                    rel_id = element.get(f"{{{OOXML_REL_NS}}}id")
+                else:
+                    continue
+                if rel_id in relationships:
+                    targets.append(relationships[rel_id])
+    except (KeyError, ElementTree.ParseError) as e:
+        print(f"读取文档图片顺序失败 {part_path}: {e}")
+    return targets
+
+
+def _ooxml_image_order(zip_file, kind):
+    """Word/PowerPoint文档中图片在正文中出现的顺序（ZIP内路径列表，可重复）
+
+    MarkItDown 输出的这些图片引用是数据URI或形状名称，无法按路径匹配，只能按顺序对应。
+    """
+    if kind == '.docx':
+        return _part_image_targets(zip_file, 'word/document.xml')
+
+    if kind == '.pptx':
+        slide_paths = _read_relationships(zip_file, 'ppt/presentation.xml')
+        try:
+            root = ElementTree.fromstring(zip_file.read('ppt/presentation.xml'))
+        except (KeyError, ElementTree.ParseError):
+            return []
+        targets = []
+        for element in root.iter():
+            if element.tag.rsplit('}', 1)[-1] == 'sldId':
+                slide_path = slide_paths.get(element.get(f"{{{OOXML_REL_NS}}}id"))
+                if slide_path:
+                    targets.extend(_part_image_targets(zip_file, slide_path))
+        return targets
+
+    return []
+
+
+def _xlsx_sheet_images(zip_file):
+    """XLSX中图片所在的工作表，返回 {图片部件路径: 工作表名称}（经由工作表引用的绘图部件查找）"""
+    sheet_paths = _read_relationships(zip_file, 'xl/workbook.xml')
+    try:
+        root = ElementTree.fromstring(zip_file.read('xl/workbook.xml'))
+    except (KeyError, ElementTree.ParseError):
+        return {}
+
+    sheets = {}
+    for element in root.iter():
+        if element.tag.rsplit('}', 1)[-1] != 'sheet':
+            continue
+        sheet_path = sheet_paths.get(element.get(f"{{{OOXML_REL_NS}}}id"))
+        if not sheet_path:
+            continue
+        for drawing_path in _read_relationships(zip_file, sheet_path).values():
+            if posixpath.basename(posixpath.dirname(drawing_path)) == 'drawings' and drawing_path.endswith('.xml'):
+                for image_path in _part_image_targets(zip_file, drawing_path):
+                    sheets.setdefault(image_path, element.get('name'))
+    return sheets
+
+
+def _plan_container_images(zip_file, images_dir, kind, stack):
+    """列出容器中的图片，返回 (图片信息列表, 按正文顺序排列的图片列表或None)
+
+    MarkItDown 对XLSX和ZIP的输出中没有图片引用，这两种容器的图片记录所属的一节
+    （section：工作表名称，或 "File: 压缩包成员"，与MarkItDown输出的二级标题相同），
+    替换图片引用时在该节末尾加上图片链接（见 ImageRefRewriter）。
+    """
+    images = _plan_zip_images(zip_file, images_dir, kind, stack)
+
+    image_order = None
+    if kind in ('.docx', '.pptx'):
+        by_path = {image['original_path']: image for image in images}
+        image_order = [by_path[path] for path in _ooxml_image_order(zip_file, kind) if path in by_path]
+    elif kind == '.xlsx':
+        sheets = _xlsx_sheet_images(zip_file)
+        for image in images:
+            image['section'] = sheets.get(image['original_path'])
+    elif kind == '.zip':
+        members = {info.filename for info in zip_file.infolist()}
+        for image in images:
+            # 嵌套容器中的图片属于该容器所在的成员
+            member = image['original_path']
+            while member not in members and '/' in member:
+                member = member.rsplit('/', 1)[0]
+            image['section'] = f"File: {member}"
+    return images, image_order
+
+
+def _public_image_info(image):
+    """去掉只在容器打开期间有效的字段"""
+    return {key: value for key, value in image.items() if key not in ('zip_file', 'zip_info')}
+
+
+def _write_zip_images(images):
+    """把图片写入各自的 extracted_path，返回写入失败的文件名集合
+
+    同一文件只写一次；已存在且大小和CRC都与条目相同的文件直接复用（文件名中的CRC只说明
+    条目的内容，同名文件可能被修改过而大小不变，因此重新计算已有文件的CRC）。
+    比较和写出都在线程池中并行进行（ZipFile支持多线程分别读取不同条目，解压时释放GIL）。
+    """
+    to_extract = {}
+    for image_info in images:
+        to_extract.setdefault(image_info['extracted_path'], image_info)
+
+    failed = set()
+    if to_extract:
+        workers = min(EXTRACT_WORKERS, len(to_extract))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(_reuse_or_extract_zip_entry, image_info['zip_file'], image_info['zip_info'],
+                                output_path): image_info
+                for output_path, image_info in to_extract.items()
+            }
+            for future in as_completed(futures):
+                image_info = futures[future]
+                error = future.exception()
+                if isinstance(error, MemoryError):
+                    raise error
+                if error is not None:
+                    print(f"提取图片失败 {image_info['original_path']}: {error}")
+                    failed.add(image_info['filename'])
+
+    return failed
+
+
+def is_image_container(path):
+    """文件是否为可提取图片的容器格式（EPUB、Office文档、ZIP）"""
+    return os.path.splitext(path.lower())[1] in CONTAINER_EXTENSIONS
+
+
+def extract_container_images(container_path, output_dir):
+    """从EPUB、Office文档或ZIP（包括嵌套的ZIP）中提取图片
+
+    先在内存中为所有图片确定文件名（见 _plan_zip_images），再并行分块写出；
+    目标目录中已有的相同图片直接复用。
+    返回 (提取的图片列表, 按正文顺序排列的图片列表或None)，后者只有Word/PowerPoint文档才有。
+    """
+    kind = os.path.splitext(container_path.lower())[1]
+    try:
+        with contextlib.ExitStack() as stack:
+            # 打开容器文件（实际上是ZIP文件）
+            container_zip = stack.enter_context(zipfile.ZipFile(container_path, 'r'))
+            images_dir = os.path.join(output_dir, "images")
+            images, image_order = _plan_container_images(container_zip, images_dir, kind, stack)
+            if not images:
+                return [], None
+
+            # 创建图片输出目录
+            os.makedirs(images_dir, exist_ok=True)
+            failed = _write_zip_images(images)
+
+    except MemoryError:
+        raise  # 超出内存上限时整个文件失败，不能当作没有图片
+    except Exception as e:
+        print(f"打开文件失败 {container_path}: {e}")
+        return [], None
+
+    public = {id(image): _public_image_info(image) for image in images if image['filename'] not in failed}
+    images_extracted = [public[id(image)] for image in images if id(image) in public]
+    if image_order is not None:
+        image_order = [public[id(image)] for image in image_order if id(image) in public]
+    return images_extracted, image_order
+
+
+def extract_epub_images(epub_path, output_dir):
+    """从EPUB文件中提取图片"""
+    return extract_container_images(epub_path, output_dir)[0]
+
+
+def inline_container_images(container_path, markdown_content, output_dir, base64_max_bytes=None,
+                            base64_references=False, optimizer=None):
+    """Base64模式：直接从容器中读取图片并内联，不写中间文件
+
+    只有超出大小上限、需要改用相对路径的图片才会提取到 output_dir/images；
+    传入 optimizer 时图片在编码前压缩。
+    返回 (处理后的Markdown, 提取的图片列表, 内联的图片数)
+    """
+    kind = os.path.splitext(container_path.lower())[1]
+    try:
+        with contextlib.ExitStack() as stack:
+            container_zip = stack.enter_context(zipfile.ZipFile(container_path, 'r'))
+            images_dir = os.path.join(output_dir, "images")
+            images, image_order = _plan_container_images(container_zip, images_dir, kind, stack)
+            if not images:
+                return markdown_content, [], 0
+
+            rewriter = ImageRefRewriter(images, 'base64', base64_max_bytes, base64_references,
+                                        optimizer=optimizer, image_order=image_order)
+            markdown_content = rewriter.rewrite(markdown_content)
+
+            # 改用相对路径的图片需要实际写出
+            fallback_paths = set(rewriter.fallback_paths)
+            extracted = [image for image in images if image['extracted_path'] in fallback_paths]
+            if extracted:
+                os.makedirs(images_dir, exist_ok=True)
+                failed = _write_zip_images(extracted)
+                extracted = [_public_image_info(image) for image in extracted
+                             if image['filename'] not in failed]
+
+    except MemoryError:
+        raise  # 超出内存上限时整个文件失败，不能当作没有图片
+    except Exception as e:
+        print(f"打开文件失败 {container_path}: {e}")
+        return markdown_content, [], 0
+
+    return markdown_content, extracted, rewriter.inlined_count
+
+
+# 图片引用的正则表达式：Markdown行内图片、HTML <img> 标签和引用式链接定义，一次扫描全部处理
+IMAGE_REF_PATTERN = re.compile(
+    r'(?P<md>!\[(?P<alt>[^\]]*)\]\((?P<md_src>[^)]+?)(?P<md_title>\s+"[^"]*")?\))'
+    r'|(?P<html><img\b[^>]*?\bsrc\s*=\s*(?P<quote>["\']))(?P<html_src>[^"\'>]*)(?P=quote)'
+    r'|(?P<ref>^[ ]{0,3}\[[^\]\n]+\]:[ \t]*)<?(?P<ref_src>[^\s>]+)>?',
+    re.IGNORECASE | re.MULTILINE
+)
+
+# Markdown中已有的引用式链接定义的标签
+REF_LABEL_PATTERN = re.compile(r'^[ ]{0,3}\[([^\]\n]+)\]:', re.MULTILINE)
+
+# MarkItDown 输出的工作表和压缩包成员标题（二级标题）
+SECTION_HEADING_PATTERN = re.compile(r'^## (.+?)[ \t]*$', re.MULTILINE)
+
+# Base64引用式定义的标签前缀
+REF_LABEL_PREFIX = 'markitdown-image-'
+
+
+class ImageRefRewriter:
+    """把Markdown中的图片引用替换为提取后的图片
+
+    创建时根据提取的图片建立一次路径索引（每张图片按原路径的所有后缀登记），
+    之后每个引用只需几次字典查找；图片引用方式也只在创建时确定一次。
+    Base64模式下每张图片只读取和编码一次，可用 base64_max_bytes 限制内联的图片大小，
+    base64_references 为真时行内图片改为引用式链接，数据统一以定义的形式附在文末
+    （标签避开文档中已定义的标签）。
+    带有 zip_file 和 zip_info 的图片直接从容器中读取，不需要先提取到磁盘；
+    传入 optimizer（见 markitdown_images.ImageOptimizer）时图片在编码前压缩，
+    正文引用的图片在替换之前于线程池中并行压缩和编码。
+    传入 image_order（图片在正文中出现的顺序）时，第N个图片引用对应其中第N张图片，
+    用于引用是数据URI或形状名称、无法按路径匹配的Word/PowerPoint文档。
+    带有 section 的图片（XLSX和ZIP中的图片）在正文中没有引用时，在该节末尾加上图片链接，
+    找不到该节时附在文末。
+    """
+
+    def __init__(self, extracted_images, image_mode='relative', base64_max_bytes=None,
+                 base64_references=False, optimizer=None, image_order=None):
+        if image_mode not in IMAGE_MODES:
+            raise ValueError(f"未知的图片引用方式: {image_mode}")
+        self.image_mode = image_mode
+        self.base64_max_bytes = base64_max_bytes
+        self.base64_references = base64_references
+        self.optimizer = optimizer
+        self.image_order = image_order
+        self.images = extracted_images
+        self._order_position = 0
+        self.index = {}
+        self._data_uris = {}    # 图片路径 -> 数据URI（超出大小上限或编码失败时为None）
+        self._definitions = {}  # 图片路径 -> 引用标签（当前文档中用到的）
+        self._label_count = 0
+        self._existing_labels = set()  # 当前文档中已定义的标签（小写）
+        for img in extracted_images:
+            parts = self._normalize(img['original_path']).split('/')
+            # 完整路径优先；较短的后缀（例如只有文件名）可能有多张图片，保留第一张
+            self.index['/'.join(parts)] = img
+            for start in range(1, len(parts)):
+                self.index.setdefault('/'.join(parts[start:]), img)
+
+    @staticmethod
+    def _normalize(src):
+        """统一路径格式：去掉锚点和查询参数、解码URL、去掉开头的 ./ 和 ../"""
+        src = src.split('#', 1)[0].split('?', 1)[0]
+        src = unquote(src).replace('\\', '/')
+        parts = [part for part in src.split('/') if part not in ('', '.', '..')]
+        return '/'.join(parts)
+
+    def find(self, src):
+        """查找引用对应的提取图片，未找到返回None"""
+        if not src or src.startswith(('data:', 'http://', 'https://')):
+            return None
+        parts = self._normalize(src).split('/')
+        # 从最长的后缀开始匹配，目录信息越完整越准确
+        for start in range(len(parts)):
+            img = self.index.get('/'.join(parts[start:]))
+            if img is not None:
+                return img
+        return None
+
+    def image_src(self, img):
+        """根据图片引用方式生成新的图片地址"""
+        if self.image_mode == "relative":
+            return img['relative_path']
+        if self.image_mode == "absolute":
+            return os.path.abspath(img['extracted_path'])
+
+        # base64（超出大小上限或编码失败时退回相对路径）
+        return self.data_uri(img) or img['relative_path']
+
+    def data_uri(self, img):
+        """图片的Base64数据URI，同一张图片只编码一次"""
+        path = img['extracted_path']
+        if path not in self._data_uris:
+            self._store_data_uri(img, self._encode(img))
+        return self._data_uris[path]
+
+    def _store_data_uri(self, img, encoded):
+        data_uri, bytes_saved = encoded
+        self._data_uris[img['extracted_path']] = data_uri
+        if self.optimizer is not None:
+            self.optimizer.bytes_saved += bytes_saved
+
+    def _encode(self, img):
+        """读取、压缩并编码图片，返回 (数据URI或None, 压缩节省的字节数)；不修改共享状态，可在线程中调用"""
+        data_uri = None
+        bytes_saved = 0
+        zip_info = img.get('zip_info')
+        path = img['extracted_path']
+        try:
+            size = zip_info.file_size if zip_info else os.path.getsize(path)
+            # 压缩时按压缩后的大小判断是否超出上限
+            if self.optimizer is None and self.base64_max_bytes and size > self.base64_max_bytes:
+                print(f"图片超过Base64大小上限，改用相对路径: {img['filename']}")
+            else:
+                if zip_info:
+                    img_data = img['zip_file'].read(zip_info)
+                else:
+                    with open(path, 'rb') as img_file:
+                        img_data = img_file.read()
+                img_ext = os.path.splitext(img['filename'])[1].lower()
+
+                if self.optimizer is not None:
+                    img_data, img_ext = self.optimizer.transcode_bytes(img_data, img_ext)
+                    bytes_saved = size - len(img_data)
+
+                if self.base64_max_bytes and len(img_data) > self.base64_max_bytes:
+                    print(f"图片超过Base64大小上限，改用相对路径: {img['filename']}")
+                else:
+                    mime_type = IMAGE_MIME_TYPES.get(img_ext, 'image/jpeg')
+                    data_uri = f"data:{mime_type};base64,{base64.b64encode(img_data).decode()}"
+        except MemoryError:
+            raise
+        except Exception as e:
+            print(f"Base64编码图片失败: {e}")
+
+        return data_uri, bytes_saved
+
+    def _referenced_images(self, markdown_content):
+        """正文引用的图片 {图片路径: 图片信息}"""
+        images = {}
+        self._order_position = 0
+        for match in IMAGE_REF_PATTERN.finditer(markdown_content):
+            img = self._match_image(match)[1]
+            if img is not None:
+                images.setdefault(img['extracted_path'], img)
+        self._order_position = 0
+        return images
+
+    def _link_unreferenced(self, markdown_content):
+        """在所属一节的末尾加上正文中没有引用的图片的链接（按原路径，之后与其他引用一起替换）"""
+        sectioned = [img for img in self.images if 'section' in img]
+        if not sectioned:
+            return markdown_content
+
+        referenced = self._referenced_images(markdown_content)
+        links = {}  # 节标题 -> 图片链接列表
+        for img in sectioned:
+            if img['extracted_path'] in referenced:
+                continue
+            referenced[img['extracted_path']] = img
+            name = posixpath.basename(img['original_path']).replace('[', '').replace(']', '')
+            links.setdefault(img['section'], []).append(f"![{name}]({quote(img['original_path'])})")
+        if not links:
+            return markdown_content
+
+        parts = []
+        position = 0
+        headings = list(SECTION_HEADING_PATTERN.finditer(markdown_content))
+        for index, heading in enumerate(headings):
+            section_links = links.pop(heading.group(1), None)
+            if section_links is None:
+                continue
+            end = headings[index + 1].start() if index + 1 < len(headings) else len(markdown_content)
+            parts.append(f"{markdown_content[position:end].rstrip()}\n\n" + "\n".join(section_links) + "\n\n")
+            position = end
+        rest = markdown_content[position:]
+        remaining = [link for section_links in links.values() for link in section_links]
+        if remaining:
+            rest = f"{rest.rstrip()}\n\n" + "\n".join(remaining) + "\n"
+        parts.append(rest)
+        return ''.join(parts)
+
+    def _prepare_data_uris(self, markdown_content):
+        """在线程池中并行压缩和编码正文引用的图片（压缩比读取和编码慢得多，不逐个在替换时进行）"""
+        images = {path: img for path, img in self._referenced_images(markdown_content).items()
+                  if path not in self._data_uris}
+        if len(images) < 2:
+            return
+
+        images = list(images.values())
+        with ThreadPoolExecutor(max_workers=min(OPTIMIZE_WORKERS, len(images))) as executor:
+            for img, encoded in zip(images, executor.map(self._encode, images)):
+                self._store_data_uri(img, encoded)
+
+    @property
+    def inlined_count(self):
+        """已内联的图片数"""
+        return sum(1 for data_uri in self._data_uris.values() if data_uri)
+
+    @property
+    def fallback_paths(self):
+        """Base64模式下未能内联、改用相对路径的图片路径"""
+        return [path for path, data_uri in self._data_uris.items() if data_uri is None]
+
+    def _match_image(self, match):
+        """返回 (引用类型, 对应的提取图片或None)；按顺序对应时消耗 image_order 中的一张图片"""
+        if match.group('md') is not None:
+            kind = 'md'
+        elif match.group('html') is not None:
+            kind = 'html'
+        else:
+            kind = 'ref'
+
+        src = match.group(f'{kind}_src')
+        img = None
+        if self.image_order and kind != 'ref' and not src.startswith(('http://', 'https://')):
+            # 按顺序对应：每个图片引用依次使用正文中的下一张图片
+            if self._order_position < len(self.image_order):
+                img = self.image_order[self._order_position]
+                self._order_position += 1
+        if img is None:
+            img = self.find(src)
+        return kind, img
+
+    def _replace(self, match):
+        kind, img = self._match_image(match)
+        if img is None:
+            # 未找到匹配的图片，保持原样
+            return match.group(0)
+
+        if kind == 'md' and self.image_mode == 'base64' and self.base64_references \
+                and not match.group('md_title') and self.data_uri(img):
+            label = self._definitions.get(img['extracted_path'])
+            if label is None:
+                label = self._new_label()
+                self._definitions[img['extracted_path']] = label
+            return f"![{match.group('alt')}][{label}]"
+
+        new_src = self.image_src(img)
+        if kind == 'md':
+            return f"![{match.group('alt')}]({new_src}{match.group('md_title') or ''})"
+        if kind == 'html':
+            return f"{match.group('html')}{new_src}{match.group('quote')}"
+        return f"{match.group('ref')}{new_src}"
+
+    def _new_label(self):
+        """下一个引用式定义的标签，跳过文档中已定义的标签（标签不区分大小写）"""
+        while True:
+            self._label_count += 1
+            label = f"{REF_LABEL_PREFIX}{self._label_count}"
+            if label not in self._existing_labels:
+                return label
+
+    def rewrite(self, markdown_content):
+        """替换所有图片引用（一次扫描）"""
+        if not self.index:
+            return markdown_content
+
+        markdown_content = self._link_unreferenced(markdown_content)
+        self._definitions = {}
+        self._label_count = 0
+        self._existing_labels = set()
+        if self.image_mode == 'base64' and self.base64_references:
+            self._existing_labels = {label.strip().lower()
+                                     for label in REF_LABEL_PATTERN.findall(markdown_content)}
+        if self.image_mode == 'base64' and self.optimizer is not None:
+            self._prepare_data_uris(markdown_content)
+        self._order_position = 0
+        processed_content = IMAGE_REF_PATTERN.sub(self._replace, markdown_content)
+
+        # 引用式定义附在文末，每张图片的数据只出现一次
+        if self._definitions:
+            definitions = "\n".join(f"[{label}]: {self._data_uris[path]}"
+                                    for path, label in self._definitions.items())
+            processed_content = f"{processed_content.rstrip()}\n\n{definitions}\n"
+        return processed_content
+
+
+def process_markdown_images(markdown_content, extracted_images, output_dir, image_mode='relative',
+                            base64_max_bytes=None, base64_references=False, image_order=None):
+    """处理Markdown中的图片引用"""
+    if not extracted_images:
+        return markdown_content
+
+    rewriter = ImageRefRewriter(extracted_images, image_mode, base64_max_bytes, base64_references,
+                                image_order=image_order)
+    return rewriter.rewrite(markdown_content)
+
+
+@contextlib.contextmanager
+def _untimed_stage(name):
+    """不记录统计时使用的空阶段"""
+    yield
+
+
+def convert_document(md, input_path, options=None, images_output_dir=None, progress=None, stats=None):
+    """转换单个文件，返回包含Markdown内容和提取图片信息的结果字典
+
+    images_output_dir 为提取图片的目录，默认为源文件所在目录；
+    progress 为可选的回调函数，用于接收状态文字；
+    stats 为可选的 markitdown_stats.ConversionStats，用于记录各阶段的耗时和内存。
+    """
+    options = options or make_options()
+    stage = stats.stage if stats is not None else _untimed_stage
+
+    def report(message):
+        if progress:
+            progress(message)
+
+    # 先查找转换缓存（缓存的是MarkItDown的原始输出，图片处理每次重新进行）
+    markdown_content = None
+    cache = cache_key = None
+    if options['use_cache']:
+        report("正在检查转换缓存...")
+        with stage('cache'):
+            cache = get_conversion_cache(options['cache_dir'], options['cache_max_mb'])
+            cache_key = cache.make_key(input_path, options)
+            markdown_content = cache.get(cache_key)
+
+    cache_hit = markdown_content is not None
+    if not cache_hit:
+        if md is None:
+            raise RuntimeError("MarkItDown实例不可用，请检查markitdown是否正确安装")
+
+        # 转换文件
+        report("正在转换文件...")
+        with stage('convert'):
+            # 扩展名明确的文件不运行magika，检测结果按 (路径, 大小, 修改时间) 缓存
+            type_cache = get_type_cache(options['cache_dir']) if options['use_cache'] else None
+            result = convert_local(md, input_path, type_cache, keep_data_uris=options['keep_data_uris'])
+            markdown_content = result.text_content or ""
+
+            if cache is not None:
+                cache.put(cache_key, markdown_content)
+
+    extracted_images = []
+    optimizer = ImageOptimizer.from_options(options)
+
+    # 检查是否是可提取图片的容器（EPUB、Office文档、ZIP）且需要提取图片
+    is_container = is_image_container(input_path)
+
+    if is_container and options['extract_images'] and options['image_mode'] == 'base64':
+        report("正在内联图片...")
+
+        # 直接从容器读取图片，只有改用相对路径的图片才写到输出目录
+        output_dir = images_output_dir or os.path.dirname(input_path)
+        with stage('rewrite_refs'):
+            markdown_content, extracted_images, inlined_count = inline_container_images(
+                input_path, markdown_content, output_dir,
+                base64_max_bytes=options['base64_max_kb'] * 1024,
+                base64_references=options['base64_references'],
+                optimizer=optimizer)
+
+        if inlined_count or extracted_images:
+            status_msg = f"转换完成！内联了 {inlined_count} 张图片"
+            if extracted_images:
+                status_msg += f"，提取了 {len(extracted_images)} 张超出大小上限的图片"
+            if optimizer is not None and optimizer.bytes_saved:
+                status_msg += f"，压缩节省 {format_bytes(optimizer.bytes_saved)}"
+        else:
+            status_msg = "转换完成！未找到图片文件"
+    elif is_container and options['extract_images']:
+        report("正在提取图片...")
+
+        # 确定输出目录
+        output_dir = images_output_dir or os.path.dirname(input_path)
+
+        # 提取图片
+        with stage('extract_images'):
+            extracted_images, image_order = extract_container_images(input_path, output_dir)
+
+        if extracted_images and optimizer is not None:
+            report("正在压缩图片...")
+            with stage('optimize_images'):
+                optimizer.optimize_images(extracted_images)
+
+        if extracted_images:
+            report("正在处理图片引用...")
+
+            # 处理Markdown中的图片引用
+            with stage('rewrite_refs'):
+                markdown_content = process_markdown_images(
+                    markdown_content, extracted_images, output_dir, options['image_mode'],
+                    base64_max_bytes=options['base64_max_kb'] * 1024,
+                    base64_references=options['base64_references'],
+                    image_order=image_order)
+
+            status_msg = f"转换完成！提取了 {len(extracted_images)} 张图片"
+            if optimizer is not None and optimizer.bytes_saved:
+                status_msg += f"，压缩节省 {format_bytes(optimizer.bytes_saved)}"
+        else:
+            status_msg = "转换完成！未找到图片文件"
+    else:
+        status_msg = "转换完成！"
+
+    if stats is not None:
+        stats.output_chars = len(markdown_content)
+        stats.cache_hit = cache_hit
+        stats.images = len(extracted_images)
+
+    return {
+        'input_path': input_path,
+        'markdown': markdown_content,
+        'extracted_images': extracted_images,
+        'status': status_msg,
+        'cache_hit': cache_hit,
+        'image_bytes_saved': optimizer.bytes_saved if optimizer is not None else 0,
+    }
+
+
+def _same_image_file(src_path, target_path):
+    """目标文件是否已经是同一图片：同一个文件（硬链接），或大小和内容都相同"""
+    try:
+        if os.path.samefile(src_path, target_path):
+            return True
+        if os.path.getsize(src_path) != os.path.getsize(target_path):
+            return False
+        return filecmp.cmp(src_path, target_path, shallow=False)
+    except OSError:
+        return False
+
+
+def _clone_file(src_path, target_path):
+    """用 FICLONE 创建共享数据块的副本，文件系统不支持时返回False"""
+    try:
+        import fcntl
+    except ImportError:
+        return False
+
+    try:
+        with open(src_path, 'rb') as source, open(target_path, 'wb') as target:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+    except OSError:
+        if os.path.exists(target_path):
+            os.remove(target_path)
+        return False
+    shutil.copystat(src_path, target_path)
+    return True
+
+
+def link_or_copy_file(src_path, target_path):
+    """把 src_path 放到 target_path：依次尝试硬链接、写时复制克隆，最后才复制数据
+
+    先在目标目录生成临时文件再替换，目标已存在时也不会留下半个文件。
+    提取图片时总是写入新文件再替换，硬链接的目标不会被之后的提取改动。
+    返回使用的方式（'link'、'clone' 或 'copy'）。
+    """
+    temp_path = f"{target_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        try:
+            os.link(src_path, temp_path)
+            method = 'link'
+        except OSError:
+            if _clone_file(src_path, temp_path):
+                method = 'clone'
+            else:
+                shutil.copy2(src_path, temp_path)
+                method = 'copy'
+        os.replace(temp_path, target_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return method
+
+
+def copy_images_to_target(extracted_images, output_dir):
+    """把提取的图片放到输出目录的images文件夹，返回新放入的文件名列表
+
+    目标目录中已有相同的图片时跳过；其余图片优先硬链接或克隆（同一分区上几乎不耗时），
+    不能链接时才复制，多张图片在线程池中并行处理。
+    """
+    images_target_dir = os.path.join(output_dir, "images")
+
+    # 创建图片目录
+    os.makedirs(images_target_dir, exist_ok=True)
+
+    to_copy = {}
+    for src_path in dict.fromkeys(img_info['extracted_path'] for img_info in extracted_images):
+        filename_only = os.path.basename(src_path)
+        target_path = os.path.join(images_target_dir, filename_only)
+
+        # 如果源文件和目标文件不是同一个，才复制
+        if os.path.abspath(src_path) != os.path.abspath(target_path):
+            to_copy[src_path] = target_path
+
+    def place(src_path, target_path):
+        if _same_image_file(src_path, target_path):
+            return False
+        link_or_copy_file(src_path, target_path)
+        return True
+
+    placed = set()
+    if to_copy:
+        workers = min(EXTRACT_WORKERS, len(to_copy))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(place, src_path, target_path): src_path
+                       for src_path, target_path in to_copy.items()}
+            for future in as_completed(futures):
+                src_path = futures[future]
+                try:
+                    if future.result():
+                        placed.add(src_path)
+                except Exception as copy_error:
+                    print(f"复制图片失败 {src_path}: {copy_error}")
+
+    return [os.path.basename(src_path) for src_path in to_copy if src_path in placed]
+
+
+def save_markdown(markdown_content, output_path, extracted_images=None):
+    """保存Markdown文件，并把提取的图片复制到同一目录，返回复制的图片文件名列表"""
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(output_dir, exist_ok=True)
+
+    with open(output_path, 'w', encoding='utf-8', buffering=SAVE_BUFFER_SIZE) as f:
+        f.write(markdown_content)
+
+    if extracted_images:
+        return copy_images_to_target(extracted_images, output_dir)
+    return []
+
+
+def save_markdown_file(source_path, output_path, extracted_images=None):
+    """把已写在磁盘上的Markdown结果分块复制到目标路径（内存占用固定），并复制提取的图片"""
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(output_dir, exist_ok=True)
+
+    if os.path.abspath(source_path) != os.path.abspath(output_path):
+        with open(source_path, 'rb') as source, open(output_path, 'wb') as target:
+            shutil.copyfileobj(source, target, SAVE_BUFFER_SIZE)
+
+    if extracted_images:
+        return copy_images_to_target(extracted_images, output_dir)
+    return []
+
+
+def format_bytes(size):
+    """把字节数格式化为便于阅读的文字"""
+    for unit in ('B', 'KB', 'MB'):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
+
+def default_output_path(input_path):
+    """源文件旁边的同名Markdown文件路径"""
+    return os.path.splitext(input_path)[0] + ".md"
+
+
+def iter_input_files(path, recursive=True):
+    """列出路径下所有支持转换的文件（path为文件时直接返回该文件）"""
+    if not os.path.isdir(path):
+        yield path
+        return
+
+    if not recursive:
+        for name in sorted(os.listdir(path)):
+            file_path = os.path.join(path, name)
+            if os.path.isfile(file_path) and name.lower().endswith(SUPPORTED_EXTENSIONS):
+                yield file_path
+        return
+
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if name.lower().endswith(SUPPORTED_EXTENSIONS):
+                yield os.path.join(dirpath, name)
+
+
+def plan_batch_jobs(paths, output_dir=None, recursive=True):
+    """生成批量转换任务列表 [(输入文件, 输出文件), ...]
+
+    指定 output_dir 时，目录输入会在输出目录中镜像其子目录结构；
+    未指定时，Markdown保存到源文件所在目录。
+    """
+    jobs = []
+    used_outputs = set()
+
+    for path in paths:
+        path = os.path.abspath(path)
+        root = path if os.path.isdir(path) else os.path.dirname(path)
+
+        for input_path in iter_input_files(path, recursive):
+            relative = os.path.relpath(input_path, root)
+            base_name = os.path.splitext(relative)[0]
+            target_dir = output_dir or root
+
+            # 同一批次内重名时追加序号（例如 a.pdf 和 a.docx）
+            output_path = os.path.join(target_dir, f"{base_name}.md")
+            counter = 1
+            while output_path in used_outputs:
+                output_path = os.path.join(target_dir, f"{base_name}_{counter}.md")
+                counter += 1
+            used_outputs.add(output_path)
+
+            jobs.append((input_path, output_path))
+
+    return jobs
+
+
+def set_memory_tracing(enabled):
+    """开启或关闭 tracemalloc，统计中记录各阶段的Python内存分配峰值"""
+    if enabled and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    elif not enabled and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def init_batch_worker(options, trace_memory=False):
+    """转换子进程初始化：预先创建MarkItDown实例，之后每个任务从实例池获取
+
+    trace_memory 为真时启用 tracemalloc，统计中记录各阶段的Python内存分配峰值。
+    """
+    setup_magika_paths()
+    set_memory_tracing(trace_memory)
+    try:
+        get_markitdown_instance(options['use_plugins'])
+    except ImportError as e:
+        # 流式转换不需要markitdown；其他文件在转换时报告错误，而不是让子进程启动失败
+        print(f"无法创建MarkItDown实例: {e}")
+
+
+def _join_preview(head, tail, total_chars):
+    """拼接过长结果的预览文字"""
+    omitted = total_chars - len(head) - len(tail)
+    return head + f"\n\n…… 结果过大，预览中省略了 {omitted:,} 个字符，保存时将写入完整内容 ……\n\n" + tail
+
+
+def make_result_path():
+    """创建保存完整转换结果的临时文件，返回其路径"""
+    fd, result_path = tempfile.mkstemp(suffix='.md', prefix='markitdown_')
+    os.close(fd)
+    return result_path
+
+
+def write_result_file(markdown_content):
+    """把转换结果写入临时文件，返回 (预览文字, 临时文件路径, 预览是否截断)"""
+    result_path = make_result_path()
+    with open(result_path, 'w', encoding='utf-8', buffering=SAVE_BUFFER_SIZE) as f:
+        f.write(markdown_content)
+
+    if len(markdown_content) <= RESULT_PREVIEW_THRESHOLD:
+        return markdown_content, result_path, False
+
+    preview = _join_preview(markdown_content[:RESULT_PREVIEW_HEAD_CHARS],
+                            markdown_content[-RESULT_PREVIEW_TAIL_CHARS:], len(markdown_content))
+    return preview, result_path, True
+
+
+def read_result_preview(result_path, total_chars):
+    """从结果文件读取预览文字（过长时只读取开头和结尾），返回 (预览文字, 预览是否截断)"""
+    with open(result_path, 'r', encoding='utf-8') as f:
+        if total_chars <= RESULT_PREVIEW_THRESHOLD:
+            return f.read(), False
+        head = f.read(RESULT_PREVIEW_HEAD_CHARS)
+
+    # UTF-8 每个字符最多4字节，从末尾足够多的字节开始读取，丢弃被截断的第一个字符
+    with open(result_path, 'rb') as f:
+        f.seek(max(0, os.path.getsize(result_path) - RESULT_PREVIEW_TAIL_CHARS * 4))
+        tail = f.read().decode('utf-8', errors='ignore')[-RESULT_PREVIEW_TAIL_CHARS:]
+    return _join_preview(head, tail, total_chars), True
+
+
+def convert_to_result_file(input_path, options, trace_memory=False, progress=None):
+    """图形界面的转换子进程任务：转换单个文件并把结果写入临时文件
+
+    图片提取到源文件所在目录；返回的结果字典不含整篇Markdown，
+    只有预览文字（result_path 为完整结果）、提取的图片和统计。
+    """
+    set_memory_tracing(trace_memory)
+    stats = ConversionStats(input_path)
+
+    with memory_limit(options['memory_limit_mb']):
+        if can_stream(input_path, options['stream_threshold_mb'] * 1024 * 1024):
+            # 大的文本类文件边读边写入结果文件，不经过MarkItDown和转换缓存
+            result_path = make_result_path()
+            with stats.stage('convert'):
+                output_chars = stream_convert(input_path, result_path, progress)
+            stats.output_chars = output_chars
+            with stats.stage('write_result'):
+                preview, truncated = read_result_preview(result_path, output_chars)
+            result = {
+                'input_path': input_path,
+                'extracted_images': [],
+                'status': "转换完成！（流式转换）",
+                'cache_hit': False,
+                'image_bytes_saved': 0,
+            }
+        else:
+            md = get_markitdown_instance(options['use_plugins'])
+            result = convert_document(md, input_path, options, progress=progress, stats=stats)
+            markdown_content = result.pop('markdown')
+            output_chars = len(markdown_content)
+
+            with stats.stage('write_result'):
+                preview, result_path, truncated = write_result_file(markdown_content)
+            del markdown_content
+
+            if options['use_cache']:
+                cache = get_conversion_cache(options['cache_dir'], options['cache_max_mb'])
+                result['status'] += f" | {cache.stats_text()}"
+
+    result.update(
+        preview=preview,
+        result_path=result_path,
+        truncated=truncated,
+        output_chars=output_chars,
+        stats=stats.to_dict(),
+    )
+    return result
+
+
+def convert_to_file(input_path, output_path, options, chunk_source=None):
+    """批量转换子进程任务：转换单个文件并直接写入输出文件
+
+    EPUB图片直接提取到输出文件所在目录；只把统计信息返回给主进程，
+    避免把整篇Markdown经由进程间管道传回。设置了 memory_limit_mb 时，
+    超出内存上限的文件以 MemoryLimitExceeded 失败。
+    设置了 chunk_size 时，从写出的Markdown文件逐行生成同名的分块文件（.chunks.jsonl），
+    分块的来源为 chunk_source（默认为 input_path）。
+    """
+    start_time = time.perf_counter()
+    output_dir = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(output_dir, exist_ok=True)
+
+    stats = ConversionStats(input_path)
+    with memory_limit(options['memory_limit_mb']):
+        if can_stream(input_path, options['stream_threshold_mb'] * 1024 * 1024):
+            # 大的文本类文件边读边写入输出文件，内存占用与文件大小无关
+            with stats.stage('convert'):
+                output_chars = stream_convert(input_path, output_path)
+            stats.output_chars = output_chars
+            result = {'extracted_images': [], 'cache_hit': False, 'image_bytes_saved': 0}
+            page_breaks = False
+        else:
+            md = get_markitdown_instance(options['use_plugins'])
+            result = convert_document(md, input_path, options, images_output_dir=output_dir, stats=stats)
+            output_chars = len(result['markdown'])
+            # pdfminer 在每页末尾输出换页符，有换页符时分块记录页码
+            page_breaks = '\f' in result['markdown']
+            with stats.stage('save'):
+                save_markdown(result.pop('markdown'), output_path)
+
+        chunks_path = None
+        chunk_count = 0
+        if options['chunk_size']:
+            chunks_path = chunks_path_for(output_path)
+            with stats.stage('chunk'):
+                chunk_count = write_markdown_chunks(output_path, chunks_path, chunk_source or input_path,
+                                                    options, page_breaks)
+
+    return {
+        'input_path': input_path,
+        'output_path': output_path,
+        'input_bytes': os.path.getsize(input_path),
+        'output_chars': output_chars,
+        'images': len(result['extracted_images']),
+        'image_files': list(dict.fromkeys(image['extracted_path'] for image in result['extracted_images'])),
+        'cache_hit': result['cache_hit'],
+        'image_bytes_saved': result['image_bytes_saved'],
+        'chunks_path': chunks_path,
+        'chunks': chunk_count,
+        'elapsed': time.perf_counter() - start_time,
+        'stats': stats.to_dict(),
+    }
+
+
+def create_batch_executor(options, max_workers=None, trace_memory=False):
+    """创建批量转换进程池，默认按CPU核心数确定进程数
+
+    超过 options['timeout_seconds'] 仍未完成的文件以 ConversionTimeout 失败，
+    其子进程被终止，队列中的其他文件继续转换。
+    """
+    return WorkerPool(
+        max_workers=max_workers or os.cpu_count() or 1,
+        initializer=init_batch_worker,
+        initargs=(options, trace_memory),
+        timeout=options['timeout_seconds'],
+    )
+
+
+def run_batch(jobs, options, max_workers=None, on_result=None, trace_memory=False):
+    """阻塞执行批量转换，每个文件结束时调用 on_result(输入文件, 结果字典, 异常)
+
+    返回 (成功数, 失败数)。
+    """
+    succeeded = failed = 0
+
+    with create_batch_executor(options, max_workers, trace_memory) as executor:
+        futures = {
+            executor.submit(convert_to_file, input_path, output_path, options): input_path
+            for input_path, output_path in jobs
+        }
+
+        for future in as_completed(futures):
+            input_path = futures[future]
+            error = future.exception()
+            if error is None:
+                succeeded += 1
+                info = future.result()
+            else:
+                failed += 1
+                info = None
+
+            if on_result:
+                on_result(input_path, info, error)
+
+    return succeeded, failed
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MarkItDown 文件类型检测
+扩展名明确且文件头与扩展名相符的文件直接按扩展名确定类型，不运行magika模型；
+扩展名未知或与内容不符时才交给MarkItDown的magika检测。
+检测结果可按 (路径, 大小, 修改时间) 缓存，重复转换同一文件时完全跳过检测
+"""
+
+import os
+import codecs
+import mimetypes
+import dataclasses
+
+
+# 读取文件头的字节数
+SNIFF_SIZE = 8192
+
+# 检测文本编码时读取的字节数（与MarkItDown相同）
+CHARSET_SAMPLE_SIZE = 65536
+
+_ZIP_SIGNATURES = (b'PK\x03\x04', b'PK\x05\x06')
+
+# 二进制格式的扩展名 -> 文件头检查（文件开头的字节，或接收文件头返回是否相符的函数）
+BINARY_SIGNATURES = {
+    '.docx': _ZIP_SIGNATURES,
+    '.pptx': _ZIP_SIGNATURES,
+    '.xlsx': _ZIP_SIGNATURES,
+    '.epub': _ZIP_SIGNATURES,
+    '.zip': _ZIP_SIGNATURES,
+    '.xls': (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1',),
+    '.pdf': lambda head: b'%PDF-' in head[:1024],
+    '.png': (b'\x89PNG\r\n\x1a\n',),
+    '.jpg': (b'\xff\xd8\xff',),
+    '.jpeg': (b'\xff\xd8\xff',),
+    '.gif': (b'GIF87a', b'GIF89a'),
+    '.bmp': (b'BM',),
+    '.wav': lambda head: head[:4] == b'RIFF' and head[8:12] == b'WAVE',
+    '.mp3': lambda head: head[:3] == b'ID3' or (len(head) > 1 and head[0] == 0xff and head[1] & 0xe0 == 0xe0),
+    '.m4a': lambda head: head[4:8] == b'ftyp',
+}
+
+# 文本格式的扩展名（文件头中没有空字节即认为相符）
+TEXT_EXTENSIONS = ('.txt', '.md', '.csv', '.json', '.xml', '.html', '.htm')
+
+_magika_warning_shown = False
+
+
+def extension_matches(ext, head):
+    """文件头是否与扩展名相符；扩展名未知时返回False"""
+    if ext in TEXT_EXTENSIONS:
+        return b'\x00' not in head
+    signature = BINARY_SIGNATURES.get(ext)
+    if signature is None:
+        return False
+    if callable(signature):
+        return signature(head)
+    return head.startswith(signature)
+
+
+def _detect_charset(file_stream):
+    """按MarkItDown的方式检测文本编码，失败时返回None（由转换器自行检测）"""
+    try:
+        import charset_normalizer
+        try:
+            from markitdown._markitdown import _read_charset_sample
+            sample = _read_charset_sample(file_stream)
+        except ImportError:
+            sample = file_stream.read(CHARSET_SAMPLE_SIZE)
+        detected = charset_normalizer.from_bytes(sample).best()
+    except ImportError:
+        return None
+    if detected is None:
+        return None
+    try:
+        return codecs.lookup(detected.encoding).name
+    except LookupError:
+        return detected.encoding
+
+
+def guess_by_extension(file_stream, input_path):
+    """扩展名已知且与文件头相符时，返回按扩展名确定的猜测列表（字典列表），否则返回None"""
+    ext = os.path.splitext(input_path)[1].lower()
+    cur_pos = file_stream.tell()
+    try:
+        head = file_stream.read(SNIFF_SIZE)
+        if not head or not extension_matches(ext, head):
+            return None
+
+        charset = None
+        if ext in TEXT_EXTENSIONS:
+            file_stream.seek(cur_pos)
+            charset = _detect_charset(file_stream)
+    finally:
+        file_stream.seek(cur_pos)
+
+    mimetype, _ = mimetypes.guess_type("placeholder" + ext, strict=False)
+    return [{
+        'mimetype': mimetype,
+        'extension': os.path.splitext(input_path)[1],
+        'charset': charset,
+        'filename': os.path.basename(input_path),
+        'local_path': input_path,
+        'url': None,
+    }]
+
+
+def guess_by_magika(md, file_stream, input_path):
+    """使用MarkItDown的magika检测，返回猜测列表（字典列表）；magika不可用时只按扩展名猜测"""
+    from markitdown import StreamInfo
+    global _magika_warning_shown
+
+    base_guess = StreamInfo(local_path=input_path, extension=os.path.splitext(input_path)[1],
+                            filename=os.path.basename(input_path))
+    try:
+        guesses = md._get_stream_info_guesses(file_stream=file_stream, base_guess=base_guess)
+    except Exception as e:
+        if not _magika_warning_shown:
+            print(f"magika出现问题，按扩展名确定文件类型: {e}")
+            _magika_warning_shown = True
+        mimetype, _ = mimetypes.guess_type("placeholder" + base_guess.extension, strict=False)
+        guesses = [base_guess.copy_and_update(mimetype=mimetype)] if mimetype else [base_guess]
+    return [dataclasses.asdict(guess) for guess in guesses]
+
+
+def detect_stream_info(md, file_stream, input_path, type_cache=None):
+    """确定 MarkItDown 转换 input_path 时使用的 StreamInfo 猜测列表
+
+    依次使用缓存（type_cache 为 markitdown_cache.FileTypeCache）、扩展名和文件头、magika。
+    """
+    from markitdown import StreamInfo
+
+    stat = os.stat(input_path)
+    cache_path = os.path.abspath(input_path)
+    guesses = None
+    if type_cache is not None:
+        guesses = type_cache.get(cache_path, stat.st_size, stat.st_mtime_ns)
+
+    if guesses is None:
+        guesses = guess_by_extension(file_stream, input_path)
+        if guesses is None:
+            guesses = guess_by_magika(md, file_stream, input_path)
+        if type_cache is not None:
+            type_cache.put(cache_path, stat.st_size, stat.st_mtime_ns, guesses)
+
+    # 缓存的路径可能与本次传入的写法不同，以本次为准
+    return [StreamInfo(**dict(guess, local_path=input_path)) for guess in guesses]
+
+
+def convert_local(md, input_path, type_cache=None, **kwargs):
+    """与 MarkItDown.convert 相同地转换本地文件，但文件类型由 detect_stream_info 确定
+
+    MarkItDown 没有所需的内部接口（版本不同）时直接调用 md.convert。
+    """
+    if not (hasattr(md, '_convert') and hasattr(md, '_get_stream_info_guesses')):
+        return md.convert(input_path, **kwargs)
+
+    with open(input_path, 'rb') as file_stream:
+        guesses = detect_stream_info(md, file_stream, input_path, type_cache)
+        return md._convert(file_stream=file_stream, stream_info_guesses=guesses, **kwargs)
@@ -5,24 +5,25 @@ MarkItDown GUI应用程序
 将各种文件格式转换为Markdown的图形界面工具
 """
 
+import time
+
+# 记录进程启动时间，用于统计窗口显示耗时
+_STARTUP_TIME = time.perf_counter()
+
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import threading
 import os
 import sys
 import traceback
-from pathlib import Path
 import webbrowser
-import tempfile
-import shutil
-import zipfile
-import re
-import base64
+import multiprocessing
+import tracemalloc
+import importlib.util
 
-try:
-    from markitdown import MarkItDown
-except ImportError as e:
-    print(f"导入 markitdown 失败: {e}")
+# 只检查 markitdown 是否已安装，真正的导入和实例创建在窗口显示后于后台进行
+if importlib.util.find_spec("markitdown") is None:
+    print("导入 markitdown 失败: 未找到 markitdown 包")
     print("请安装markitdown包: pip install markitdown")
     print("或者安装完整版本: pip install 'markitdown[all]'")
     
@@ -44,33 +45,30 @@ except ImportError as e:
     
     sys.exit(1)
 
-# 设置magika模型路径（用于打包后的exe文件）
-def setup_magika_paths():
-    """设置magika的路径和环境变量"""
-    if getattr(sys, 'frozen', False):
-        # 运行在PyInstaller打包的exe中
-        application_path = sys._MEIPASS
-        
-        # 检查magika文件是否存在
-        magika_config_path = os.path.join(application_path, 'magika', 'config')
-        magika_models_path = os.path.join(application_path, 'magika', 'models')
-        
-        if os.path.exists(magika_config_path) and os.path.exists(magika_models_path):
-            # 设置magika环境变量，让其找到配置文件
-            os.environ['MAGIKA_CONFIG_PATH'] = magika_config_path
-            os.environ['MAGIKA_MODELS_PATH'] = magika_models_path
-            return True
-    return False
+from markitdown_core import (
+    setup_magika_paths,
+    make_options,
+    init_batch_worker,
+    convert_to_result_file,
+    save_markdown,
+    save_markdown_file,
+    default_output_path,
+    iter_input_files,
+    create_batch_executor,
+    convert_to_file,
+)
+from markitdown_sync import sync_directory
+from markitdown_watch import watch_directory
+from markitdown_images import IMAGE_FORMATS
+from markitdown_stats import ConversionStats, StatsLog, format_stage_seconds
+from markitdown_worker import ConversionWorker, ConversionCancelled
+
+
+# 转换引擎预热时的状态栏文字
+WARMUP_STATUS = "正在预热转换引擎..."
 
-def get_magika_model_path():
-    """获取magika模型路径"""
-    if getattr(sys, 'frozen', False):
-        # 运行在PyInstaller打包的exe中
-        application_path = sys._MEIPASS
-        magika_models_path = os.path.join(application_path, 'magika', 'models', 'standard_v3_3')
-        if os.path.exists(magika_models_path):
-            return Path(magika_models_path)
-    return None
+# 结果显示区每次插入的字符数，分批插入避免长时间阻塞界面
+RESULT_CHUNK_CHARS = 64 * 1024
 
 
 class MarkItDownGUI:
@@ -86,18 +84,68 @@ class MarkItDownGUI:
         except:
             pass
         
-        # 初始化 MarkItDown
-        self.markitdown = self._create_markitdown_instance()
+        # 转换在可终止的子进程中进行，MarkItDown 在窗口显示后于子进程中创建（导入各转换后端较慢）
+        self.markitdown_ready = threading.Event()
+        self.converter = None
+        self.cancel_event = threading.Event()  # 本次转换的取消标志（用户已点击"取消转换"）
         
         # 变量
         self.extracted_images = []  # 存储提取的图片信息
         self.source_file_path = ""  # 存储源文件路径
+        self.batch_window = None  # 批量转换窗口
+        self.result_path = None  # 完整转换结果（临时文件），保存时直接从此文件写出
+        self.result_truncated = False  # 结果显示区是否只显示了开头和结尾
+        self.render_generation = 0  # 结果插入批次，新结果到来时中止旧的分批插入
+        self.stats_log = StatsLog()  # 各次转换的分阶段统计
+        self.current_stats = None  # 当前结果的统计，保存时追加保存阶段
+        self.stats_window = None  # 转换统计窗口
         
         # 创建界面
         self.create_widgets()
         
         # 绑定拖拽事件
         self.setup_drag_drop()
+        
+        # 关闭窗口时清理临时文件
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        # 窗口显示后开始预热转换引擎
+        self.root.after_idle(self.start_warmup)
+    
+    def start_warmup(self):
+        """在后台线程中导入markitdown并创建实例"""
+        window_time = time.perf_counter() - _STARTUP_TIME
+        print(f"启动耗时: 窗口显示 {window_time:.2f}s")
+        self.status_var.set(WARMUP_STATUS)
+        
+        self.converter = ConversionWorker(init_batch_worker, (self.get_options(),))
+        thread = threading.Thread(target=self._warmup_worker)
+        thread.daemon = True
+        thread.start()
+    
+    def _warmup_worker(self):
+        """预热工作线程：启动转换子进程并等待其创建MarkItDown实例"""
+        error = None
+        try:
+            elapsed = self.converter.warmup()
+        except Exception as e:
+            error = e
+            print(f"转换引擎预热失败: {e}")
+        finally:
+            self.markitdown_ready.set()
+        if error is None:
+            print(f"启动耗时: 转换引擎预热 {elapsed:.2f}s")
+        
+        def update_status():
+            # 用户已选择文件或开始转换时不覆盖状态栏
+            if self.status_var.get() != WARMUP_STATUS:
+                return
+            if error is not None:
+                self.status_var.set("转换引擎初始化失败，请检查markitdown是否正确安装")
+            else:
+                self.status_var.set(f"准备就绪（转换引擎预热用时 {elapsed:.1f}s）")
+        
+        self.root.after(0, update_status)
     
     def create_widgets(self):
         """创建GUI组件"""
@@ -139,11 +187,11 @@ class MarkItDownGUI:
         options_frame = ttk.LabelFrame(self.main_frame, text="转换选项", padding="10")
         options_frame.grid(row=2, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=(0, 10))
         
-        # 提取图片选项（针对epub文件）
+        # 提取图片选项（针对EPUB、Office文档和ZIP文件）
         self.extract_images_var = tk.BooleanVar(value=True)
         self.extract_images_check = ttk.Checkbutton(
             options_frame, 
-            text="从EPUB提取图片（保存到输出目录）",
+            text="从EPUB/Office/ZIP提取图片（保存到输出目录）",
             variable=self.extract_images_var
         )
         self.extract_images_check.grid(row=0, column=0, sticky=tk.W, pady=2)
@@ -174,7 +222,43 @@ class MarkItDownGUI:
             text="Base64编码",
             variable=self.image_mode_var,
             value="base64"
-        ).grid(row=0, column=2)
+        ).grid(row=0, column=2, padx=(0, 10))
+        
+        # Base64图片以引用式定义输出，重复引用的图片数据只出现一次
+        self.base64_references_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            image_mode_frame,
+            text="Base64图片只输出一次（引用式定义）",
+            variable=self.base64_references_var
+        ).grid(row=0, column=3)
+        
+        # 图片压缩选项（需要Pillow）
+        compress_frame = ttk.Frame(options_frame)
+        compress_frame.grid(row=7, column=0, sticky=tk.W, pady=2)
+        
+        ttk.Label(compress_frame, text="图片压缩: 最长边").grid(row=0, column=0, sticky=tk.W)
+        self.image_max_dimension_var = tk.IntVar(value=0)
+        ttk.Spinbox(compress_frame, from_=0, to=10000, increment=256,
+                    textvariable=self.image_max_dimension_var, width=6).grid(row=0, column=1, padx=(5, 5))
+        ttk.Label(compress_frame, text="像素（0 为不缩小）  格式").grid(row=0, column=2, sticky=tk.W)
+        self.image_format_var = tk.StringVar(value="original")
+        ttk.Combobox(compress_frame, textvariable=self.image_format_var, values=IMAGE_FORMATS,
+                     state="readonly", width=9).grid(row=0, column=3, padx=(5, 0))
+        
+        # 转换超时和内存上限选项：超出时终止转换进程，只有当前文件失败
+        limits_frame = ttk.Frame(options_frame)
+        limits_frame.grid(row=8, column=0, sticky=tk.W, pady=2)
+        
+        ttk.Label(limits_frame, text="单个文件转换超时:").grid(row=0, column=0, sticky=tk.W)
+        self.timeout_var = tk.IntVar(value=0)
+        ttk.Spinbox(limits_frame, from_=0, to=3600, increment=30,
+                    textvariable=self.timeout_var, width=6).grid(row=0, column=1, padx=(5, 5))
+        ttk.Label(limits_frame, text="秒  内存上限").grid(row=0, column=2, sticky=tk.W)
+        self.memory_limit_var = tk.IntVar(value=0)
+        ttk.Spinbox(limits_frame, from_=0, to=65536, increment=512,
+                    textvariable=self.memory_limit_var, width=7).grid(row=0, column=3, padx=(5, 5))
+        ttk.Label(limits_frame, text="MB（0 为不限制，超出的文件记为失败并跳过）").grid(
+            row=0, column=4, sticky=tk.W)
         
         # 保留数据URI选项
         self.keep_data_uris_var = tk.BooleanVar(value=False)
@@ -186,6 +270,16 @@ class MarkItDownGUI:
         ttk.Checkbutton(options_frame, text="启用第三方插件", 
                        variable=self.use_plugins_var).grid(row=4, column=0, sticky=tk.W)
         
+        # 转换缓存选项
+        self.use_cache_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(options_frame, text="启用转换缓存（相同文件再次转换时直接读取结果）", 
+                       variable=self.use_cache_var).grid(row=5, column=0, sticky=tk.W)
+        
+        # 自动保存选项
+        self.auto_save_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(options_frame, text="转换后自动保存到源文件所在目录", 
+                       variable=self.auto_save_var).grid(row=6, column=0, sticky=tk.W)
+        
         # 操作按钮区域
         button_frame = ttk.Frame(self.main_frame)
         button_frame.grid(row=3, column=0, columnspan=3, pady=(0, 10))
@@ -194,10 +288,22 @@ class MarkItDownGUI:
                                         command=self.convert_file)
         self.convert_button.pack(side=tk.LEFT, padx=(0, 10))
         
+        self.cancel_button = ttk.Button(button_frame, text="取消转换",
+                                       command=self.cancel_conversion, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=(0, 10))
+        
         self.save_button = ttk.Button(button_frame, text="保存结果", 
                                      command=self.save_result, state=tk.DISABLED)
         self.save_button.pack(side=tk.LEFT, padx=(0, 10))
         
+        self.batch_button = ttk.Button(button_frame, text="批量转换...",
+                                      command=self.open_batch_window)
+        self.batch_button.pack(side=tk.LEFT, padx=(0, 10))
+        
+        self.stats_button = ttk.Button(button_frame, text="统计...",
+                                      command=self.open_stats_window)
+        self.stats_button.pack(side=tk.LEFT, padx=(0, 10))
+        
         self.clear_button = ttk.Button(button_frame, text="清空", command=self.clear_all)
         self.clear_button.pack(side=tk.LEFT)
         
@@ -222,88 +328,19 @@ class MarkItDownGUI:
         about_button = ttk.Button(self.main_frame, text="关于", command=self.show_about)
         about_button.grid(row=5, column=2, sticky=tk.E, pady=(10, 0))
         
-        # 进度条（初始隐藏）
+        # 进度条（初始隐藏，转换时显示；流式转换时显示实际百分比）
         self.progress = ttk.Progressbar(self.main_frame, mode='indeterminate')
         # 不立即网格化，在需要时再显示
         
-    def _create_markitdown_instance(self):
-        """创建MarkItDown实例，处理打包后的magika模型路径"""
-        try:
-            # 在打包环境中，尝试特殊处理
-            if getattr(sys, 'frozen', False):
-                # 尝试不使用magika创建实例
-                try:
-                    markitdown_instance = MarkItDown()
-                    # 如果magika出现问题，将其设为None来禁用文件类型检测
-                    if hasattr(markitdown_instance, '_magika'):
-                        try:
-                            # 测试magika是否工作
-                            markitdown_instance._magika.identify_bytes(b"test")
-                        except:
-                            print("magika出现问题，禁用文件类型检测")
-                            markitdown_instance._magika = None
-                    return markitdown_instance
-                except Exception as e:
-                    print(f"创建MarkItDown实例时出错: {e}")
-                    # 最后的降级方案
-                    return self._create_minimal_markitdown()
-            else:
-                # 非打包环境，使用默认设置
-                return MarkItDown()
-                
-        except Exception as e:
-            print(f"创建MarkItDown实例时出错: {e}")
-            # 降级到最小实例
-            return self._create_minimal_markitdown()
-    
-    def _create_minimal_markitdown(self):
-        """创建最小化的MarkItDown实例"""
-        try:
-            # 导入MarkItDown内部类
-            from markitdown._markitdown import MarkItDown as _MarkItDown
-            
-            # 创建一个不使用magika的实例
-            instance = _MarkItDown()
-            instance._magika = None  # 禁用magika
-            
-            return instance
-        except:
-            # 如果这也失败了，返回一个虚拟实例
-            return None
-    
-    def _create_markitdown_instance_with_options(self):
-        """创建MarkItDown实例，包含用户选项"""
-        try:
-            # 获取自定义magika模型路径
-            custom_magika_path = get_magika_model_path()
-            
-            if custom_magika_path:
-                # 创建自定义magika实例
-                from magika import Magika
-                custom_magika = Magika(model_dir=custom_magika_path)
-                
-                # 创建MarkItDown实例（包含插件设置）
-                markitdown_instance = MarkItDown(enable_plugins=self.use_plugins_var.get())
-                
-                # 替换magika实例
-                markitdown_instance._magika = custom_magika
-                
-                return markitdown_instance
-            else:
-                # 使用默认设置
-                return MarkItDown(enable_plugins=self.use_plugins_var.get())
-                
-        except Exception as e:
-            print(f"创建MarkItDown实例时出错: {e}")
-            # 降级到默认实例
-            return MarkItDown(enable_plugins=self.use_plugins_var.get())
-    
     def setup_drag_drop(self):
         """设置拖拽支持"""
         # 简单的拖拽支持，绑定文件拖拽事件
         def handle_drop(event):
             files = self.root.tk.splitlist(event.data)
-            if files:
+            if len(files) > 1:
+                # 拖入多个文件时加入批量转换队列
+                self.open_batch_window(files)
+            elif files:
                 file_path = files[0]
                 self.file_path_var.set(file_path)
                 self.status_var.set(f"已选择文件: {os.path.basename(file_path)}")
@@ -316,6 +353,29 @@ class MarkItDownGUI:
             # 如果拖拽不支持，忽略错误
             pass
     
+    def open_batch_window(self, files=None):
+        """打开批量转换窗口，可选地加入一组文件"""
+        if self.batch_window is None or not self.batch_window.window.winfo_exists():
+            self.batch_window = BatchConvertWindow(self)
+        else:
+            self.batch_window.window.lift()
+        
+        if files:
+            self.batch_window.add_paths(files)
+    
+    def open_stats_window(self):
+        """打开转换统计窗口"""
+        if self.stats_window is None or not self.stats_window.window.winfo_exists():
+            self.stats_window = StatsWindow(self)
+        else:
+            self.stats_window.refresh()
+            self.stats_window.window.lift()
+    
+    def refresh_stats_window(self):
+        """统计窗口打开时刷新显示"""
+        if self.stats_window is not None and self.stats_window.window.winfo_exists():
+            self.stats_window.refresh()
+    
     def browse_file(self):
         """浏览文件对话框"""
         filetypes = [
@@ -342,135 +402,42 @@ class MarkItDownGUI:
             self.file_path_var.set(filename)
             self.status_var.set(f"已选择文件: {os.path.basename(filename)}")
     
-    def extract_epub_images(self, epub_path, output_dir):
-        """从EPUB文件中提取图片"""
-        images_extracted = []
-        
+    def get_options(self):
+        """读取界面上的转换选项（需在主线程中调用）"""
+        return make_options(
+            extract_images=self.extract_images_var.get(),
+            image_mode=self.image_mode_var.get(),
+            base64_references=self.base64_references_var.get(),
+            image_max_dimension=self._get_image_max_dimension(),
+            image_format=self.image_format_var.get(),
+            keep_data_uris=self.keep_data_uris_var.get(),
+            use_plugins=self.use_plugins_var.get(),
+            use_cache=self.use_cache_var.get(),
+            timeout_seconds=self._get_timeout(),
+            memory_limit_mb=self._get_memory_limit(),
+        )
+    
+    def _get_image_max_dimension(self):
+        """读取图片最长边设置，输入无效时视为不缩小"""
         try:
-            # 创建图片输出目录
-            images_dir = os.path.join(output_dir, "images")
-            os.makedirs(images_dir, exist_ok=True)
-            
-            # 打开EPUB文件（实际上是ZIP文件）
-            with zipfile.ZipFile(epub_path, 'r') as epub_zip:
-                # 获取所有文件列表
-                file_list = epub_zip.namelist()
-                
-                # 查找图片文件
-                image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.svg', '.webp'}
-                image_files = [f for f in file_list 
-                             if os.path.splitext(f.lower())[1] in image_extensions]
-                
-                # 提取图片文件
-                for image_file in image_files:
-                    try:
-                        # 获取文件名
-                        filename = os.path.basename(image_file)
-                        if not filename:  # 跳过目录
-                            continue
-                            
-                        # 确保文件名唯一
-                        counter = 1
-                        base_name, ext = os.path.splitext(filename)
-                        final_filename = filename
-                        
-                        while os.path.exists(os.path.join(images_dir, final_filename)):
-                            final_filename = f"{base_name}_{counter}{ext}"
-                            counter += 1
-                        
-                        # 提取文件
-                        output_path = os.path.join(images_dir, final_filename)
-                        with epub_zip.open(image_file) as source:
-                            with open(output_path, 'wb') as target:
-                                target.write(source.read())
-                        
-                        # 记录原始路径和新路径的映射
-                        images_extracted.append({
-                            'original_path': image_file,
-                            'extracted_path': output_path,
-                            'filename': final_filename,
-                            'relative_path': f"images/{final_filename}"
-                        })
-                        
-                    except Exception as e:
-                        print(f"提取图片失败 {image_file}: {e}")
-                        continue
-                        
-        except Exception as e:
-            print(f"打开EPUB文件失败: {e}")
-            return []
-        
-        return images_extracted
-    
-    def process_markdown_images(self, markdown_content, extracted_images, output_dir):
-        """处理Markdown中的图片引用"""
-        if not extracted_images:
-            return markdown_content
-        
-        # 创建路径映射字典
-        path_mapping = {}
-        for img in extracted_images:
-            # 尝试匹配不同的路径格式
-            original_name = os.path.basename(img['original_path'])
-            path_mapping[original_name] = img
-            path_mapping[img['original_path']] = img
-            # 去掉路径前缀的变体
-            if '/' in img['original_path']:
-                path_mapping[img['original_path'].split('/')[-1]] = img
-        
-        # 图片引用的正则表达式
-        img_pattern = r'!\[([^\]]*)\]\(([^)]+)\)'
-        
-        def replace_image_ref(match):
-            alt_text = match.group(1)
-            img_src = match.group(2)
-            
-            # 查找匹配的提取图片
-            found_img = None
-            img_basename = os.path.basename(img_src)
-            
-            # 尝试多种匹配方式
-            for key in [img_src, img_basename, img_src.replace('../', ''), img_src.replace('./', '')]:
-                if key in path_mapping:
-                    found_img = path_mapping[key]
-                    break
-            
-            if found_img:
-                # 根据选择的模式生成新的图片引用
-                if self.image_mode_var.get() == "relative":
-                    new_src = found_img['relative_path']
-                elif self.image_mode_var.get() == "absolute":
-                    new_src = os.path.abspath(found_img['extracted_path'])
-                else:  # base64
-                    try:
-                        with open(found_img['extracted_path'], 'rb') as img_file:
-                            img_data = img_file.read()
-                            img_ext = os.path.splitext(found_img['filename'])[1].lower()
-                            mime_type = {
-                                '.jpg': 'image/jpeg',
-                                '.jpeg': 'image/jpeg',
-                                '.png': 'image/png',
-                                '.gif': 'image/gif',
-                                '.bmp': 'image/bmp',
-                                '.svg': 'image/svg+xml'
-                            }.get(img_ext, 'image/jpeg')
-                            
-                            base64_data = base64.b64encode(img_data).decode()
-                            new_src = f"data:{mime_type};base64,{base64_data}"
-                    except Exception as e:
-                        print(f"Base64编码图片失败: {e}")
-                        new_src = found_img['relative_path']
-                
-                return f"![{alt_text}]({new_src})"
-            else:
-                # 未找到匹配的图片，保持原样
-                return match.group(0)
-        
-        # 替换所有图片引用
-        processed_content = re.sub(img_pattern, replace_image_ref, markdown_content)
-        
-        return processed_content
-
+            return max(0, int(self.image_max_dimension_var.get()))
+        except (tk.TclError, ValueError):
+            return 0
+    
+    def _get_timeout(self):
+        """读取转换超时设置（秒），输入无效时视为不限制"""
+        try:
+            return max(0, int(self.timeout_var.get()))
+        except (tk.TclError, ValueError):
+            return 0
+    
+    def _get_memory_limit(self):
+        """读取内存上限设置（MB），输入无效时视为不限制"""
+        try:
+            return max(0, int(self.memory_limit_var.get()))
+        except (tk.TclError, ValueError):
+            return 0
+    
     def convert_file(self):
         """转换文件"""
         if not self.file_path_var.get():
@@ -479,90 +446,183 @@ class MarkItDownGUI:
         
         # 禁用转换按钮
         self.convert_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.cancel_event = threading.Event()
+        self.progress.config(mode='indeterminate', value=0)
+        self.progress.grid(row=6, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=(5, 0))
         self.progress.start()
         
+        # Tk变量只在主线程中读取，再传给工作线程
+        input_path = self.file_path_var.get()
+        options = self.get_options()
+        auto_save = self.auto_save_var.get()
+        
         # 在新线程中进行转换
-        thread = threading.Thread(target=self._convert_worker)
+        thread = threading.Thread(target=self._convert_worker, args=(input_path, options, auto_save, self.cancel_event))
         thread.daemon = True
         thread.start()
     
-    def _convert_worker(self):
-        """转换工作线程"""
+    def cancel_conversion(self):
+        """取消正在进行的转换（终止转换子进程）"""
+        self.cancel_event.set()
+        self.cancel_button.config(state=tk.DISABLED)
+        self.status_var.set("正在取消转换...")
+    
+    def _show_progress(self, message, fraction=None):
+        """更新状态栏；有完成比例时（流式转换）进度条显示实际百分比"""
+        self.status_var.set(message)
+        if fraction is not None:
+            if str(self.progress.cget('mode')) != 'determinate':
+                self.progress.stop()
+                self.progress.config(mode='determinate', maximum=100)
+            self.progress.config(value=fraction * 100)
+    
+    def _stop_progress(self):
+        """转换结束：隐藏进度条，恢复转换按钮"""
+        self.progress.stop()
+        self.progress.grid_remove()
+        self.convert_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
+    
+    def _convert_worker(self, input_path, options, auto_save=False, cancel_event=None):
+        """转换工作线程：在转换子进程中转换，结果由子进程写入临时文件
+
+        cancel_event 为本次转换的取消标志，在转换开始前设置同样有效。
+        """
+        cancel_event = cancel_event or threading.Event()
+        stats = ConversionStats(input_path)
         try:
-            md = self.markitdown
-            input_path = self.file_path_var.get()
+            def report_status(message, fraction=None):
+                self.root.after(0, self._show_progress, message, fraction)
             
-            # 更新状态
-            self.root.after(0, lambda: self.status_var.set("正在转换文件..."))
+            # 首次转换时转换引擎可能还在预热
+            if not self.markitdown_ready.is_set():
+                report_status(WARMUP_STATUS)
+                self.markitdown_ready.wait()
+            if cancel_event.is_set():
+                raise ConversionCancelled("转换已取消")
             
-            # 转换文件
-            result = md.convert(input_path)
-            markdown_content = result.text_content
+            # 转换文件（图片提取到源文件所在目录），超时或取消时子进程被终止
+            result = self.converter.run(convert_to_result_file, input_path, options, tracemalloc.is_tracing(),
+                                        timeout=options['timeout_seconds'], progress=report_status,
+                                        cancel_event=cancel_event)
+            stats = ConversionStats.from_dict(result['stats'])
+            result_path = result['result_path']
+            if cancel_event.is_set():
+                os.remove(result_path)
+                raise ConversionCancelled("转换已取消")
             
-            # 检查是否是EPUB文件且需要提取图片
-            is_epub = input_path.lower().endswith('.epub')
-            extract_images = self.extract_images_var.get()
+            status_msg = result['status']
+            preview = result['preview']
+            truncated = result['truncated']
+            if truncated:
+                status_msg += f" | 结果较大（{result['output_chars']:,} 字符），仅预览开头和结尾"
             
-            if is_epub and extract_images:
-                self.root.after(0, lambda: self.status_var.set("正在提取图片..."))
-                
-                # 确定输出目录
-                output_dir = os.path.dirname(input_path)
-                
-                # 提取图片
-                extracted_images = self.extract_epub_images(input_path, output_dir)
-                
-                # 保存提取的图片信息和源文件路径
-                self.extracted_images = extracted_images
-                self.source_file_path = input_path
-                
-                if extracted_images:
-                    self.root.after(0, lambda: self.status_var.set("正在处理图片引用..."))
-                    
-                    # 处理Markdown中的图片引用
-                    markdown_content = self.process_markdown_images(markdown_content, extracted_images, output_dir)
-                    
-                    # 更新状态信息
-                    img_count = len(extracted_images)
-                    status_msg = f"转换完成！提取了 {img_count} 张图片"
-                else:
-                    status_msg = "转换完成！未找到图片文件"
-            else:
-                # 清空之前的图片信息
-                self.extracted_images = []
-                self.source_file_path = input_path
-                status_msg = "转换完成！"
+            # 保存提取的图片信息和源文件路径
+            self.extracted_images = result['extracted_images']
+            self.source_file_path = input_path
+            del result
+            
+            # 自动保存到源文件所在目录（图片已提取在该目录）
+            auto_saved_path = None
+            if auto_save:
+                auto_saved_path = default_output_path(input_path)
+                with stats.stage('save'):
+                    save_markdown_file(result_path, auto_saved_path)
+                status_msg += f" | 已自动保存: {os.path.basename(auto_saved_path)}"
+            
+            self.stats_log.add(stats)
             
             # 更新结果显示
             def update_result():
-                self.result_text.delete(1.0, tk.END)
-                self.result_text.insert(1.0, markdown_content)
+                self._set_result_path(result_path, truncated)
+                self.current_stats = stats
                 self.status_var.set(status_msg)
-                self.progress.stop()
-                self.convert_button.config(state=tk.NORMAL)
-                self.save_button.config(state=tk.NORMAL)  # 启用保存按钮
+                self._stop_progress()
+                
+                # 全部插入完成后再启用保存按钮，并记录显示阶段的耗时
+                render_start = time.perf_counter()
+                
+                def on_inserted():
+                    stats.add_stage('render', time.perf_counter() - render_start)
+                    self._on_result_inserted()
+                    self.refresh_stats_window()
+                
+                self._insert_result(preview, on_inserted)
             
             self.root.after(0, update_result)
             
+        except ConversionCancelled:
+            def show_cancelled():
+                self.status_var.set("转换已取消")
+                self._stop_progress()
+            
+            self.root.after(0, show_cancelled)
+            
         except Exception as e:
             error_msg = f"转换失败: {str(e)}"
             print(f"转换错误: {traceback.format_exc()}")
+            self.stats_log.add(stats.fail(e))
+            self.root.after(0, self.refresh_stats_window)
             
             def show_error():
                 self.status_var.set(error_msg)
-                self.progress.stop()
-                self.convert_button.config(state=tk.NORMAL)
+                self._stop_progress()
                 messagebox.showerror("转换错误", error_msg)
             
             self.root.after(0, show_error)
     
+    def _set_result_path(self, path, truncated=False):
+        """记录当前结果的临时文件，并删除上一次的临时文件"""
+        if self.result_path and self.result_path != path:
+            try:
+                os.remove(self.result_path)
+            except OSError:
+                pass
+        self.result_path = path
+        self.result_truncated = truncated
+    
+    def _insert_result(self, text, on_done=None):
+        """分批把文字插入结果显示区，每批之间让出主循环处理界面事件"""
+        self.render_generation += 1
+        generation = self.render_generation
+        self.result_text.config(state=tk.NORMAL)
+        self.result_text.delete(1.0, tk.END)
+        
+        def insert_chunk(offset):
+            # 期间有新结果或已清空时停止插入
+            if generation != self.render_generation:
+                return
+            end = offset + RESULT_CHUNK_CHARS
+            self.result_text.insert(tk.END, text[offset:end])
+            if end < len(text):
+                self.root.after(1, insert_chunk, end)
+            elif on_done:
+                on_done()
+        
+        insert_chunk(0)
+    
+    def _on_result_inserted(self):
+        """结果显示完成：重置修改标记，截断的预览设为只读"""
+        self.result_text.edit_modified(False)
+        if self.result_truncated:
+            self.result_text.config(state=tk.DISABLED)
+        self.save_button.config(state=tk.NORMAL)  # 启用保存按钮
+    
     def save_result(self):
         """保存转换结果"""
-        content = self.result_text.get(1.0, tk.END).strip()
-        
-        if not content:
-            messagebox.showwarning("警告", "没有内容可保存！")
-            return
+        # 文本框未被手动修改时，直接从临时文件保存完整结果，不经过文本框
+        use_buffer = self.result_path and (self.result_truncated or not self.result_text.edit_modified())
+        if use_buffer:
+            content = None
+            if os.path.getsize(self.result_path) == 0:
+                messagebox.showwarning("警告", "没有内容可保存！")
+                return
+        else:
+            content = self.result_text.get(1.0, tk.END).strip()
+            if not content:
+                messagebox.showwarning("警告", "没有内容可保存！")
+                return
         
         # 获取建议的文件名
         input_file = self.file_path_var.get()
@@ -582,40 +642,24 @@ class MarkItDownGUI:
         
         if filename:
             try:
-                # 保存Markdown文件
-                with open(filename, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                
-                saved_files = [filename]
+                # 保存Markdown文件，并把提取的图片复制到新的输出目录
+                save_start = time.perf_counter()
+                if use_buffer:
+                    copied_images = save_markdown_file(self.result_path, filename, self.extracted_images)
+                else:
+                    copied_images = save_markdown(content, filename, self.extracted_images)
+                if self.current_stats is not None:
+                    self.current_stats.add_stage('save', time.perf_counter() - save_start)
+                    self.refresh_stats_window()
                 
-                # 如果有提取的图片，复制图片到新的输出目录
                 if self.extracted_images:
-                    output_dir = os.path.dirname(filename)
-                    images_target_dir = os.path.join(output_dir, "images")
-                    
-                    # 创建图片目录
-                    os.makedirs(images_target_dir, exist_ok=True)
-                    
-                    # 复制图片文件
-                    copied_images = []
-                    for img_info in self.extracted_images:
-                        src_path = img_info['extracted_path']
-                        filename_only = os.path.basename(src_path)
-                        target_path = os.path.join(images_target_dir, filename_only)
-                        
-                        # 如果源文件和目标文件不是同一个，才复制
-                        if os.path.abspath(src_path) != os.path.abspath(target_path):
-                            try:
-                                import shutil
-                                shutil.copy2(src_path, target_path)
-                                copied_images.append(filename_only)
-                                saved_files.append(target_path)
-                            except Exception as copy_error:
-                                print(f"复制图片失败 {src_path}: {copy_error}")
-                    
+                    images_target_dir = os.path.join(os.path.dirname(filename), "images")
                     if copied_images:
                         status_msg = f"已保存: {os.path.basename(filename)} 和 {len(copied_images)} 张图片"
-                        info_msg = f"文件已保存到:\n{filename}\n\n图片已保存到:\n{images_target_dir}\n\n复制的图片: {', '.join(copied_images)}"
+                        copied_names = ', '.join(copied_images[:10])
+                        if len(copied_images) > 10:
+                            copied_names += f" 等 {len(copied_images)} 张"
+                        info_msg = f"文件已保存到:\n{filename}\n\n图片已保存到:\n{images_target_dir}\n\n复制的图片: {copied_names}"
                     else:
                         status_msg = f"已保存: {os.path.basename(filename)} (图片已在目标目录)"
                         info_msg = f"文件已保存到:\n{filename}\n\n图片目录: {images_target_dir}"
@@ -650,13 +694,24 @@ class MarkItDownGUI:
     def clear_all(self):
         """清空所有内容"""
         self.file_path_var.set("")
+        self.render_generation += 1
+        self.result_text.config(state=tk.NORMAL)
         self.result_text.delete(1.0, tk.END)
+        self._set_result_path(None)
         self.save_button.config(state=tk.DISABLED)
         self.status_var.set("准备就绪")
         
         # 清空图片信息
         self.extracted_images = []
         self.source_file_path = ""
+        self.current_stats = None
+    
+    def on_close(self):
+        """关闭主窗口"""
+        self._set_result_path(None)
+        if self.converter is not None:
+            self.converter.stop()
+        self.root.destroy()
     
     def show_about(self):
         """显示关于对话框"""
@@ -725,8 +780,587 @@ class MarkItDownGUI:
         close_button.pack(side=tk.RIGHT)
 
 
+class BatchConvertWindow:
+    """批量转换窗口：多文件队列，使用进程池并行转换"""
+    
+    # 队列中各文件的状态
+    STATUS_PENDING = "等待"
+    STATUS_QUEUED = "排队中"
+    STATUS_DONE = "完成"
+    STATUS_FAILED = "失败"
+    STATUS_CANCELLED = "已取消"
+    
+    def __init__(self, app):
+        self.app = app
+        self.root = app.root
+        
+        self.jobs = {}  # Treeview条目ID -> 任务信息
+        self.executor = None
+        self.running = False
+        self.start_time = 0.0
+        self.done_bytes = 0
+        self.cache_hits = 0
+        self.watch_stop = None  # 监视文件夹时的停止事件
+        
+        self.window = tk.Toplevel(self.root)
+        self.window.title("批量转换")
+        self.window.geometry("800x500")
+        self.window.minsize(600, 400)
+        self.window.protocol("WM_DELETE_WINDOW", self.close)
+        
+        self.create_widgets()
+    
+    def create_widgets(self):
+        """创建批量转换窗口组件"""
+        frame = ttk.Frame(self.window, padding="10")
+        frame.pack(fill=tk.BOTH, expand=True)
+        frame.columnconfigure(0, weight=1)
+        frame.rowconfigure(2, weight=1)
+        
+        # 队列操作按钮
+        toolbar = ttk.Frame(frame)
+        toolbar.grid(row=0, column=0, sticky=(tk.W, tk.E), pady=(0, 10))
+        
+        ttk.Button(toolbar, text="添加文件...", command=self.browse_files).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(toolbar, text="添加文件夹...", command=self.browse_folder).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(toolbar, text="移除所选", command=self.remove_selected).pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Button(toolbar, text="清空列表", command=self.clear_jobs).pack(side=tk.LEFT)
+        ttk.Button(toolbar, text="同步目录...", command=self.sync_folder).pack(side=tk.RIGHT)
+        ttk.Button(toolbar, text="监视文件夹...", command=self.watch_folder).pack(side=tk.RIGHT, padx=(0, 5))
+        
+        # 并行设置和输出目录
+        settings_frame = ttk.Frame(frame)
+        settings_frame.grid(row=1, column=0, sticky=(tk.W, tk.E), pady=(0, 10))
+        settings_frame.columnconfigure(3, weight=1)
+        
+        ttk.Label(settings_frame, text="并行进程数:").grid(row=0, column=0, sticky=tk.W)
+        self.workers_var = tk.IntVar(value=os.cpu_count() or 1)
+        ttk.Spinbox(settings_frame, from_=1, to=max(os.cpu_count() or 1, 1) * 2,
+                    textvariable=self.workers_var, width=5).grid(row=0, column=1, padx=(5, 15))
+        
+        ttk.Label(settings_frame, text="输出目录:").grid(row=0, column=2, sticky=tk.W)
+        self.output_dir_var = tk.StringVar()
+        ttk.Entry(settings_frame, textvariable=self.output_dir_var).grid(
+            row=0, column=3, sticky=(tk.W, tk.E), padx=(5, 5))
+        ttk.Button(settings_frame, text="浏览...", command=self.browse_output_dir).grid(row=0, column=4)
+        ttk.Label(settings_frame, text="（留空则保存到源文件所在目录）",
+                  foreground="gray", font=("Arial", 9)).grid(row=1, column=2, columnspan=3, sticky=tk.W)
+        
+        # 文件队列列表
+        list_frame = ttk.Frame(frame)
+        list_frame.grid(row=2, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        list_frame.columnconfigure(0, weight=1)
+        list_frame.rowconfigure(0, weight=1)
+        
+        columns = ("status", "elapsed", "chars")
+        self.tree = ttk.Treeview(list_frame, columns=columns, selectmode="extended")
+        self.tree.heading("#0", text="文件")
+        self.tree.heading("status", text="状态")
+        self.tree.heading("elapsed", text="耗时")
+        self.tree.heading("chars", text="字符数")
+        self.tree.column("#0", width=420)
+        self.tree.column("status", width=120, anchor=tk.W)
+        self.tree.column("elapsed", width=80, anchor=tk.E)
+        self.tree.column("chars", width=100, anchor=tk.E)
+        self.tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        
+        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        
+        # 进度和吞吐量
+        self.progress = ttk.Progressbar(frame, mode='determinate')
+        self.progress.grid(row=3, column=0, sticky=(tk.W, tk.E), pady=(10, 5))
+        
+        bottom_frame = ttk.Frame(frame)
+        bottom_frame.grid(row=4, column=0, sticky=(tk.W, tk.E))
+        bottom_frame.columnconfigure(0, weight=1)
+        
+        self.throughput_var = tk.StringVar(value="队列为空")
+        ttk.Label(bottom_frame, textvariable=self.throughput_var, anchor=tk.W).grid(
+            row=0, column=0, sticky=(tk.W, tk.E))
+        
+        self.start_button = ttk.Button(bottom_frame, text="开始转换", command=self.start)
+        self.start_button.grid(row=0, column=1, padx=(10, 5))
+        
+        self.cancel_button = ttk.Button(bottom_frame, text="取消", command=self.cancel,
+                                        state=tk.DISABLED)
+        self.cancel_button.grid(row=0, column=2)
+    
+    def browse_files(self):
+        """选择要加入队列的文件"""
+        filenames = filedialog.askopenfilenames(title="选择要批量转换的文件", parent=self.window)
+        if filenames:
+            self.add_paths(filenames)
+    
+    def browse_folder(self):
+        """选择文件夹，递归加入其中所有支持的文件"""
+        folder = filedialog.askdirectory(title="选择要批量转换的文件夹", parent=self.window)
+        if folder:
+            self.add_paths([folder])
+    
+    def browse_output_dir(self):
+        """选择输出目录"""
+        folder = filedialog.askdirectory(title="选择输出目录", parent=self.window)
+        if folder:
+            self.output_dir_var.set(folder)
+    
+    def add_paths(self, paths):
+        """加入文件或文件夹（文件夹会递归查找支持的文件）"""
+        existing = {job['input_path'] for job in self.jobs.values()}
+        
+        for path in paths:
+            path = os.path.abspath(path)
+            # 文件夹中的文件在输出目录中保留相对于该文件夹的子目录结构（与命令行批量转换相同）
+            root = path if os.path.isdir(path) else os.path.dirname(path)
+            for file_path in iter_input_files(path):
+                file_path = os.path.abspath(file_path)
+                if file_path in existing:
+                    continue
+                existing.add(file_path)
+                
+                iid = self.tree.insert("", tk.END, text=file_path,
+                                       values=(self.STATUS_PENDING, "", ""))
+                self.jobs[iid] = {
+                    'input_path': file_path,
+                    'root': root,
+                    'status': self.STATUS_PENDING,
+                    'future': None,
+                }
+        
+        self.update_throughput()
+    
+    def remove_selected(self):
+        """从队列中移除所选文件（正在转换的除外）"""
+        for iid in self.tree.selection():
+            if self.jobs[iid]['status'] != self.STATUS_QUEUED:
+                self.tree.delete(iid)
+                del self.jobs[iid]
+        self.update_throughput()
+    
+    def clear_jobs(self):
+        """清空队列"""
+        if self.running:
+            messagebox.showwarning("警告", "批量转换进行中，无法清空列表", parent=self.window)
+            return
+        self.tree.delete(*self.tree.get_children())
+        self.jobs.clear()
+        self.update_throughput()
+    
+    def _output_path_for(self, job, used_paths):
+        """计算输出文件路径，同一批次内重名时追加序号
+
+        指定输出目录时镜像文件相对于所加入文件夹的子目录结构；未指定时保存到源文件所在目录。
+        """
+        relative = os.path.relpath(job['input_path'], job['root'])
+        base_name = os.path.splitext(relative)[0]
+        output_dir = self.output_dir_var.get().strip() or job['root']
+        
+        output_path = os.path.join(output_dir, f"{base_name}.md")
+        counter = 1
+        while output_path in used_paths:
+            output_path = os.path.join(output_dir, f"{base_name}_{counter}.md")
+            counter += 1
+        used_paths.add(output_path)
+        return output_path
+    
+    def _set_status(self, iid, status, elapsed="", chars="", detail=""):
+        """更新队列中某个文件的状态"""
+        self.jobs[iid]['status'] = status
+        if self.tree.exists(iid):
+            display = f"{status}: {detail}" if detail else status
+            self.tree.item(iid, values=(display, elapsed, chars))
+    
+    def start(self):
+        """将所有等待中的文件提交到进程池"""
+        pending = [iid for iid, job in self.jobs.items()
+                   if job['status'] in (self.STATUS_PENDING, self.STATUS_FAILED, self.STATUS_CANCELLED)]
+        if not pending:
+            messagebox.showinfo("提示", "队列中没有待转换的文件", parent=self.window)
+            return
+        
+        output_dir = self.output_dir_var.get().strip()
+        if output_dir:
+            try:
+                os.makedirs(output_dir, exist_ok=True)
+            except Exception as e:
+                messagebox.showerror("错误", f"无法创建输出目录: {str(e)}", parent=self.window)
+                return
+        
+        try:
+            max_workers = max(1, int(self.workers_var.get()))
+        except (tk.TclError, ValueError):
+            max_workers = os.cpu_count() or 1
+        
+        options = self.app.get_options()
+        self.executor = create_batch_executor(options, max_workers, trace_memory=tracemalloc.is_tracing())
+        
+        self.running = True
+        self.start_time = time.perf_counter()
+        self.done_bytes = 0
+        self.cache_hits = 0
+        self.start_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        
+        used_paths = set()
+        for iid in pending:
+            job = self.jobs[iid]
+            job['output_path'] = self._output_path_for(job, used_paths)
+            future = self.executor.submit(convert_to_file, job['input_path'], job['output_path'], options)
+            job['future'] = future
+            self._set_status(iid, self.STATUS_QUEUED)
+            # 回调在进程池的管理线程中执行，切回主线程更新界面
+            future.add_done_callback(lambda f, iid=iid: self.root.after(0, self._on_job_done, iid, f))
+        
+        self.update_throughput()
+    
+    def _on_job_done(self, iid, future):
+        """单个文件转换结束（主线程）"""
+        if not self.window.winfo_exists():
+            return
+        if iid not in self.jobs or self.jobs[iid]['future'] is not future:
+            return
+        
+        if future.cancelled() or isinstance(future.exception(), ConversionCancelled):
+            self._set_status(iid, self.STATUS_CANCELLED)
+        else:
+            error = future.exception()
+            if error is None:
+                info = future.result()
+                self.app.stats_log.add(ConversionStats.from_dict(info['stats']))
+                self.done_bytes += info['input_bytes']
+                self.cache_hits += info['cache_hit']
+                self._set_status(iid, self.STATUS_DONE, f"{info['elapsed']:.1f}s", f"{info['output_chars']:,}")
+            else:
+                print(f"批量转换失败 {self.jobs[iid]['input_path']}: {error}")
+                self.app.stats_log.add(ConversionStats(self.jobs[iid]['input_path']).fail(error))
+                self._set_status(iid, self.STATUS_FAILED, detail=str(error))
+        
+        self.update_throughput()
+        self.app.refresh_stats_window()
+        
+        if self.running and not any(job['status'] == self.STATUS_QUEUED for job in self.jobs.values()):
+            self._finish()
+    
+    def _finish(self):
+        """所有任务结束，释放进程池"""
+        self.running = False
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        self.start_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
+        self.update_throughput()
+    
+    def cancel(self):
+        """取消尚未开始的任务，并终止正在转换的文件；监视文件夹时停止监视"""
+        if not self.running:
+            return
+        
+        if self.watch_stop is not None:
+            self.watch_stop.set()
+            self.cancel_button.config(state=tk.DISABLED)
+            self.throughput_var.set("正在停止监视...")
+            return
+        
+        for iid, job in self.jobs.items():
+            future = job['future']
+            if job['status'] == self.STATUS_QUEUED and future is not None and future.cancel():
+                self._set_status(iid, self.STATUS_CANCELLED)
+        
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor.cancel_running()
+        
+        self.throughput_var.set("已取消，正在终止转换进程...")
+        if not any(job['status'] == self.STATUS_QUEUED for job in self.jobs.values()):
+            self._finish()
+    
+    def update_throughput(self):
+        """更新进度条和吞吐量显示"""
+        total = len(self.jobs)
+        if not total:
+            self.progress.config(value=0)
+            self.throughput_var.set("队列为空")
+            return
+        
+        finished = sum(1 for job in self.jobs.values()
+                       if job['status'] in (self.STATUS_DONE, self.STATUS_FAILED, self.STATUS_CANCELLED))
+        done = sum(1 for job in self.jobs.values() if job['status'] == self.STATUS_DONE)
+        failed = sum(1 for job in self.jobs.values() if job['status'] == self.STATUS_FAILED)
+        
+        self.progress.config(maximum=total, value=finished)
+        
+        text = f"共 {total} 个文件，完成 {done}，失败 {failed}"
+        if self.start_time and done:
+            elapsed = max(time.perf_counter() - self.start_time, 1e-6)
+            text += f" | {done / elapsed:.2f} 文件/秒，{self.done_bytes / elapsed / (1024 * 1024):.2f} MB/秒"
+            text += f" | 缓存 命中 {self.cache_hits} / 未命中 {done - self.cache_hits}"
+        self.throughput_var.set(text)
+    
+    def sync_folder(self):
+        """增量同步目录：只转换新增或修改过的文件，并删除已不存在的源文件对应的输出"""
+        if self.running:
+            messagebox.showwarning("警告", "批量转换进行中，请稍后再同步", parent=self.window)
+            return
+        
+        source_dir = filedialog.askdirectory(title="选择要同步的源目录", parent=self.window)
+        if not source_dir:
+            return
+        output_dir = self.output_dir_var.get().strip() or filedialog.askdirectory(
+            title="选择Markdown输出目录", parent=self.window)
+        if not output_dir:
+            return
+        
+        try:
+            max_workers = max(1, int(self.workers_var.get()))
+        except (tk.TclError, ValueError):
+            max_workers = os.cpu_count() or 1
+        options = self.app.get_options()
+        
+        self.running = True
+        self.start_button.config(state=tk.DISABLED)
+        self.throughput_var.set(f"正在同步: {source_dir}")
+        
+        converted = [0]
+        trace_memory = tracemalloc.is_tracing()
+        
+        def on_result(input_path, info, error):
+            converted[0] += 1
+            if error is None:
+                self.app.stats_log.add(ConversionStats.from_dict(info['stats']))
+            else:
+                self.app.stats_log.add(ConversionStats(input_path).fail(error))
+            name = os.path.basename(input_path)
+            text = f"正在同步: 已处理 {converted[0]} 个文件（{name}{'' if error is None else ' 失败'}）"
+            self.root.after(0, self.throughput_var.set, text)
+        
+        def worker():
+            try:
+                summary = sync_directory(source_dir, output_dir, options, max_workers, on_result,
+                                         trace_memory=trace_memory)
+                message = (f"同步完成: 转换 {summary['converted']}，未变化 {summary['unchanged']}，"
+                           f"失败 {summary['failed']}，删除 {summary['deleted']}")
+            except Exception as e:
+                print(f"同步错误: {traceback.format_exc()}")
+                message = f"同步失败: {str(e)}"
+            self.root.after(0, self._on_sync_done, message)
+        
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+    
+    def _on_sync_done(self, message):
+        """目录同步结束（主线程）"""
+        self.running = False
+        if self.window.winfo_exists():
+            self.start_button.config(state=tk.NORMAL)
+            self.throughput_var.set(message)
+        self.app.status_var.set(message)
+        self.app.refresh_stats_window()
+    
+    def watch_folder(self):
+        """监视文件夹：新增或修改的文件写入完成后自动转换，点击"取消"停止"""
+        if self.running:
+            messagebox.showwarning("警告", "批量转换进行中，请稍后再监视文件夹", parent=self.window)
+            return
+        
+        source_dir = filedialog.askdirectory(title="选择要监视的文件夹", parent=self.window)
+        if not source_dir:
+            return
+        output_dir = self.output_dir_var.get().strip() or None
+        
+        try:
+            max_workers = max(1, int(self.workers_var.get()))
+        except (tk.TclError, ValueError):
+            max_workers = os.cpu_count() or 1
+        options = self.app.get_options()
+        
+        self.running = True
+        self.watch_stop = threading.Event()
+        self.start_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.throughput_var.set(f"正在监视: {source_dir}")
+        
+        counts = {'converted': 0, 'failed': 0}
+        stop_event = self.watch_stop
+        trace_memory = tracemalloc.is_tracing()
+        
+        def on_result(input_path, info, error):
+            if error is None:
+                counts['converted'] += 1
+                self.app.stats_log.add(ConversionStats.from_dict(info['stats']))
+            else:
+                counts['failed'] += 1
+                self.app.stats_log.add(ConversionStats(input_path).fail(error))
+            name = os.path.basename(input_path)
+            text = (f"正在监视: 转换 {counts['converted']}，失败 {counts['failed']}"
+                    f"（{name}{'' if error is None else ' 失败'}）")
+            self.root.after(0, self.throughput_var.set, text)
+        
+        def worker():
+            try:
+                summary = watch_directory(source_dir, options, output_dir, max_workers, on_result,
+                                          stop_event=stop_event, trace_memory=trace_memory)
+                message = f"已停止监视: 转换 {summary['converted']}，失败 {summary['failed']}"
+            except Exception as e:
+                print(f"监视文件夹错误: {traceback.format_exc()}")
+                message = f"监视文件夹失败: {str(e)}"
+            self.root.after(0, self._on_watch_done, message)
+        
+        thread = threading.Thread(target=worker)
+        thread.daemon = True
+        thread.start()
+    
+    def _on_watch_done(self, message):
+        """监视文件夹结束（主线程）"""
+        self.watch_stop = None
+        self._on_sync_done(message)
+        if self.window.winfo_exists():
+            self.cancel_button.config(state=tk.DISABLED)
+    
+    def close(self):
+        """关闭窗口，如有任务进行中先确认取消"""
+        if self.running:
+            if not messagebox.askyesno("确认", "批量转换进行中，是否取消并关闭？", parent=self.window):
+                return
+            self.cancel()
+        self.window.destroy()
+
+
+class StatsWindow:
+    """转换统计窗口：按格式汇总各阶段耗时，列出最近的转换，可导出为JSON Lines"""
+    
+    # 最近转换列表中显示的条数
+    RECENT_LIMIT = 200
+    
+    def __init__(self, app):
+        self.app = app
+        self.root = app.root
+        
+        self.window = tk.Toplevel(self.root)
+        self.window.title("转换统计")
+        self.window.geometry("900x520")
+        self.window.minsize(700, 400)
+        
+        self.create_widgets()
+        self.refresh()
+    
+    def create_widgets(self):
+        """创建统计窗口组件"""
+        frame = ttk.Frame(self.window, padding="10")
+        frame.pack(fill=tk.BOTH, expand=True)
+        frame.columnconfigure(0, weight=1)
+        frame.rowconfigure(1, weight=1)
+        frame.rowconfigure(3, weight=2)
+        
+        # 按格式汇总
+        ttk.Label(frame, text="按格式汇总（总耗时高的在前）").grid(row=0, column=0, sticky=tk.W)
+        summary_columns = ("count", "failed", "total", "average", "stages", "peak")
+        self.summary_tree = ttk.Treeview(frame, columns=summary_columns, height=6)
+        self.summary_tree.heading("#0", text="格式")
+        self.summary_tree.column("#0", width=80, stretch=False)
+        for column, text, width in (("count", "次数", 50), ("failed", "失败", 50), ("total", "总耗时", 80),
+                                    ("average", "平均耗时", 80), ("stages", "各阶段耗时", 380),
+                                    ("peak", "峰值内存", 80)):
+            self.summary_tree.heading(column, text=text)
+            self.summary_tree.column(column, width=width, stretch=column == "stages")
+        self.summary_tree.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(5, 10))
+        
+        # 最近的转换
+        ttk.Label(frame, text=f"最近的转换（最多显示 {self.RECENT_LIMIT} 条）").grid(row=2, column=0, sticky=tk.W)
+        recent_frame = ttk.Frame(frame)
+        recent_frame.grid(row=3, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(5, 10))
+        recent_frame.columnconfigure(0, weight=1)
+        recent_frame.rowconfigure(0, weight=1)
+        
+        recent_columns = ("status", "size", "chars", "total", "stages")
+        self.recent_tree = ttk.Treeview(recent_frame, columns=recent_columns)
+        self.recent_tree.heading("#0", text="文件")
+        self.recent_tree.column("#0", width=220)
+        for column, text, width in (("status", "状态", 60), ("size", "大小", 80), ("chars", "字符数", 90),
+                                    ("total", "耗时", 70), ("stages", "各阶段耗时", 360)):
+            self.recent_tree.heading(column, text=text)
+            self.recent_tree.column(column, width=width, stretch=column == "stages")
+        self.recent_tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        scrollbar = ttk.Scrollbar(recent_frame, orient=tk.VERTICAL, command=self.recent_tree.yview)
+        scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        self.recent_tree.configure(yscrollcommand=scrollbar.set)
+        
+        # 按钮
+        button_frame = ttk.Frame(frame)
+        button_frame.grid(row=4, column=0, sticky=(tk.W, tk.E))
+        
+        self.trace_memory_var = tk.BooleanVar(value=tracemalloc.is_tracing())
+        ttk.Checkbutton(button_frame, text="记录Python内存分配峰值（tracemalloc，转换会变慢）",
+                        variable=self.trace_memory_var, command=self.toggle_trace_memory).pack(side=tk.LEFT)
+        
+        ttk.Button(button_frame, text="关闭", command=self.window.destroy).pack(side=tk.RIGHT)
+        ttk.Button(button_frame, text="清空", command=self.clear).pack(side=tk.RIGHT, padx=(0, 5))
+        ttk.Button(button_frame, text="导出JSONL...", command=self.export).pack(side=tk.RIGHT, padx=(0, 5))
+    
+    def refresh(self):
+        """重新读取统计并刷新显示"""
+        self.summary_tree.delete(*self.summary_tree.get_children())
+        for item in self.app.stats_log.summary_by_format():
+            peak = f"{item['peak_rss_mb']:.0f} MB" if item['peak_rss_mb'] is not None else "-"
+            self.summary_tree.insert("", tk.END, text=item['format'], values=(
+                item['count'], item['failed'], f"{item['total_seconds']:.2f}s",
+                f"{item['total_seconds'] / item['count']:.2f}s",
+                format_stage_seconds(item['stage_seconds']), peak))
+        
+        self.recent_tree.delete(*self.recent_tree.get_children())
+        for stats in reversed(self.app.stats_log.records()[-self.RECENT_LIMIT:]):
+            stage_seconds = {}
+            for stage in stats.stages:
+                stage_seconds[stage['stage']] = stage_seconds.get(stage['stage'], 0.0) + stage['seconds']
+            status = "完成" if stats.status == 'ok' else "失败"
+            stages = format_stage_seconds(stage_seconds) if stats.error is None else stats.error
+            self.recent_tree.insert("", tk.END, text=os.path.basename(stats.input_path), values=(
+                status, f"{stats.input_bytes / 1024:.0f} KB", f"{stats.output_chars:,}",
+                f"{stats.total_seconds:.2f}s", stages))
+    
+    def toggle_trace_memory(self):
+        """开启或关闭 tracemalloc（对之后开始的转换生效）"""
+        if self.trace_memory_var.get():
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+        elif tracemalloc.is_tracing():
+            tracemalloc.stop()
+    
+    def export(self):
+        """导出统计为JSON Lines文件"""
+        filename = filedialog.asksaveasfilename(
+            title="导出转换统计",
+            defaultextension=".jsonl",
+            initialfile="markitdown_stats.jsonl",
+            filetypes=[("JSON Lines", "*.jsonl"), ("所有文件", "*.*")],
+            parent=self.window
+        )
+        if not filename:
+            return
+        try:
+            count = self.app.stats_log.export_jsonl(filename)
+            messagebox.showinfo("导出成功", f"已导出 {count} 条统计到:\n{filename}", parent=self.window)
+        except OSError as e:
+            messagebox.showerror("导出错误", f"导出统计失败: {str(e)}", parent=self.window)
+    
+    def clear(self):
+        """清空统计"""
+        self.app.stats_log.clear()
+        self.refresh()
+
+
 def main():
     """主函数"""
+    # 打包后的exe中，进程池子进程需要此调用才能正常启动
+    multiprocessing.freeze_support()
+    
+    # 带参数启动时进入命令行模式，例如: MarkItDown-GUI.exe convert 文档目录 -o 输出目录
+    if len(sys.argv) > 1:
+        from markitdown_cli import main as cli_main
+        sys.exit(cli_main(sys.argv[1:]))
+    
     try:
         # 设置magika路径（对于打包后的exe）
         setup_magika_paths()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MarkItDown 图片压缩
+把提取或内联的图片缩小到指定的最长边，并可转换为 WebP/JPEG 重新编码，
+需要 Pillow（通常由 markitdown[all] 安装），未安装时跳过压缩
+"""
+
+import io
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# 可选的输出格式: original 保持原格式（只缩小尺寸）
+IMAGE_FORMATS = ('original', 'webp', 'jpeg')
+
+# 输出格式对应的扩展名和Pillow格式名
+FORMAT_EXTENSIONS = {'webp': '.webp', 'jpeg': '.jpg'}
+PIL_FORMATS = {
+    '.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.gif': 'GIF',
+    '.bmp': 'BMP', '.webp': 'WEBP',
+}
+
+# 不处理的图片（矢量图无需缩放，GIF可能是动图）
+SKIP_EXTENSIONS = {'.svg', '.gif'}
+
+# 压缩图片的并行线程数（Pillow解码、缩放和编码时释放GIL）
+OPTIMIZE_WORKERS = min(8, os.cpu_count() or 1)
+
+_pillow_warning_shown = False
+
+
+def load_pillow():
+    """导入Pillow，未安装时返回None"""
+    global _pillow_warning_shown
+    try:
+        from PIL import Image
+        return Image
+    except ImportError:
+        if not _pillow_warning_shown:
+            print("未安装Pillow，跳过图片压缩（pip install Pillow）")
+            _pillow_warning_shown = True
+        return None
+
+
+class ImageOptimizer:
+    """图片压缩：缩小尺寸并重新编码，结果不比原图小时保留原图"""
+
+    def __init__(self, max_dimension=0, image_format='original', quality=85):
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"不支持的图片格式: {image_format}")
+        self.max_dimension = max_dimension
+        self.image_format = image_format
+        self.quality = quality
+        self.bytes_saved = 0
+
+    @classmethod
+    def from_options(cls, options):
+        """根据转换选项创建，未启用压缩时返回None"""
+        optimizer = cls(options['image_max_dimension'], options['image_format'], options['image_quality'])
+        return optimizer if optimizer.enabled else None
+
+    @property
+    def enabled(self):
+        return bool(self.max_dimension) or self.image_format != 'original'
+
+    def target_extension(self, ext):
+        """压缩后的扩展名"""
+        return FORMAT_EXTENSIONS.get(self.image_format, ext.lower())
+
+    def transcode_bytes(self, data, ext):
+        """压缩内存中的图片，返回 (数据, 扩展名)；无法处理或没有变小时返回原图"""
+        ext = ext.lower()
+        Image = load_pillow() if ext not in SKIP_EXTENSIONS else None
+        if Image is None:
+            return data, ext
+
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                resized = bool(self.max_dimension) and max(image.size) > self.max_dimension
+                target_ext = self.target_extension(ext)
+                if not resized and target_ext == ext:
+                    return data, ext
+
+                image.load()
+                if resized:
+                    image.thumbnail((self.max_dimension, self.max_dimension), Image.LANCZOS)
+
+                pil_format = PIL_FORMATS.get(target_ext)
+                if pil_format is None:
+                    return data, ext
+                if pil_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+                    # JPEG不支持透明通道，以白色为背景合成
+                    rgba = image.convert('RGBA')
+                    image = Image.new('RGB', rgba.size, (255, 255, 255))
+                    image.paste(rgba, mask=rgba.getchannel('A'))
+
+                output = io.BytesIO()
+                save_options = {'optimize': True}
+                if pil_format in ('JPEG', 'WEBP'):
+                    save_options['quality'] = self.quality
+                image.save(output, pil_format, **save_options)
+        except MemoryError:
+            raise  # 超出内存上限时整个文件失败
+        except Exception as e:
+            print(f"压缩图片失败: {e}")
+            return data, ext
+
+        new_data = output.getvalue()
+        if len(new_data) >= len(data):
+            return data, ext
+        return new_data, target_ext
+
+    @property
+    def settings_tag(self):
+        """压缩设置的标记，用于压缩结果的文件名"""
+        return f"m{self.max_dimension}q{self.quality}"
+
+    def optimized_path(self, path, ext=None):
+        """压缩结果的路径：原文件名（含CRC）加压缩设置，扩展名默认为压缩后的扩展名"""
+        base_name, original_ext = os.path.splitext(path)
+        return f"{base_name}-{self.settings_tag}{ext or self.target_extension(original_ext)}"
+
+    def optimize_file(self, path):
+        """压缩磁盘上的图片，返回 (压缩结果的路径, 节省的字节数)
+
+        原文件保持不变（重复提取时按原文件复用），压缩结果写入 optimized_path，
+        已存在时直接复用；没有变小的图片以原扩展名链接一份，下次同样直接复用。
+        """
+        ext = os.path.splitext(path)[1].lower()
+        if ext in SKIP_EXTENSIONS:
+            return path, 0
+
+        original_size = os.path.getsize(path)
+        for candidate in dict.fromkeys((self.optimized_path(path), self.optimized_path(path, ext))):
+            try:
+                return candidate, original_size - os.path.getsize(candidate)
+            except OSError:
+                pass
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        new_data, new_ext = self.transcode_bytes(data, ext)
+        new_path = self.optimized_path(path, new_ext)
+
+        # 先写临时文件再替换，并行的转换进程写同一结果时不会读到写了一半的文件
+        temp_path = f"{new_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            if new_data is data:
+                try:
+                    os.link(path, temp_path)
+                except OSError:
+                    shutil.copyfile(path, temp_path)
+            else:
+                with open(temp_path, 'wb') as f:
+                    f.write(new_data)
+            os.replace(temp_path, new_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return new_path, len(data) - len(new_data)
+
+    def optimize_images(self, images):
+        """在线程池中压缩提取的图片，原地更新图片信息中的路径和文件名，返回节省的字节数"""
+        paths = list(dict.fromkeys(image['extracted_path'] for image in images))
+        if not paths or load_pillow() is None:
+            return 0
+
+        def optimize(path):
+            try:
+                return self.optimize_file(path)
+            except MemoryError:
+                raise
+            except Exception as e:
+                print(f"压缩图片失败 {path}: {e}")
+                return path, 0
+
+        with ThreadPoolExecutor(max_workers=min(OPTIMIZE_WORKERS, len(paths))) as executor:
+            results = dict(zip(paths, executor.map(optimize, paths)))
+
+        saved = 0
+        for new_path, bytes_saved in results.values():
+            saved += bytes_saved
+
+        for image in images:
+            new_path = results[image['extracted_path']][0]
+            if new_path != image['extracted_path']:
+                filename = os.path.basename(new_path)
+                image['extracted_path'] = new_path
+                image['filename'] = filename
+                image['relative_path'] = f"images/{filename}"
+
+        self.bytes_saved += saved
+        return saved
@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MarkItDown 本地HTTP转换服务
+常驻的服务进程共用一个预热的转换进程池，其他程序通过HTTP提交文件、查询或持续接收任务状态，
+并下载Markdown和提取的图片（ZIP），不需要为每个文件重新启动程序
+
+接口:
+    POST   /jobs?filename=book.epub   请求体为文件内容（支持分块传输），返回任务信息（202）
+    GET    /jobs/<id>                 任务状态
+    GET    /jobs/<id>/events          持续输出任务状态（每行一个JSON），任务结束后关闭连接
+    GET    /jobs/<id>/markdown        转换结果
+    GET    /jobs/<id>/assets          提取的图片（ZIP）
+    GET    /jobs/<id>/chunks          分块（JSON Lines，需要 chunk_size 参数或服务的 --chunk-size）
+    DELETE /jobs/<id>                 取消任务并删除其文件（子进程未能及时终止时返回 202，任务结束后删除）
+    GET    /health                    服务状态
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import zipfile
+import tempfile
+import threading
+from concurrent.futures import wait as futures_wait
+from urllib.parse import urlsplit, parse_qs, quote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import markitdown_core
+from markitdown_chunks import check_chunk_options
+from markitdown_worker import ConversionCancelled
+
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# 单个上传文件的默认大小上限（MB）
+DEFAULT_MAX_UPLOAD_MB = 512
+
+# 每个转换进程默认最多排队的任务数，超出时返回 503，由调用方稍后重试
+DEFAULT_QUEUE_PER_WORKER = 4
+
+# 已结束的任务保留多少秒后删除
+DEFAULT_JOB_TTL = 3600
+
+# 上传和下载时每次读写的字节数
+TRANSFER_CHUNK_SIZE = 256 * 1024
+
+# 持续输出任务状态时检查状态的间隔（秒）
+EVENT_POLL_INTERVAL = 0.2
+
+# 删除正在转换的任务时等待子进程终止的最长时间（秒），超时后在任务结束时再删除其文件
+DELETE_WAIT_SECONDS = 2.0
+
+# 提交任务时可以通过查询参数覆盖的转换选项
+JOB_OPTION_KEYS = ('extract_images', 'image_mode', 'base64_max_kb', 'base64_references',
+                   'image_max_dimension', 'image_format', 'image_quality', 'keep_data_uris',
+                   'chunk_size', 'chunk_overlap', 'chunk_unit')
+
+# 任务状态
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_CANCELLED = 'cancelled'
+
+_JOB_PATH_PATTERN = re.compile(r'^/jobs/([0-9a-f]{32})(?:/(events|markdown|assets|chunks))?$')
+
+
+class ServiceBusy(Exception):
+    """排队的任务已达上限"""
+
+
+class UploadTooLarge(Exception):
+    """上传的文件超过大小上限"""
+
+
+class InvalidRequest(Exception):
+    """请求参数不正确"""
+
+
+def parse_job_options(query, base_options):
+    """根据查询参数覆盖转换选项（只允许 JOB_OPTION_KEYS 中的选项），参数不正确时抛出 InvalidRequest"""
+    overrides = {}
+    for key in JOB_OPTION_KEYS:
+        if key not in query:
+            continue
+        value = query[key][-1]
+        default = markitdown_core.DEFAULT_OPTIONS[key]
+        try:
+            if isinstance(default, bool):
+                if value.lower() not in ('1', 'true', 'yes', '0', 'false', 'no'):
+                    raise ValueError(value)
+                overrides[key] = value.lower() in ('1', 'true', 'yes')
+            elif isinstance(default, int):
+                overrides[key] = max(0, int(value))
+            else:
+                overrides[key] = value
+        except ValueError:
+            raise InvalidRequest(f"参数 {key} 的值不正确: {value}") from None
+
+    if overrides.get('image_mode', base_options['image_mode']) not in markitdown_core.IMAGE_MODES:
+        raise InvalidRequest(f"不支持的图片引用方式: {overrides['image_mode']}")
+    if overrides.get('image_format', base_options['image_format']) not in markitdown_core.IMAGE_FORMATS:
+        raise InvalidRequest(f"不支持的图片格式: {overrides['image_format']}")
+    options = dict(base_options, **overrides)
+    try:
+        check_chunk_options(options['chunk_size'], options['chunk_overlap'], options['chunk_unit'])
+    except ValueError as e:
+        raise InvalidRequest(str(e)) from None
+    return options
+
+
+class ConversionJob:
+    """一个转换任务：上传的文件、输出目录和进程池中的 Future"""
+
+    def __init__(self, job_id, filename, job_dir):
+        self.id = job_id
+        self.filename = filename
+        self.job_dir = job_dir
+        self.input_path = os.path.join(job_dir, 'input', filename)
+        self.output_path = os.path.join(job_dir, 'output', os.path.splitext(filename)[0] + '.md')
+        self.input_bytes = 0
+        self.created = time.time()
+        self.finished = None
+        self.future = None
+
+    @property
+    def status(self):
+        future = self.future
+        if future is None or not (future.running() or future.done()):
+            return STATUS_QUEUED
+        if future.running():
+            return STATUS_RUNNING
+        if future.cancelled() or isinstance(future.exception(), ConversionCancelled):
+            return STATUS_CANCELLED
+        return STATUS_FAILED if future.exception() is not None else STATUS_DONE
+
+    def to_dict(self):
+        """任务信息（用于JSON响应）"""
+        status = self.status
+        data = {
+            'id': self.id,
+            'filename': self.filename,
+            'status': status,
+            'input_bytes': self.input_bytes,
+            'created': round(self.created, 3),
+        }
+        if status == STATUS_DONE:
+            info = self.future.result()
+            data.update({
+                'output_chars': info['output_chars'],
+                'images': len(info['image_files']),
+                'cache_hit': info['cache_hit'],
+                'elapsed': round(info['elapsed'], 3),
+                'stats': info['stats'],
+                'markdown_url': f"/jobs/{self.id}/markdown",
+                'assets_url': f"/jobs/{self.id}/assets",
+            })
+            if info['chunks_path']:
+                data.update(chunks=info['chunks'], chunks_url=f"/jobs/{self.id}/chunks")
+        elif status == STATUS_FAILED:
+            data['error'] = str(self.future.exception())
+        return data
+
+
+class ConversionService:
+    """转换服务：保存上传的文件，提交到共享的转换进程池，按时间清理已结束的任务"""
+
+    def __init__(self, options, max_workers=None, max_queue=None, max_upload_bytes=DEFAULT_MAX_UPLOAD_MB * 1024 * 1024,
+                 job_ttl=DEFAULT_JOB_TTL, work_dir=None):
+        self.options = options
+        self.executor = markitdown_core.create_batch_executor(options, max_workers)
+        self.executor.start()
+        self.max_queue = max_queue or self.executor.max_workers * DEFAULT_QUEUE_PER_WORKER
+        self.max_upload_bytes = max_upload_bytes
+        self.job_ttl = job_ttl
+        self._own_work_dir = work_dir is None
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix='markitdown-serve-')
+        self.jobs = {}
+        self._uploading = 0  # 正在上传的任务（已占用排队名额）
+        self._lock = threading.Lock()
+
+    def _active_locked(self):
+        return self._uploading + sum(1 for job in self.jobs.values() if not job.future.done())
+
+    def active_count(self):
+        """排队中和正在转换的任务数（包括正在上传的）"""
+        with self._lock:
+            return self._active_locked()
+
+    def create_job(self, filename, read_body, job_options):
+        """保存上传的文件并提交转换，返回 ConversionJob
+
+        read_body(最多字节数) 每次返回一块请求体，结束时返回空字节串。
+        排队已满时抛出 ServiceBusy，超过大小上限时抛出 UploadTooLarge。
+        """
+        filename = os.path.basename(filename.replace('\\', '/')).strip()
+        if not filename or filename.startswith('.'):
+            raise InvalidRequest("缺少文件名（查询参数 filename 或请求头 X-Filename）")
+        if not filename.lower().endswith(markitdown_core.SUPPORTED_EXTENSIONS):
+            raise InvalidRequest(f"不支持的文件类型: {filename}")
+
+        self.cleanup()
+        with self._lock:
+            if self._active_locked() >= self.max_queue:
+                raise ServiceBusy(f"排队的任务已达上限（{self.max_queue}），请稍后重试")
+            self._uploading += 1
+
+        job_id = uuid.uuid4().hex
+        job = ConversionJob(job_id, filename, os.path.join(self.work_dir, job_id))
+        try:
+            os.makedirs(os.path.dirname(job.input_path))
+            os.makedirs(os.path.dirname(job.output_path))
+            with open(job.input_path, 'wb') as f:
+                while True:
+                    chunk = read_body(TRANSFER_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    job.input_bytes += len(chunk)
+                    if job.input_bytes > self.max_upload_bytes:
+                        raise UploadTooLarge(f"文件超过大小上限（{markitdown_core.format_bytes(self.max_upload_bytes)}）")
+                    f.write(chunk)
+
+            job.future = self.executor.submit(markitdown_core.convert_to_file, job.input_path,
+                                              job.output_path, job_options, job.filename)
+            job.future.add_done_callback(lambda _future: setattr(job, 'finished', time.time()))
+            with self._lock:
+                self.jobs[job_id] = job
+            return job
+        except BaseException:
+            shutil.rmtree(job.job_dir, ignore_errors=True)
+            raise
+        finally:
+            with self._lock:
+                self._uploading -= 1
+
+    def get(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def delete(self, job_id):
+        """取消任务（如果尚未结束）并删除其文件
+
+        任务不存在时返回None；文件已删除时返回True；任务在 DELETE_WAIT_SECONDS 内仍未结束时
+        返回False，其文件在任务结束时删除（不阻塞请求线程）。
+        """
+        with self._lock:
+            job = self.jobs.pop(job_id, None)
+        if job is None:
+            return None
+        if job.future is not None and not job.future.done():
+            self.executor.cancel(job.future)
+            # 等待子进程被终止后再删除文件
+            futures_wait([job.future], timeout=DELETE_WAIT_SECONDS)
+            if not job.future.done():
+                job.future.add_done_callback(lambda _future: shutil.rmtree(job.job_dir, ignore_errors=True))
+                return False
+        shutil.rmtree(job.job_dir, ignore_errors=True)
+        return True
+
+    def cleanup(self):
+        """删除结束超过 job_ttl 秒的任务"""
+        deadline = time.time() - self.job_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self.jobs.items()
+                       if job.finished is not None and job.finished < deadline]
+        for job_id in expired:
+            self.delete(job_id)
+
+    def write_assets(self, job, target):
+        """把任务提取的图片写入ZIP（路径相对于Markdown文件，例如 images/cover.png）"""
+        output_dir = os.path.dirname(job.output_path)
+        with zipfile.ZipFile(target, 'w', zipfile.ZIP_STORED) as archive:
+            for image_path in job.future.result()['image_files']:
+                if os.path.exists(image_path):
+                    archive.write(image_path, os.path.relpath(image_path, output_dir).replace(os.sep, '/'))
+
+    def close(self):
+        """停止进程池，删除临时工作目录"""
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.executor.cancel_running()
+        self.executor.shutdown(wait=True)
+        if self._own_work_dir:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+class ConversionRequestHandler(BaseHTTPRequestHandler):
+    """HTTP请求处理：每个连接一个线程，转换在共享的进程池中进行"""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'MarkItDownGUI'
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, data, headers=None):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error_json(self, status, message, headers=None):
+        self._send_json(status, {'error': message}, headers)
+
+    def _send_file(self, path, content_type, download_name):
+        size = os.path.getsize(path)
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(size))
+        self.send_header('Content-Disposition', f"attachment; filename*=UTF-8''{quote(download_name, safe='')}")
+        self.end_headers()
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, self.wfile, TRANSFER_CHUNK_SIZE)
+
+    def _body_reader(self):
+        """返回按块读取请求体的函数（支持 Content-Length 和分块传输）"""
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            state = {'remaining': 0, 'done': False}
+
+            def read_chunked(size):
+                if state['done']:
+                    return b''
+                if state['remaining'] == 0:
+                    line = self.rfile.readline(65537)
+                    try:
+                        state['remaining'] = int(line.split(b';', 1)[0].strip(), 16)
+                    except ValueError:
+                        raise InvalidRequest("分块传输格式不正确") from None
+                    if state['remaining'] == 0:
+                        # 跳过可能存在的尾部字段，直到空行
+                        while self.rfile.readline(65537) not in (b'\r\n', b'\n', b''):
+                            pass
+                        state['done'] = True
+                        return b''
+                data = self.rfile.read(min(size, state['remaining']))
+                if not data:
+                    raise InvalidRequest("请求体不完整")
+                state['remaining'] -= len(data)
+                if state['remaining'] == 0:
+                    self.rfile.readline(3)  # 块后的换行
+                return data
+
+            return read_chunked
+
+        try:
+            remaining = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            raise InvalidRequest("缺少 Content-Length 或分块传输") from None
+        if remaining > self.service.max_upload_bytes:
+            raise UploadTooLarge(f"文件超过大小上限（{markitdown_core.format_bytes(self.service.max_upload_bytes)}）")
+
+        def read_length(size):
+            nonlocal remaining
+            if remaining <= 0:
+                return b''
+            data = self.rfile.read(min(size, remaining))
+            if not data:
+                raise InvalidRequest("请求体不完整")
+            remaining -= len(data)
+            return data
+
+        return read_length
+
+    def handle_expect_100(self):
+        # 客户端发送 Expect: 100-continue 时，先检查大小和排队，拒绝时客户端不必上传文件
+        try:
+            length = int(self.headers.get('Content-Length', '0'))
+        except ValueError:
+            length = 0
+        if length > self.service.max_upload_bytes:
+            self.close_connection = True
+            self._send_error_json(413, f"文件超过大小上限（{markitdown_core.format_bytes(self.service.max_upload_bytes)}）",
+                                  {'Connection': 'close'})
+            return False
+        if self.service.active_count() >= self.service.max_queue:
+            self.close_connection = True
+            self._send_error_json(503, f"排队的任务已达上限（{self.service.max_queue}），请稍后重试",
+                                  {'Retry-After': '5', 'Connection': 'close'})
+            return False
+        return super().handle_expect_100()
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != '/jobs':
+            self.close_connection = True
+            self._send_error_json(404, "不存在的接口")
+            return
+
+        query = parse_qs(url.query)
+        filename = query.get('filename', [self.headers.get('X-Filename', '')])[-1]
+        try:
+            job_options = parse_job_options(query, self.service.options)
+            job = self.service.create_job(filename, self._body_reader(), job_options)
+        except (InvalidRequest, UploadTooLarge, ServiceBusy) as e:
+            # 请求体可能没有读完，不能继续使用这个连接
+            self.close_connection = True
+            try:
+                if isinstance(e, ServiceBusy):
+                    self._send_error_json(503, str(e), {'Retry-After': '5', 'Connection': 'close'})
+                else:
+                    self._send_error_json(413 if isinstance(e, UploadTooLarge) else 400, str(e),
+                                          {'Connection': 'close'})
+            except OSError:
+                pass  # 客户端已断开
+            return
+
+        self._send_json(202, job.to_dict(), {'Location': f"/jobs/{job.id}"})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/health':
+            executor = self.service.executor
+            self._send_json(200, {'status': 'ok', 'workers': executor.max_workers,
+                                  'active': self.service.active_count(), 'max_queue': self.service.max_queue})
+            return
+
+        match = _JOB_PATH_PATTERN.match(url.path)
+        job = self.service.get(match.group(1)) if match else None
+        if job is None:
+            self._send_error_json(404, "任务不存在")
+            return
+
+        resource = match.group(2)
+        if resource is None:
+            self._send_json(200, job.to_dict())
+        elif resource == 'events':
+            self._stream_events(job)
+        elif job.status != STATUS_DONE:
+            self._send_error_json(409, f"任务尚未完成（{job.status}）")
+        elif resource == 'markdown':
+            self._send_file(job.output_path, 'text/markdown; charset=utf-8', os.path.basename(job.output_path))
+        elif resource == 'chunks':
+            chunks_path = job.future.result()['chunks_path']
+            if chunks_path is None:
+                self._send_error_json(404, "任务没有输出分块（需要 chunk_size 参数）")
+            else:
+                self._send_file(chunks_path, 'application/x-ndjson; charset=utf-8', os.path.basename(chunks_path))
+        else:
+            with tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024, dir=self.service.work_dir) as archive:
+                self.service.write_assets(job, archive)
+                size = archive.tell()
+                archive.seek(0)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/zip')
+                self.send_header('Content-Length', str(size))
+                download_name = os.path.splitext(job.filename)[0] + '-assets.zip'
+                self.send_header('Content-Disposition', f"attachment; filename*=UTF-8''{quote(download_name, safe='')}")
+                self.end_headers()
+                shutil.copyfileobj(archive, self.wfile, TRANSFER_CHUNK_SIZE)
+
+    def _stream_events(self, job):
+        """状态变化时输出一行JSON，任务结束后关闭连接"""
+        self.close_connection = True
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson; charset=utf-8')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+
+        last_status = None
+        while True:
+            status = job.status
+            if status != last_status:
+                line = json.dumps(job.to_dict(), ensure_ascii=False) + '\n'
+                try:
+                    self.wfile.write(line.encode('utf-8'))
+                    self.wfile.flush()
+                except OSError:
+                    return  # 客户端已断开
+                last_status = status
+            if status not in (STATUS_QUEUED, STATUS_RUNNING):
+                return
+            time.sleep(EVENT_POLL_INTERVAL)
+
+    def do_DELETE(self):
+        match = _JOB_PATH_PATTERN.match(urlsplit(self.path).path)
+        deleted = None if match is None or match.group(2) is not None else self.service.delete(match.group(1))
+        if deleted is None:
+            self._send_error_json(404, "任务不存在")
+        elif deleted:
+            self._send_json(200, {'id': match.group(1), 'deleted': True})
+        else:
+            # 任务正在终止，文件在其结束后删除
+            self._send_json(202, {'id': match.group(1), 'deleted': False, 'status': 'cancelling'})
+
+
+def create_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT, quiet=False):
+    """创建HTTP服务（尚未开始处理请求）"""
+    server = ThreadingHTTPServer((host, port), ConversionRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    server.quiet = quiet
+    return server
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MarkItDown 转换统计
+记录每次转换各阶段（转换、提取图片、处理图片引用、显示、保存）的耗时和内存，
+按文件格式汇总，并可导出为 JSON Lines，用于找出最慢的格式和转换器
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import contextlib
+import tracemalloc
+from collections import deque
+
+
+# 各阶段的显示名称（按流水线顺序）
+STAGE_NAMES = {
+    'cache': '检查缓存',
+    'convert': '转换',
+    'extract_images': '提取图片',
+    'optimize_images': '压缩图片',
+    'rewrite_refs': '处理图片引用',
+    'write_result': '写入结果',
+    'render': '显示结果',
+    'save': '保存',
+    'chunk': '分块',
+}
+
+# 内存中保留的统计条数
+STATS_HISTORY_SIZE = 1000
+
+_MB = 1024 * 1024
+
+
+def reset_peak_rss():
+    """把进程的峰值常驻内存重置为当前值（仅 Linux，写入 /proc/self/clear_refs），返回是否成功"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_bytes():
+    """当前进程的峰值常驻内存（字节），无法获取时返回None
+
+    Linux 上读取 /proc/self/status 的 VmHWM，reset_peak_rss() 之后为重置以来的峰值；
+    其他平台为进程启动以来的峰值。
+    """
+    try:
+        if sys.platform.startswith('linux'):
+            with open('/proc/self/status', 'rb') as f:
+                for line in f:
+                    if line.startswith(b'VmHWM:'):
+                        return int(line.split()[1]) * 1024
+
+        if sys.platform == 'win32':
+            import ctypes
+            from ctypes import wintypes
+
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [
+                    ('cb', wintypes.DWORD),
+                    ('PageFaultCount', wintypes.DWORD),
+                    ('PeakWorkingSetSize', ctypes.c_size_t),
+                    ('WorkingSetSize', ctypes.c_size_t),
+                    ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                    ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                    ('PagefileUsage', ctypes.c_size_t),
+                    ('PeakPagefileUsage', ctypes.c_size_t),
+                ]
+
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            process = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+                return counters.PeakWorkingSetSize
+            return None
+
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 以KB为单位，macOS 以字节为单位
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except Exception:
+        return None
+
+
+def _to_mb(size):
+    return None if size is None else round(size / _MB, 2)
+
+
+class ConversionStats:
+    """一次转换的统计：输入大小、输出字符数和各阶段的耗时、内存"""
+
+    def __init__(self, input_path):
+        self.input_path = input_path
+        self.format = os.path.splitext(input_path)[1].lower() or '(无扩展名)'
+        try:
+            self.input_bytes = os.path.getsize(input_path)
+        except OSError:
+            self.input_bytes = 0
+        self.output_chars = 0
+        self.cache_hit = False
+        self.images = 0
+        self.status = 'ok'
+        self.error = None
+        self.started_at = time.time()
+        self.stages = []
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """统计一个阶段的耗时和峰值内存；启用 tracemalloc 时同时记录该阶段的Python内存分配峰值
+
+        转换进程常驻并依次转换多个文件，峰值内存在阶段开始时重置，只反映本阶段；
+        无法重置时（非 Linux）记为 process_peak_rss_mb，是进程启动以来的峰值，不按格式汇总。
+        """
+        rss_reset = reset_peak_rss()
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = {
+                'stage': name,
+                'seconds': round(time.perf_counter() - start_time, 6),
+                'peak_rss_mb' if rss_reset else 'process_peak_rss_mb': _to_mb(peak_rss_bytes()),
+            }
+            if tracing:
+                record['traced_peak_mb'] = _to_mb(tracemalloc.get_traced_memory()[1])
+            self.stages.append(record)
+
+    def add_stage(self, name, seconds):
+        """记录一个已在别处计时的阶段（例如界面中分批完成的显示），峰值内存为进程启动以来的值"""
+        self.stages.append({
+            'stage': name,
+            'seconds': round(seconds, 6),
+            'process_peak_rss_mb': _to_mb(peak_rss_bytes()),
+        })
+
+    def fail(self, error):
+        """标记转换失败"""
+        self.status = 'failed'
+        self.error = str(error)
+        return self
+
+    @property
+    def total_seconds(self):
+        return sum(stage['seconds'] for stage in self.stages)
+
+    def to_dict(self):
+        """转换为可序列化的字典（一行JSON）"""
+        return {
+            'input_path': self.input_path,
+            'format': self.format,
+            'input_bytes': self.input_bytes,
+            'output_chars': self.output_chars,
+            'cache_hit': self.cache_hit,
+            'images': self.images,
+            'status': self.status,
+            'error': self.error,
+            'started_at': round(self.started_at, 3),
+            'total_seconds': round(self.total_seconds, 6),
+            'stages': list(self.stages),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """从 to_dict 的结果恢复（例如批量转换子进程返回的统计）"""
+        stats = cls.__new__(cls)
+        stats.input_path = data['input_path']
+        stats.format = data['format']
+        stats.input_bytes = data['input_bytes']
+        stats.output_chars = data['output_chars']
+        stats.cache_hit = data['cache_hit']
+        stats.images = data.get('images', 0)
+        stats.status = data['status']
+        stats.error = data.get('error')
+        stats.started_at = data['started_at']
+        stats.stages = list(data['stages'])
+        return stats
+
+
+def append_jsonl(path, record):
+    """向JSON Lines文件追加一条记录"""
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+class StatsLog:
+    """最近的转换统计（线程安全）
+
+    传入 jsonl_path 时每条统计加入后立即追加到该文件。
+    """
+
+    def __init__(self, max_records=STATS_HISTORY_SIZE, jsonl_path=None):
+        self._records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+        self.jsonl_path = jsonl_path
+
+    def add(self, stats):
+        """加入一条统计（ConversionStats），返回该统计"""
+        with self._lock:
+            self._records.append(stats)
+        if self.jsonl_path:
+            try:
+                append_jsonl(self.jsonl_path, stats.to_dict())
+            except OSError as e:
+                print(f"写入统计文件失败: {e}")
+        return stats
+
+    def records(self):
+        with self._lock:
+            return list(self._records)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+    def export_jsonl(self, path):
+        """把当前保存的统计全部导出为JSON Lines，返回条数"""
+        records = self.records()
+        with open(path, 'w', encoding='utf-8') as f:
+            for stats in records:
+                f.write(json.dumps(stats.to_dict(), ensure_ascii=False) + '\n')
+        return len(records)
+
+    def summary_by_format(self):
+        """按文件格式汇总，返回按总耗时从高到低排序的字典列表
+
+        每项包含 format、count、failed、input_bytes、total_seconds、
+        stage_seconds（各阶段总耗时）和 peak_rss_mb（各阶段峰值内存的最大值，
+        不含无法重置峰值时记录的 process_peak_rss_mb）。
+        """
+        summary = {}
+        for stats in self.records():
+            item = summary.setdefault(stats.format, {
+                'format': stats.format, 'count': 0, 'failed': 0, 'input_bytes': 0,
+                'total_seconds': 0.0, 'stage_seconds': {}, 'peak_rss_mb': None,
+            })
+            item['count'] += 1
+            item['failed'] += stats.status != 'ok'
+            item['input_bytes'] += stats.input_bytes
+            for stage in stats.stages:
+                item['total_seconds'] += stage['seconds']
+                item['stage_seconds'][stage['stage']] = \
+                    item['stage_seconds'].get(stage['stage'], 0.0) + stage['seconds']
+                if stage.get('peak_rss_mb') is not None:
+                    item['peak_rss_mb'] = max(item['peak_rss_mb'] or 0, stage['peak_rss_mb'])
+
+        return sorted(summary.values(), key=lambda item: item['total_seconds'], reverse=True)
+
+
+def format_stage_seconds(stage_seconds):
+    """把各阶段耗时格式化为一行文字（按流水线顺序）"""
+    names = list(STAGE_NAMES) + [name for name in stage_seconds if name not in STAGE_NAMES]
+    return "，".join(f"{STAGE_NAMES.get(name, name)} {stage_seconds[name]:.2f}s"
+                    for name in names if name in stage_seconds)
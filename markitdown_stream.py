@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MarkItDown 大文件流式转换
+大的纯文本、CSV、JSON 和 XML 文件分块读取，边读边把Markdown写入输出文件，
+内存占用与文件大小无关，并按已读取的字节数报告进度；输出与MarkItDown的转换结果一致
+"""
+
+import os
+import re
+import csv
+import codecs
+
+
+# 可以流式转换的文件扩展名（MarkItDown 对 .json 和普通 .xml 原样输出文本，对 .csv 输出表格）
+STREAM_EXTENSIONS = ('.txt', '.csv', '.json', '.xml')
+
+# 每次读取的字符数
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# CSV每隔多少行检查一次读取位置（报告进度）
+CSV_CHECK_ROWS = 1024
+
+# 检测编码时读取的字节数
+ENCODING_SAMPLE_SIZE = 1024 * 1024
+
+# 判断XML是否是RSS/Atom订阅时读取的字节数（订阅仍由MarkItDown转换）
+FEED_SNIFF_SIZE = 4096
+FEED_ROOT_PATTERN = re.compile(rb'<(?:[\w-]+:)?(?:rss|feed|rdf:RDF)[\s>]')
+
+# 表格单元格中的竖线及其前面的反斜杠（与MarkItDown的转义方式一致）
+_PIPE_ESCAPE_PATTERN = re.compile(r"(?<!\\)(\\*)\|")
+
+# 字节顺序标记对应的编码
+_BOM_ENCODINGS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+
+def can_stream(input_path, threshold_bytes):
+    """文件是否走流式转换：扩展名支持、不小于 threshold_bytes（0 表示不使用流式转换），且不是RSS/Atom订阅"""
+    ext = os.path.splitext(input_path)[1].lower()
+    if not threshold_bytes or ext not in STREAM_EXTENSIONS:
+        return False
+
+    try:
+        if os.path.getsize(input_path) < threshold_bytes:
+            return False
+        if ext == '.xml':
+            with open(input_path, 'rb') as f:
+                return FEED_ROOT_PATTERN.search(f.read(FEED_SNIFF_SIZE)) is None
+    except OSError:
+        return False
+    return True
+
+
+def detect_encoding(input_path):
+    """根据开头的字节检测文件编码：字节顺序标记、UTF-8，否则使用 charset_normalizer 的猜测"""
+    with open(input_path, 'rb') as f:
+        sample = f.read(ENCODING_SAMPLE_SIZE)
+
+    for bom, encoding in _BOM_ENCODINGS:
+        if sample.startswith(bom):
+            return encoding
+
+    try:
+        # 样本末尾可能截断了一个多字节字符，用增量解码器忽略不完整的结尾
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+
+    try:
+        from charset_normalizer import from_bytes
+        detected = from_bytes(sample).best()
+        if detected is not None:
+            return detected.encoding
+    except ImportError:
+        pass
+    return 'utf-8'
+
+
+def escape_table_cell(value):
+    """转义表格单元格中的竖线，换行合并为空格"""
+    value = _PIPE_ESCAPE_PATTERN.sub(lambda m: m.group(1) * 2 + r"\|", value)
+    return value.replace("\r\n", " ").replace("\n", " ").replace("\r", " ")
+
+
+def _needs_escape(text):
+    return '|' in text or '\n' in text or '\r' in text
+
+
+def _table_row(cells):
+    # 大多数行不含需要转义的字符，整行检查一次即可
+    if _needs_escape("".join(cells)):
+        cells = [escape_table_cell(cell) if _needs_escape(cell) else cell for cell in cells]
+    return "| " + " | ".join(cells) + " |"
+
+
+def iter_text_markdown(source):
+    """纯文本、JSON 和 XML：原样分块输出"""
+    while True:
+        chunk = source.read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+def csv_column_count(rows):
+    """第一遍扫描：最宽一行的列数（MarkItDown把所有行补齐到该列数）"""
+    return max((len(row) for row in rows), default=0)
+
+
+def iter_csv_markdown(rows, num_columns):
+    """CSV：逐行输出表格行，去掉开头、结尾和表头后紧接的空行"""
+    header_written = False
+    after_header = False
+    pending_blank = 0  # 尚未确定是否在结尾的空行
+
+    for row in rows:
+        if not row:
+            if header_written and not after_header:
+                pending_blank += 1
+            continue
+
+        row.extend([""] * (num_columns - len(row)))
+        if not header_written:
+            yield _table_row(row)
+            yield "\n" + _table_row(["---"] * num_columns)
+            header_written = after_header = True
+            continue
+
+        after_header = False
+        for _ in range(pending_blank):
+            yield "\n" + _table_row([""] * num_columns)
+        pending_blank = 0
+        yield "\n" + _table_row(row)
+
+
+def stream_convert(input_path, output_path, progress=None):
+    """流式转换 input_path 并写入 output_path，返回写入的字符数
+
+    progress(文字, 完成比例) 在完成的百分比变化时调用。
+    CSV需要先扫描一遍确定列数，进度中两遍各占一半。
+    """
+    total_bytes = max(os.path.getsize(input_path), 1)
+    encoding = detect_encoding(input_path)
+    is_csv = input_path.lower().endswith('.csv')
+    passes = 2 if is_csv else 1
+    last_percent = -1
+
+    def tracked(items, source, pass_index, check_every=1):
+        """逐项返回 items，每读取约一个块的字节时报告一次进度
+
+        check_every 为每隔多少项检查一次读取位置（CSV逐行返回，不必每行都检查）。
+        """
+        nonlocal last_percent
+        next_check = STREAM_CHUNK_SIZE
+        for count, item in enumerate(items):
+            yield item
+            if progress is None or count % check_every or source.buffer.tell() < next_check:
+                continue
+            next_check = source.buffer.tell() + STREAM_CHUNK_SIZE
+            fraction = min(1.0, (pass_index + source.buffer.tell() / total_bytes) / passes)
+            if int(fraction * 100) != last_percent:
+                last_percent = int(fraction * 100)
+                progress(f"正在流式转换... {last_percent}%", fraction)
+
+    def open_source():
+        source = open(input_path, 'r', encoding=encoding, errors='replace', newline='')
+        if is_csv and source.read(1) != '\ufeff':
+            # 与MarkItDown一致，去掉Excel等工具在开头写入的BOM
+            source.seek(0)
+        return source
+
+    num_columns = 0
+    if is_csv:
+        with open_source() as source:
+            num_columns = csv_column_count(tracked(csv.reader(source), source, 0, CSV_CHECK_ROWS))
+
+    written = 0
+    with open_source() as source, open(output_path, 'w', encoding='utf-8') as output:
+        if is_csv:
+            parts = iter_csv_markdown(tracked(csv.reader(source), source, 1, CSV_CHECK_ROWS), num_columns)
+        else:
+            parts = tracked(iter_text_markdown(source), source, 0)
+
+        for part in parts:
+            output.write(part)
+            written += len(part)
+
+    if progress is not None:
+        progress("正在流式转换... 100%", 1.0)
+    return written
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MarkItDown 目录同步
+把源目录镜像转换为Markdown目录，用清单文件记录每个文件的状态，
+再次运行时只转换新增或修改过的文件，并删除源文件已不存在的输出
+"""
+
+import os
+import json
+import tempfile
+
+import markitdown_core
+from markitdown_chunks import chunks_path_for
+from markitdown_cache import hash_file
+
+
+# 清单文件名（保存在输出目录中）
+MANIFEST_NAME = ".markitdown-sync.json"
+MANIFEST_VERSION = 1
+
+# 影响输出内容的选项，变化后需要全部重新转换
+SYNC_KEY_OPTIONS = ('extract_images', 'image_mode', 'base64_max_kb', 'base64_references',
+                    'image_max_dimension', 'image_format', 'image_quality',
+                    'keep_data_uris', 'use_plugins', 'chunk_size', 'chunk_overlap', 'chunk_unit')
+
+# 每完成多少个文件保存一次清单，中途中断时已完成的部分不会丢失
+MANIFEST_SAVE_INTERVAL = 50
+
+
+def load_manifest(manifest_path):
+    """读取清单文件，不存在或损坏时返回空清单"""
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('version') == MANIFEST_VERSION:
+            return manifest
+        print(f"清单版本不兼容，将重新同步: {manifest_path}")
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        print(f"读取同步清单失败，将重新同步: {e}")
+
+    return {'version': MANIFEST_VERSION, 'options': {}, 'files': {}}
+
+
+def save_manifest(manifest_path, manifest):
+    """保存清单文件（先写临时文件再替换）"""
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    os.makedirs(manifest_dir, exist_ok=True)
+
+    fd, temp_path = tempfile.mkstemp(dir=manifest_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(temp_path, manifest_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _remove_file(path):
+    """删除文件，不存在时忽略，返回是否删除"""
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+    except OSError as e:
+        print(f"删除文件失败 {path}: {e}")
+        return False
+
+
+def sync_directory(source_dir, output_dir, options, max_workers=None, on_result=None,
+                   delete_orphans=True, manifest_path=None, trace_memory=False):
+    """同步转换目录，返回统计字典
+
+    on_result(输入文件, 结果字典, 异常) 在每个文件转换结束时调用。
+    """
+    source_dir = os.path.abspath(source_dir)
+    output_dir = os.path.abspath(output_dir)
+    manifest_path = manifest_path or os.path.join(output_dir, MANIFEST_NAME)
+
+    manifest = load_manifest(manifest_path)
+    entries = manifest['files']
+
+    # 转换选项变化后，之前的输出全部视为过期
+    key_options = {name: options[name] for name in SYNC_KEY_OPTIONS}
+    options_changed = manifest.get('options') != key_options
+    manifest['source_dir'] = source_dir
+    manifest['options'] = key_options
+
+    summary = {'converted': 0, 'unchanged': 0, 'failed': 0, 'deleted': 0}
+
+    # 已分配的输出路径（已有条目保持原来的输出路径，新文件避开它们）
+    used_outputs = {entry['output'] for entry in entries.values()}
+
+    jobs = []
+    pending = {}  # 输入文件 -> (相对路径, 文件状态, 内容哈希)
+    seen = set()
+    stale_images = set()  # 重新转换后不再使用的图片
+
+    for input_path in markitdown_core.iter_input_files(source_dir):
+        # 输出目录位于源目录内时，跳过输出目录（例如提取的图片）
+        if os.path.commonpath([input_path, output_dir]) == output_dir:
+            continue
+
+        relative = os.path.relpath(input_path, source_dir).replace(os.sep, '/')
+        seen.add(relative)
+
+        try:
+            stat = os.stat(input_path)
+        except OSError as e:
+            print(f"读取文件信息失败 {input_path}: {e}")
+            continue
+
+        entry = entries.get(relative)
+        output_path = os.path.join(output_dir, entry['output']) if entry else None
+        up_to_date = (
+            entry is not None
+            and not options_changed
+            and entry.get('status') == 'ok'
+            and os.path.exists(output_path)
+        )
+
+        content_hash = None
+        if up_to_date and (entry['mtime'] != stat.st_mtime or entry['size'] != stat.st_size):
+            # 修改时间变了但内容可能没变（例如重新复制），比较内容哈希
+            try:
+                content_hash = hash_file(input_path)
+            except OSError as e:
+                print(f"读取文件失败 {input_path}: {e}")
+                continue
+            up_to_date = entry['size'] == stat.st_size and entry.get('hash') == content_hash
+            if up_to_date:
+                entry['mtime'] = stat.st_mtime
+
+        if up_to_date:
+            summary['unchanged'] += 1
+            continue
+
+        if entry is None:
+            base_name = os.path.splitext(relative)[0]
+            output_relative = f"{base_name}.md"
+            counter = 1
+            while output_relative in used_outputs:
+                output_relative = f"{base_name}_{counter}.md"
+                counter += 1
+            used_outputs.add(output_relative)
+            output_path = os.path.join(output_dir, output_relative)
+
+        pending[input_path] = (relative, stat, content_hash)
+        jobs.append((input_path, output_path))
+
+    job_outputs = dict(jobs)
+
+    def record_result(input_path, info, error):
+        relative, stat, content_hash = pending[input_path]
+        output_path = job_outputs[input_path]
+
+        if content_hash is None:
+            try:
+                content_hash = hash_file(input_path)
+            except OSError as e:
+                # 源文件在同步过程中被删除或无法读取：记为失败，下次同步时重新处理
+                if error is None:
+                    error = e
+        entry = {
+            'mtime': stat.st_mtime,
+            'size': stat.st_size,
+            'hash': content_hash,
+            'output': os.path.relpath(output_path, output_dir).replace(os.sep, '/'),
+        }
+        if error is None:
+            if not options['chunk_size']:
+                # 关闭分块后删除之前写出的分块文件
+                _remove_file(chunks_path_for(output_path))
+            entry['status'] = 'ok'
+            entry['images'] = [os.path.relpath(path, output_dir).replace(os.sep, '/')
+                               for path in info['image_files']]
+            stale_images.update(set(entries.get(relative, {}).get('images', [])) - set(entry['images']))
+            summary['converted'] += 1
+        else:
+            entry['status'] = 'failed'
+            entry['error'] = str(error)
+            entry['images'] = entries.get(relative, {}).get('images', [])
+            summary['failed'] += 1
+
+        entries[relative] = entry
+
+        finished = summary['converted'] + summary['failed']
+        if finished % MANIFEST_SAVE_INTERVAL == 0:
+            save_manifest(manifest_path, manifest)
+
+        if on_result:
+            on_result(input_path, info, error)
+
+    try:
+        if jobs:
+            markitdown_core.run_batch(jobs, options, max_workers, record_result, trace_memory)
+
+        # 删除源文件已不存在的输出
+        if delete_orphans:
+            orphan_entries = [entries.pop(relative) for relative in list(entries) if relative not in seen]
+            for entry in orphan_entries:
+                if _remove_file(os.path.join(output_dir, entry['output'])):
+                    summary['deleted'] += 1
+                _remove_file(chunks_path_for(os.path.join(output_dir, entry['output'])))
+                stale_images.update(entry.get('images', []))
+
+        # 图片可能被多个文档共用，只删除不再被任何条目引用的图片
+        referenced = {image for entry in entries.values() for image in entry.get('images', [])}
+        for image in stale_images - referenced:
+            _remove_file(os.path.join(output_dir, image))
+    finally:
+        save_manifest(manifest_path, manifest)
+
+    return summary
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MarkItDown 监视文件夹
+监视目录中新增或修改的文件，写入完成后自动转换为Markdown。
+Linux 上使用 inotify（通过 ctypes 调用，无需额外依赖），其他平台定时扫描目录；
+文件在一段时间内大小和修改时间都不再变化才转换（避免转换写了一半的文件），
+同一时间到达的大量文件合并为一批，交给数量有限的转换进程
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import threading
+
+import markitdown_core
+
+
+# 文件大小和修改时间保持不变多少秒后才开始转换
+DEFAULT_DEBOUNCE_SECONDS = 2.0
+
+# 定时扫描目录的间隔（秒，不支持 inotify 时使用）
+DEFAULT_POLL_INTERVAL = 2.0
+
+# 主循环检查待转换文件的最长间隔（秒）
+WATCH_TICK = 0.5
+
+# 每个转换进程最多排队的文件数，其余文件留在待转换列表中，内存占用不随到达的文件数增长
+WATCH_QUEUE_PER_WORKER = 2
+
+# inotify 常量（见 <sys/inotify.h>）
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+_EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+_READ_SIZE = 64 * 1024
+
+
+def _iter_files(path):
+    """递归列出目录中的所有文件"""
+    for dirpath, _dirnames, filenames in os.walk(path):
+        for name in filenames:
+            yield os.path.join(dirpath, name)
+
+
+class PollingWatcher:
+    """定时扫描目录，比较文件的大小和修改时间找出变化的文件"""
+
+    def __init__(self, root, interval=DEFAULT_POLL_INTERVAL):
+        self.root = os.path.abspath(root)
+        self.interval = interval
+        self._snapshot = self._scan()
+        self._next_scan = time.monotonic() + interval
+
+    def _scan(self):
+        snapshot = {}
+        for path in _iter_files(self.root):
+            if path.lower().endswith(markitdown_core.SUPPORTED_EXTENSIONS):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+        return snapshot
+
+    def read_changes(self, timeout):
+        """等待最多 timeout 秒，返回期间变化的文件路径集合"""
+        remaining = self._next_scan - time.monotonic()
+        if remaining > timeout:
+            time.sleep(timeout)
+            return set()
+        time.sleep(max(0.0, remaining))
+
+        snapshot = self._scan()
+        changed = {path for path, signature in snapshot.items() if self._snapshot.get(path) != signature}
+        self._snapshot = snapshot
+        self._next_scan = time.monotonic() + self.interval
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """使用 Linux inotify 递归监视目录（新建的子目录自动加入监视）"""
+
+    def __init__(self, root):
+        import ctypes
+        import ctypes.util
+
+        self.root = os.path.abspath(root)
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"inotify_init1 失败: {os.strerror(error)}")
+        self._dirs = {}  # 监视描述符 -> 目录
+        try:
+            self._add_tree(self.root)
+        except OSError:
+            self.close()
+            raise
+
+    def _add_watch(self, directory):
+        import ctypes
+
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), INOTIFY_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error in (errno.ENOENT, errno.ENOTDIR):
+                return  # 目录已被删除
+            raise OSError(error, f"无法监视目录 {directory}: {os.strerror(error)}")
+        self._dirs[wd] = directory
+
+    def _add_tree(self, directory):
+        for dirpath, _dirnames, _filenames in os.walk(directory):
+            self._add_watch(dirpath)
+
+    def read_changes(self, timeout):
+        """等待最多 timeout 秒，返回期间变化的文件路径集合"""
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return set()
+
+        changed = set()
+        while True:
+            try:
+                data = os.read(self._fd, _READ_SIZE)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+
+            offset = 0
+            while offset < len(data):
+                wd, mask, _cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b'\0'))
+                offset += length
+
+                if mask & IN_Q_OVERFLOW:
+                    # 事件队列溢出，丢失了部分事件：重新列出所有文件
+                    changed.update(_iter_files(self.root))
+                    continue
+                if mask & IN_IGNORED:
+                    self._dirs.pop(wd, None)
+                    continue
+
+                directory = self._dirs.get(wd)
+                if directory is None or not name:
+                    continue
+                path = os.path.join(directory, name)
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        # 新目录：加入监视，并找出加入监视之前已写入的文件
+                        self._add_tree(path)
+                        changed.update(_iter_files(path))
+                else:
+                    changed.add(path)
+        return changed
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def create_watcher(root, use_inotify=True, poll_interval=DEFAULT_POLL_INTERVAL):
+    """创建目录监视器：Linux 上优先使用 inotify，不可用时（例如监视数量超出系统上限）改为定时扫描"""
+    if use_inotify and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(root)
+        except (OSError, AttributeError) as e:
+            print(f"无法使用 inotify 监视目录，改为定时扫描: {e}")
+    return PollingWatcher(root, poll_interval)
+
+
+def _file_signature(path):
+    """文件的 (大小, 修改时间)，文件不存在时返回None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def watch_directory(source_dir, options, output_dir=None, max_workers=None, on_result=None, on_batch=None,
+                    stop_event=None, debounce=DEFAULT_DEBOUNCE_SECONDS, use_inotify=True,
+                    poll_interval=DEFAULT_POLL_INTERVAL, convert_existing=True, trace_memory=False):
+    """监视目录并自动转换，直到 stop_event 被设置，返回统计字典
+
+    Markdown默认保存在源文件旁边，指定 output_dir 时镜像源目录结构。
+    convert_existing 为真时，启动时先转换还没有输出或输出比源文件旧的文件。
+    on_result(输入文件, 结果字典, 异常) 在每个文件转换结束时调用，
+    on_batch(本批文件数, 仍在等待的文件数) 在每批文件提交时调用。
+    """
+    source_dir = os.path.abspath(source_dir)
+    output_dir = os.path.abspath(output_dir) if output_dir else None
+    stop_event = stop_event or threading.Event()
+    summary = {'converted': 0, 'failed': 0, 'batches': 0}
+
+    outputs = {}  # 输入文件 -> 输出文件（本次监视期间保持不变）
+    used_outputs = set()
+    pending = {}  # 输入文件 -> (最近变化时间, (大小, 修改时间))
+    converted = {}  # 输入文件 -> 已提交转换时的 (大小, 修改时间)
+    in_flight = {}  # Future -> 输入文件
+
+    def output_path_for(input_path):
+        if input_path not in outputs:
+            base_name = os.path.splitext(os.path.relpath(input_path, source_dir))[0]
+            target_dir = output_dir or source_dir
+            output_path = os.path.join(target_dir, f"{base_name}.md")
+            counter = 1
+            while output_path in used_outputs:
+                output_path = os.path.join(target_dir, f"{base_name}_{counter}.md")
+                counter += 1
+            used_outputs.add(output_path)
+            outputs[input_path] = output_path
+        return outputs[input_path]
+
+    def is_watched(path):
+        name = os.path.basename(path)
+        if name.startswith(('.', '~$')) or not name.lower().endswith(markitdown_core.SUPPORTED_EXTENSIONS):
+            return False
+        # 跳过输出目录和提取出的图片
+        if output_dir and os.path.commonpath([path, output_dir]) == output_dir:
+            return False
+        if options['extract_images'] and os.path.basename(os.path.dirname(path)) == 'images':
+            return False
+        return os.path.commonpath([path, source_dir]) == source_dir
+
+    def note_change(path, changed_at):
+        signature = _file_signature(path)
+        if signature is None:
+            pending.pop(path, None)
+        else:
+            pending[path] = (changed_at, signature)
+
+    def collect_finished():
+        for future in [future for future in in_flight if future.done()]:
+            input_path = in_flight.pop(future)
+            if future.cancelled():
+                continue
+            error = future.exception()
+            if error is None:
+                summary['converted'] += 1
+            else:
+                summary['failed'] += 1
+                converted.pop(input_path, None)  # 文件再次变化时重试
+            if on_result:
+                on_result(input_path, future.result() if error is None else None, error)
+
+    watcher = create_watcher(source_dir, use_inotify, poll_interval)
+    try:
+        with markitdown_core.create_batch_executor(options, max_workers, trace_memory) as executor:
+            max_in_flight = executor.max_workers * WATCH_QUEUE_PER_WORKER
+
+            if convert_existing:
+                for input_path in _iter_files(source_dir):
+                    if not is_watched(input_path):
+                        continue
+                    output_path = output_path_for(input_path)
+                    source_signature = _file_signature(input_path)
+                    output_signature = _file_signature(output_path)
+                    if output_signature is None or (source_signature and output_signature[1] < source_signature[1]):
+                        note_change(input_path, 0.0)
+
+            tick = min(WATCH_TICK, debounce / 2) if debounce > 0 else WATCH_TICK
+            while not stop_event.is_set():
+                changed_at = time.monotonic()
+                for path in watcher.read_changes(tick):
+                    if is_watched(path):
+                        note_change(path, changed_at)
+                collect_finished()
+
+                # 找出大小和修改时间已稳定的文件；仍在变化的重新计时
+                now = time.monotonic()
+                running = set(in_flight.values())
+                ready = []
+                for path, (last_change, signature) in list(pending.items()):
+                    if path in running or now - last_change < debounce:
+                        continue
+                    current = _file_signature(path)
+                    if current is None:
+                        del pending[path]
+                    elif current != signature:
+                        pending[path] = (now, current)
+                    elif converted.get(path) == current:
+                        del pending[path]  # 内容没有变化（例如只改了权限）
+                    else:
+                        ready.append((last_change, path))
+
+                # 合并为一批提交，超出排队上限的文件留到下一轮
+                batch = [path for _last_change, path in sorted(ready)][:max_in_flight - len(in_flight)]
+                for path in batch:
+                    signature = pending.pop(path)[1]
+                    converted[path] = signature
+                    future = executor.submit(markitdown_core.convert_to_file, path, output_path_for(path), options)
+                    in_flight[future] = path
+                if batch:
+                    summary['batches'] += 1
+                    if on_batch:
+                        on_batch(len(batch), len(pending))
+
+            # 停止监视：终止正在转换的文件，不再开始排队中的文件
+            executor.shutdown(wait=False, cancel_futures=True)
+            executor.cancel_running()
+    finally:
+        watcher.close()
+
+    return summary
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+MarkItDown 转换子进程
+转换在常驻的子进程中进行（复用已创建的MarkItDown实例），
+超时或取消时直接终止子进程，下一个任务开始前重新启动；
+可限制子进程的内存（地址空间），超出时只有当前文件失败
+"""
+
+import time
+import queue
+import threading
+import contextlib
+import multiprocessing
+from concurrent.futures import Future
+
+
+# 等待子进程结果时检查超时和取消的间隔（秒）
+POLL_INTERVAL = 0.1
+
+# 正常关闭子进程时等待其退出的时间（秒），超时后强制终止
+STOP_TIMEOUT = 2.0
+
+_memory_limit_warning_shown = False
+
+# 第一次限制内存之前进程的 (软限制, 硬限制)，取消限制时恢复
+_original_memory_limit = None
+
+
+class ConversionTimeout(Exception):
+    """转换超过时间限制，子进程已被终止"""
+
+
+class ConversionCancelled(Exception):
+    """转换被取消，子进程已被终止"""
+
+
+class MemoryLimitExceeded(Exception):
+    """转换超出内存上限，子进程已被终止"""
+
+
+def apply_memory_limit(limit_mb):
+    """限制当前进程的地址空间（RLIMIT_AS 软限制），0 表示恢复为进程原来的限制
+
+    只应在转换子进程中调用；不支持 resource 模块的平台（Windows）上返回False。
+    """
+    global _original_memory_limit
+    try:
+        import resource
+    except ImportError:
+        return False
+
+    if _original_memory_limit is None:
+        _original_memory_limit = resource.getrlimit(resource.RLIMIT_AS)
+    if not limit_mb:
+        resource.setrlimit(resource.RLIMIT_AS, _original_memory_limit)
+        return True
+
+    hard = _original_memory_limit[1]
+    limit = limit_mb * 1024 * 1024
+    if hard != resource.RLIM_INFINITY and limit > hard:
+        limit = hard
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    return True
+
+
+@contextlib.contextmanager
+def memory_limit(limit_mb):
+    """在内存上限内执行（limit_mb 为0时不限制），超出时抛出 MemoryLimitExceeded"""
+    global _memory_limit_warning_shown
+    if not limit_mb:
+        yield
+        return
+
+    if not apply_memory_limit(limit_mb):
+        if not _memory_limit_warning_shown:
+            print("当前平台不支持限制转换进程的内存，忽略内存上限")
+            _memory_limit_warning_shown = True
+        yield
+        return
+
+    try:
+        yield
+    except MemoryError:
+        raise MemoryLimitExceeded(f"转换超出内存上限（{limit_mb} MB）") from None
+    finally:
+        apply_memory_limit(0)
+
+
+def _ping():
+    """空任务，用于等待子进程初始化完成"""
+    return True
+
+
+def _worker_main(conn, initializer, initargs):
+    """子进程主循环：逐个执行收到的任务，把进度、结果或异常发回主进程"""
+    try:
+        if initializer is not None:
+            initializer(*initargs)
+
+        def report(*message):
+            conn.send(('progress', message))
+
+        while True:
+            task = conn.recv()
+            if task is None:
+                break
+
+            func, args, with_progress = task
+            try:
+                result = func(*args, progress=report) if with_progress else func(*args)
+            except Exception as e:
+                try:
+                    conn.send(('error', e))
+                except Exception:
+                    # 异常对象无法序列化时只传回文字
+                    conn.send(('error', RuntimeError(f"{type(e).__name__}: {e}")))
+            else:
+                conn.send(('ok', result))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        conn.close()
+
+
+class ConversionWorker:
+    """常驻的转换子进程，一次执行一个任务
+
+    initializer(*initargs) 在子进程启动时调用（例如预先创建MarkItDown实例）。
+    任务超时或被取消时终止子进程，下一个任务前按需重新启动。
+    """
+
+    def __init__(self, initializer=None, initargs=()):
+        self.initializer = initializer
+        self.initargs = initargs
+        self.process = None
+        self.conn = None
+        self._lock = threading.Lock()  # 同一时间只执行一个任务
+        self._cancel_event = threading.Event()  # 当前（或上一个）任务的取消标志
+
+    @property
+    def busy(self):
+        return self._lock.locked()
+
+    def start(self):
+        """启动子进程（已在运行时不做任何事）"""
+        if self.process is not None and self.process.is_alive():
+            return
+        self._close()
+        parent_conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=_worker_main,
+                                          args=(child_conn, self.initializer, self.initargs))
+        process.daemon = True
+        process.start()
+        child_conn.close()
+        self.process = process
+        self.conn = parent_conn
+
+    def run(self, func, *args, timeout=None, progress=None, cancel_event=None):
+        """在子进程中执行 func(*args)，返回其结果
+
+        func 必须是可以按模块路径导入的函数；传入 progress 回调时，
+        func 以关键字参数 progress 接收一个函数，其参数（状态文字、完成比例等）原样转给 progress。
+        超过 timeout 秒时抛出 ConversionTimeout；被 cancel() 取消或 cancel_event 被设置时
+        抛出 ConversionCancelled。cancel_event 属于这一个任务，在任务开始前设置也有效，
+        不会影响之后的任务。
+        """
+        cancel_event = cancel_event or threading.Event()
+        with self._lock:
+            self._cancel_event = cancel_event
+            if cancel_event.is_set():
+                raise ConversionCancelled("转换已取消")
+            self.start()
+            deadline = time.monotonic() + timeout if timeout else None
+
+            try:
+                self.conn.send((func, args, progress is not None))
+            except OSError as e:
+                self._raise_exited(e)
+
+            while True:
+                if cancel_event.is_set():
+                    self._kill()
+                    raise ConversionCancelled("转换已取消")
+                if deadline is not None and time.monotonic() > deadline:
+                    self._kill()
+                    raise ConversionTimeout(f"转换超时（超过 {timeout:g} 秒）")
+
+                try:
+                    if not self.conn.poll(POLL_INTERVAL):
+                        continue
+                    kind, payload = self.conn.recv()
+                except (EOFError, OSError) as e:
+                    self._raise_exited(e)
+
+                if kind == 'progress':
+                    if progress:
+                        progress(*payload)
+                elif kind == 'ok':
+                    return payload
+                else:
+                    if isinstance(payload, MemoryLimitExceeded):
+                        # 内存耗尽后子进程的状态不可靠，重新启动
+                        self._kill()
+                    raise payload
+
+    def _raise_exited(self, error):
+        """子进程意外退出（例如崩溃或被系统终止）"""
+        self.process.join(STOP_TIMEOUT)
+        exitcode = self.process.exitcode
+        self._kill()
+        raise RuntimeError(f"转换进程意外退出（退出码 {exitcode}）") from error
+
+    def warmup(self):
+        """启动子进程并等待其初始化完成，返回用时（秒）"""
+        start_time = time.perf_counter()
+        self.run(_ping)
+        return time.perf_counter() - start_time
+
+    def cancel(self):
+        """取消正在执行的任务（没有任务时不做任何事）
+
+        只设置当前任务的取消标志，已结束的任务不受影响；需要可靠地取消某个任务时，
+        向 run() 传入该任务自己的 cancel_event。
+        """
+        self._cancel_event.set()
+
+    def _kill(self):
+        """立即终止子进程"""
+        if self.process is not None:
+            self.process.kill()
+            self.process.join()
+        self._close()
+
+    def _close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if self.process is not None:
+            if self.process.exitcode is not None:
+                self.process.close()
+            self.process = None
+
+    def stop(self):
+        """关闭子进程：先通知其退出，超时后强制终止"""
+        self.cancel()
+        with self._lock:
+            if self.process is None:
+                return
+            try:
+                self.conn.send(None)
+                self.process.join(STOP_TIMEOUT)
+            except (OSError, ValueError):
+                pass
+            if self.process.is_alive():
+                self._kill()
+            else:
+                self._close()
+
+
+class WorkerPool:
+    """由多个 ConversionWorker 组成的进程池，接口与 concurrent.futures 的执行器相同
+
+    每个任务在 timeout 秒内未完成时，其 Future 以 ConversionTimeout 结束，
+    对应的子进程被终止并在下一个任务前重新启动，不会拖住整个队列。
+    """
+
+    def __init__(self, max_workers=None, initializer=None, initargs=(), timeout=None):
+        self.max_workers = max_workers or multiprocessing.cpu_count()
+        self.initializer = initializer
+        self.initargs = initargs
+        self.timeout = timeout or None
+        self._queue = queue.Queue()
+        self._workers = []
+        self._threads = []
+        self._cancel_events = {}  # 尚未结束的 Future -> 该任务的取消标志
+        self._shutdown = False
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args):
+        """提交任务，返回 Future"""
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("进程池已关闭")
+            future = Future()
+            cancel_event = threading.Event()
+            self._cancel_events[future] = cancel_event
+            self._queue.put((future, func, args, cancel_event))
+            # 按需增加子进程，直到达到最大数量
+            if len(self._threads) < self.max_workers:
+                self._add_worker()
+            return future
+
+    def start(self):
+        """预先启动全部子进程，子进程在后台完成初始化，第一个任务不必等待启动"""
+        with self._lock:
+            while len(self._threads) < self.max_workers:
+                self._add_worker(start_process=True)
+
+    def _add_worker(self, start_process=False):
+        worker = ConversionWorker(self.initializer, self.initargs)
+        if start_process:
+            # 在调度线程开始之前启动，不会与任务同时启动子进程
+            worker.start()
+        thread = threading.Thread(target=self._dispatch, args=(worker,))
+        thread.daemon = True
+        self._workers.append(worker)
+        self._threads.append(thread)
+        thread.start()
+
+    def _dispatch(self, worker):
+        """调度线程：从队列取任务交给自己的子进程执行"""
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                future, func, args, cancel_event = item
+                if not future.set_running_or_notify_cancel():
+                    self._cancel_events.pop(future, None)
+                    continue
+                try:
+                    result = worker.run(func, *args, timeout=self.timeout, cancel_event=cancel_event)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+                finally:
+                    self._cancel_events.pop(future, None)
+        finally:
+            worker.stop()
+
+    def cancel(self, future):
+        """取消一个任务：尚未开始时直接取消，正在执行时终止其子进程（Future 以 ConversionCancelled 结束）"""
+        if future.cancel():
+            return True
+        cancel_event = self._cancel_events.get(future)
+        if cancel_event is None:
+            return False  # 已经结束
+        cancel_event.set()
+        return True
+
+    def cancel_running(self):
+        """终止所有正在执行的任务，其 Future 以 ConversionCancelled 结束"""
+        for future, cancel_event in list(self._cancel_events.items()):
+            if future.running():
+                cancel_event.set()
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        """关闭进程池；cancel_futures 为真时取消尚未开始的任务"""
+        with self._lock:
+            self._shutdown = True
+            if cancel_futures:
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not None:
+                        item[0].cancel()
+                        self._cancel_events.pop(item[0], None)
+            for _ in self._threads:
+                self._queue.put(None)
+
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # 因异常（例如 Ctrl+C）退出时不再开始排队中的任务
+        self.shutdown(wait=True, cancel_futures=exc_type is not None)
+        return False
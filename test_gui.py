@@ -8,6 +8,7 @@ MarkItDown GUI 测试脚本
 import sys
 import os
 import tempfile
+import time
 from pathlib import Path
 
 def test_imports():
@@ -85,12 +86,850 @@ def test_gui_import():
         print(f"✗ GUI模块导入失败: {e}")
         return False
 
+def test_core_pipeline():
+    """测试不依赖Tk的转换核心（EPUB图片提取和引用处理）"""
+    print("\n测试转换核心...")
+    
+    try:
+        import zipfile
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import markitdown_core
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # 构造一个包含图片的最小EPUB
+            epub_path = os.path.join(temp_dir, "book.epub")
+            with zipfile.ZipFile(epub_path, 'w') as epub_zip:
+                epub_zip.writestr("OEBPS/chapter1.xhtml", "<p>test</p>")
+                epub_zip.writestr("OEBPS/images/cover.png", b"\x89PNG fake image data")
+                epub_zip.writestr("OEBPS/chapter2/cover.png", b"\x89PNG fake image data")
+            
+            jobs = markitdown_core.plan_batch_jobs([temp_dir], os.path.join(temp_dir, "out"))
+            if [os.path.basename(output) for _, output in jobs] != ["book.md"]:
+                print(f"✗ 批量任务规划不正确: {jobs}")
+                return False
+            print("✓ 批量任务规划成功")
+            
+            images = markitdown_core.extract_epub_images(epub_path, temp_dir)
+            if len(images) != 2 or not os.path.exists(images[0]['extracted_path']):
+                print("✗ EPUB图片提取失败")
+                return False
+            if len(os.listdir(os.path.join(temp_dir, "images"))) != 1:
+                print("✗ 内容相同的图片应只保存一份")
+                return False
+            again = markitdown_core.extract_epub_images(epub_path, temp_dir)
+            if [image['filename'] for image in again] != [image['filename'] for image in images]:
+                print("✗ 重复提取时图片文件名应保持不变")
+                return False
+            print("✓ EPUB图片提取成功")
+            
+            save_dir = os.path.join(temp_dir, "saved")
+            copied = markitdown_core.save_markdown("# 保存", os.path.join(save_dir, "book.md"), images)
+            saved_image = os.path.join(save_dir, "images", images[0]['filename'])
+            with open(saved_image, 'rb') as f:
+                saved_data = f.read()
+            if copied != [images[0]['filename']] or saved_data != b"\x89PNG fake image data":
+                print("✗ 保存时图片没有放到目标目录")
+                return False
+            if markitdown_core.save_markdown("# 保存", os.path.join(save_dir, "book.md"), images):
+                print("✗ 目标目录中已有相同的图片时应跳过")
+                return False
+            print("✓ 保存图片正确，已有的相同图片被跳过")
+            
+            markdown = "![封面](../images/cover.png)"
+            processed = markitdown_core.process_markdown_images(markdown, images, temp_dir, "relative")
+            if processed != f"![封面]({images[0]['relative_path']})":
+                print(f"✗ 图片引用处理结果不正确: {processed}")
+                return False
+            rewriter = markitdown_core.ImageRefRewriter(images, "relative")
+            html = rewriter.rewrite('<img src="../chapter2/cover.png"/>\n[logo]: cover.png')
+            expected = '<img src="%s"/>\n[logo]: %s' % (images[1]['relative_path'], images[0]['relative_path'])
+            if html != expected:
+                print(f"✗ HTML图片和引用式链接处理结果不正确: {html}")
+                return False
+            rewriter = markitdown_core.ImageRefRewriter(images, "base64", base64_references=True)
+            inlined = rewriter.rewrite("![a](cover.png)\n![b](../chapter2/cover.png)\n\n[Markitdown-Image-1]: note.html")
+            if inlined.count("data:image/png;base64,") != 1 or "![a][markitdown-image-2]" not in inlined \
+                    or "\n[markitdown-image-1]:" in inlined:
+                print(f"✗ Base64引用式定义处理结果不正确: {inlined}")
+                return False
+            capped = markitdown_core.ImageRefRewriter(images, "base64", base64_max_bytes=1)
+            if capped.rewrite("![a](cover.png)") != f"![a]({images[0]['relative_path']})":
+                print("✗ 超过Base64大小上限的图片应改用相对路径")
+                return False
+            
+            if markitdown_core.ImageOptimizer.from_options(markitdown_core.make_options()) is not None:
+                print("✗ 默认选项不应启用图片压缩")
+                return False
+            
+            # Base64模式直接从EPUB读取图片，不写中间文件
+            inline_dir = os.path.join(temp_dir, "inline")
+            inlined, extracted, count = markitdown_core.inline_container_images(
+                epub_path, "![封面](../images/cover.png)", inline_dir)
+            if count != 1 or extracted or os.path.exists(inline_dir) or "base64," not in inlined:
+                print(f"✗ Base64直接内联处理结果不正确: {inlined[:80]}")
+                return False
+            print("✓ 图片引用处理成功")
+            
+            # Word文档的图片引用是数据URI，按正文中出现的顺序对应
+            docx_path = os.path.join(temp_dir, "report.docx")
+            with zipfile.ZipFile(docx_path, 'w') as docx_zip:
+                docx_zip.writestr("word/document.xml", (
+                    '<w:document xmlns:w="w" xmlns:a="a" xmlns:r="http://schemas.openxmlformats.org/'
+                    'officeDocument/2006/relationships"><a:blip r:embed="rId2"/><a:blip r:embed="rId1"/>'
+                    '</w:document>'))
+                docx_zip.writestr("word/_rels/document.xml.rels", (
+                    '<Relationships><Relationship Id="rId1" Target="media/image1.png"/>'
+                    '<Relationship Id="rId2" Target="media/image2.png"/></Relationships>'))
+                docx_zip.writestr("word/media/image1.png", b"first")
+                docx_zip.writestr("word/media/image2.png", b"second")
+                docx_zip.writestr("docProps/thumbnail.jpeg", b"thumbnail")
+            
+            docx_dir = os.path.join(temp_dir, "docx")
+            images, image_order = markitdown_core.extract_container_images(docx_path, docx_dir)
+            processed = markitdown_core.process_markdown_images(
+                "![](data:image/png;base64...) ![](data:image/png;base64...)",
+                images, docx_dir, "relative", image_order=image_order)
+            expected = "![](%s) ![](%s)" % (image_order[0]['relative_path'], image_order[1]['relative_path'])
+            if len(images) != 2 or not image_order[0]['filename'].startswith("image2") or processed != expected:
+                print(f"✗ Word文档图片提取结果不正确: {processed}")
+                return False
+            
+            # 已有的同名图片大小相同但内容被改过时，重新提取
+            with open(image_order[0]['extracted_path'], 'wb') as f:
+                f.write(b"SECOND")
+            markitdown_core.extract_container_images(docx_path, docx_dir)
+            with open(image_order[0]['extracted_path'], 'rb') as f:
+                if f.read() != b"second":
+                    print("✗ 内容不同的已有图片应重新提取")
+                    return False
+            print("✓ Office文档图片提取成功")
+            
+            # XLSX和ZIP的输出中没有图片引用：在所属工作表或压缩包成员一节的末尾加上图片链接
+            xlsx_path = os.path.join(temp_dir, "book.xlsx")
+            with zipfile.ZipFile(xlsx_path, 'w') as xlsx_zip:
+                xlsx_zip.writestr("xl/workbook.xml", (
+                    '<workbook xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+                    '<sheets><sheet name="汇总" r:id="rId1"/><sheet name="图表" r:id="rId2"/></sheets></workbook>'))
+                xlsx_zip.writestr("xl/_rels/workbook.xml.rels", (
+                    '<Relationships><Relationship Id="rId1" Target="worksheets/sheet1.xml"/>'
+                    '<Relationship Id="rId2" Target="worksheets/sheet2.xml"/></Relationships>'))
+                xlsx_zip.writestr("xl/worksheets/_rels/sheet2.xml.rels", (
+                    '<Relationships><Relationship Id="rId1" Target="../drawings/drawing1.xml"/></Relationships>'))
+                xlsx_zip.writestr("xl/drawings/drawing1.xml", (
+                    '<wsDr xmlns:a="a" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/'
+                    'relationships"><a:blip r:embed="rId1"/></wsDr>'))
+                xlsx_zip.writestr("xl/drawings/_rels/drawing1.xml.rels", (
+                    '<Relationships><Relationship Id="rId1" Target="../media/chart.png"/></Relationships>'))
+                xlsx_zip.writestr("xl/media/chart.png", b"chart")
+            xlsx_dir = os.path.join(temp_dir, "xlsx")
+            images, _order = markitdown_core.extract_container_images(xlsx_path, xlsx_dir)
+            processed = markitdown_core.process_markdown_images(
+                "## 汇总\n| a |\n\n## 图表\n| b |\n", images, xlsx_dir, "relative")
+            if processed != f"## 汇总\n| a |\n\n## 图表\n| b |\n\n![chart.png]({images[0]['relative_path']})\n\n":
+                print(f"✗ XLSX图片链接不正确: {processed}")
+                return False
+            
+            archive_path = os.path.join(temp_dir, "archive.zip")
+            with zipfile.ZipFile(archive_path, 'w') as archive_zip:
+                archive_zip.writestr("photos/a (1).png", b"photo")
+                archive_zip.writestr("notes.txt", "说明")
+                archive_zip.write(docx_path, "docs/report.docx")
+            archive_dir = os.path.join(temp_dir, "archive")
+            images, _order = markitdown_core.extract_container_images(archive_path, archive_dir)
+            markdown = "Content from the zip file:\n\n## File: photos/a (1).png\n\n## File: notes.txt\n\n说明\n"
+            processed = markitdown_core.process_markdown_images(markdown, images, archive_dir, "relative")
+            photo = next(image for image in images if image['original_path'] == "photos/a (1).png")
+            docx_links = sum(1 for image in images if image['original_path'].startswith("docs/report.docx/"))
+            if f"## File: photos/a (1).png\n\n![a (1).png]({photo['relative_path']})\n\n## File: notes.txt" \
+                    not in processed or processed.count("](images/") != 1 + docx_links or docx_links != 2:
+                print(f"✗ ZIP图片链接不正确: {processed}")
+                return False
+            print("✓ XLSX和ZIP中的图片在所属的一节中加上链接")
+            
+            try:
+                from PIL import Image
+            except ImportError:
+                Image = None
+            if Image is not None:
+                from markitdown_images import ImageOptimizer
+                photo_dir = os.path.join(temp_dir, "photo")
+                os.makedirs(photo_dir)
+                photo_path = os.path.join(photo_dir, "photo-1a2b3c4d.png")
+                Image.radial_gradient('L').resize((1200, 1200)).save(photo_path)
+                original_size = os.path.getsize(photo_path)
+                optimizer = ImageOptimizer(max_dimension=256, image_format='webp')
+                new_path, saved = optimizer.optimize_file(photo_path)
+                mtime = os.stat(new_path).st_mtime_ns
+                again_path, again_saved = optimizer.optimize_file(photo_path)
+                if not (new_path.endswith('.webp') and saved > 0 and os.path.getsize(photo_path) == original_size):
+                    print("✗ 压缩结果应另存，原图保持不变")
+                    return False
+                if (again_path, again_saved) != (new_path, saved) or os.stat(new_path).st_mtime_ns != mtime:
+                    print("✗ 再次压缩时应直接复用已有的压缩结果")
+                    return False
+                if ImageOptimizer(max_dimension=128, image_format='webp').optimize_file(photo_path)[0] == new_path:
+                    print("✗ 不同的压缩设置应使用不同的文件名")
+                    return False
+                print("✓ 图片压缩结果另存并复用")
+                
+                # Base64模式下压缩后的格式决定数据URI的MIME类型
+                second_path = os.path.join(photo_dir, "second-5e6f7a8b.png")
+                Image.radial_gradient('L').resize((600, 600)).save(second_path)
+                photos = [{'original_path': os.path.basename(path), 'extracted_path': path,
+                           'filename': os.path.basename(path), 'relative_path': f"images/{os.path.basename(path)}"}
+                          for path in (photo_path, second_path)]
+                rewriter = markitdown_core.ImageRefRewriter(
+                    photos, "base64", optimizer=ImageOptimizer(max_dimension=256, image_format='webp'))
+                inlined = rewriter.rewrite("![a](photo-1a2b3c4d.png) ![b](second-5e6f7a8b.png)")
+                if inlined.count("](data:image/webp;base64,UklGR") != 2 or rewriter.optimizer.bytes_saved <= 0:
+                    print(f"✗ 压缩为WebP的内联图片MIME类型不正确: {inlined[:80]}")
+                    return False
+                print("✓ 内联图片的MIME类型与压缩后的格式一致")
+        
+        return True
+        
+    except Exception as e:
+        print(f"✗ 转换核心测试失败: {e}")
+        return False
+
+def test_conversion_cache():
+    """测试转换缓存的命中统计和LRU淘汰，以及文件类型检测的缓存"""
+    print("\n测试转换缓存...")
+    
+    try:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        from markitdown_cache import ConversionCache, FileTypeCache
+        from markitdown_detect import extension_matches
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            input_path = os.path.join(temp_dir, "input.txt")
+            with open(input_path, 'w', encoding='utf-8') as f:
+                f.write("缓存测试")
+            
+            cache = ConversionCache(os.path.join(temp_dir, "cache"), max_bytes=1024)
+            options = {'keep_data_uris': False, 'use_plugins': False}
+            key = cache.make_key(input_path, options)
+            
+            if cache.get(key) is not None:
+                print("✗ 空缓存不应命中")
+                return False
+            cache.put(key, "# 缓存内容")
+            if cache.get(key) != "# 缓存内容" or (cache.hits, cache.misses) != (1, 1):
+                print("✗ 缓存读写或命中统计不正确")
+                return False
+            print("✓ 缓存读写和命中统计正确")
+            
+            if cache.make_key(input_path, dict(options, keep_data_uris=True)) == key:
+                print("✗ 不同转换选项应使用不同的缓存键")
+                return False
+            csv_path = os.path.join(temp_dir, "input.CSV")
+            with open(csv_path, 'w', encoding='utf-8') as f:
+                f.write("缓存测试")
+            if cache.make_key(csv_path, options) == key:
+                print("✗ 内容相同、扩展名不同的文件应使用不同的缓存键")
+                return False
+            print("✓ 缓存键包含转换选项和扩展名")
+            
+            # 写入超过容量的内容，最旧的条目应被淘汰
+            old_time = time.time() - 100
+            os.utime(cache._entry_path(key), (old_time, old_time))
+            for index in range(3):
+                cache.put(f"{index:064x}", "x" * 400)
+            if cache.get(key) is not None:
+                print("✗ 超出容量后最久未使用的条目未被淘汰")
+                return False
+            print("✓ LRU淘汰正确")
+            
+            if not (extension_matches('.docx', b'PK\x03\x04rest') and extension_matches('.txt', b'text')):
+                print("✗ 与扩展名相符的文件头未被识别")
+                return False
+            if extension_matches('.pdf', b'plain text') or extension_matches('.txt', b'\x00\x01') \
+                    or extension_matches('.unknown', b'data'):
+                print("✗ 与扩展名不符或未知扩展名的文件应交给magika检测")
+                return False
+            print("✓ 按扩展名和文件头确定类型正确")
+            
+            type_cache = FileTypeCache(os.path.join(temp_dir, "cache"))
+            guesses = [{'extension': '.txt', 'charset': 'utf-8'}]
+            try:
+                type_cache.put(input_path, 12, 1000, guesses)
+                if type_cache.get(input_path, 12, 1000) != guesses:
+                    print("✗ 文件类型缓存读写不正确")
+                    return False
+                if type_cache.get(input_path, 12, 2000) is not None:
+                    print("✗ 文件修改后文件类型缓存应失效")
+                    return False
+            finally:
+                type_cache.close()
+            print("✓ 文件类型缓存正确")
+        
+        return True
+        
+    except Exception as e:
+        print(f"✗ 转换缓存测试失败: {e}")
+        return False
+
+def test_conversion_stats():
+    """测试分阶段统计的记录、汇总和JSON Lines导出"""
+    print("\n测试转换统计...")
+    
+    try:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import json
+        from markitdown_stats import ConversionStats, StatsLog
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            input_path = os.path.join(temp_dir, "input.txt")
+            with open(input_path, 'w', encoding='utf-8') as f:
+                f.write("统计测试")
+            
+            stats_log = StatsLog()
+            stats = ConversionStats(input_path)
+            with stats.stage('convert'):
+                time.sleep(0.01)
+            stats.add_stage('render', 0.5)
+            stats_log.add(stats)
+            stats_log.add(ConversionStats(input_path).fail("测试错误"))
+            
+            if [stage['stage'] for stage in stats.stages] != ['convert', 'render'] or stats.total_seconds < 0.51:
+                print(f"✗ 阶段记录不正确: {stats.stages}")
+                return False
+            print("✓ 阶段耗时记录正确")
+            
+            from markitdown_stats import reset_peak_rss
+            if reset_peak_rss():
+                # 峰值内存在每个阶段开始时重置，前一阶段的大分配不计入后一阶段
+                large = ConversionStats(input_path)
+                with large.stage('convert'):
+                    data = bytearray(200 * 1024 * 1024)
+                    data[::4096] = b'x' * len(data[::4096])
+                    del data
+                with large.stage('save'):
+                    pass
+                big_peak, small_peak = (stage['peak_rss_mb'] for stage in large.stages)
+                if big_peak - small_peak < 150:
+                    print(f"✗ 各阶段峰值内存未分开统计: {large.stages}")
+                    return False
+                print("✓ 各阶段峰值内存分开统计")
+            
+            summary = stats_log.summary_by_format()
+            if len(summary) != 1 or summary[0]['count'] != 2 or summary[0]['failed'] != 1:
+                print(f"✗ 按格式汇总不正确: {summary}")
+                return False
+            print("✓ 按格式汇总正确")
+            
+            export_path = os.path.join(temp_dir, "stats.jsonl")
+            stats_log.export_jsonl(export_path)
+            with open(export_path, 'r', encoding='utf-8') as f:
+                records = [json.loads(line) for line in f]
+            restored = ConversionStats.from_dict(records[0])
+            if len(records) != 2 or restored.stages != stats.stages or records[1]['status'] != 'failed':
+                print("✗ JSON Lines导出不正确")
+                return False
+            print("✓ JSON Lines导出正确")
+        
+        return True
+        
+    except Exception as e:
+        print(f"✗ 转换统计测试失败: {e}")
+        return False
+
+def _inline_images_with_memory_limit(epub_path, output_dir, extra_mb):
+    """在子进程中执行：内存上限为当前地址空间加 extra_mb，以Base64内联EPUB中的图片"""
+    import markitdown_core
+    from markitdown_worker import memory_limit
+    with open('/proc/self/status') as f:
+        vm_size_mb = next(int(line.split()[1]) for line in f if line.startswith('VmSize:')) // 1024
+    with memory_limit(vm_size_mb + extra_mb):
+        return markitdown_core.inline_container_images(epub_path, "![大图](../images/big.png)", output_dir)[2]
+
+def _memory_limit_restored():
+    """在新的子进程中执行：限制内存后取消限制，返回是否恢复为进程原来的软限制和硬限制"""
+    import resource
+    from markitdown_worker import apply_memory_limit
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    original = (64 * 1024 * 1024 * 1024 if hard == resource.RLIM_INFINITY else hard // 2, hard)
+    resource.setrlimit(resource.RLIMIT_AS, original)
+    apply_memory_limit(512)
+    apply_memory_limit(0)
+    return resource.getrlimit(resource.RLIMIT_AS) == original
+
+def test_conversion_worker():
+    """测试转换子进程的超时、取消、内存上限和进程池中超时文件的跳过"""
+    print("\n测试转换子进程...")
+    
+    try:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import threading
+        from markitdown_worker import (ConversionWorker, WorkerPool, ConversionTimeout, ConversionCancelled,
+                                       apply_memory_limit)
+        
+        worker = ConversionWorker()
+        try:
+            start_time = time.perf_counter()
+            try:
+                worker.run(time.sleep, 30, timeout=0.5)
+                print("✗ 超时的任务没有被终止")
+                return False
+            except ConversionTimeout:
+                pass
+            if time.perf_counter() - start_time > 5 or worker.run(abs, -3) != 3:
+                print("✗ 超时后子进程没有重新启动")
+                return False
+            print("✓ 超时的任务被终止，之后的任务正常执行")
+            
+            threading.Timer(0.3, worker.cancel).start()
+            try:
+                worker.run(time.sleep, 30)
+                print("✗ 任务没有被取消")
+                return False
+            except ConversionCancelled:
+                pass
+            try:
+                worker.run(int, "不是数字")
+                print("✗ 子进程中的异常没有传回")
+                return False
+            except ValueError:
+                pass
+            print("✓ 取消和异常传回正确")
+            
+            if worker.run(apply_memory_limit, 512):
+                try:
+                    worker.run(bytearray, 2 * 1024 * 1024 * 1024)
+                    print("✗ 内存上限没有生效")
+                    return False
+                except MemoryError:
+                    pass
+                print("✓ 子进程的内存上限生效")
+                
+                restore_worker = ConversionWorker()
+                try:
+                    if not restore_worker.run(_memory_limit_restored):
+                        print("✗ 取消内存上限后应恢复进程原来的限制")
+                        return False
+                finally:
+                    restore_worker.stop()
+                print("✓ 取消内存上限后恢复进程原来的限制")
+                
+                if sys.platform.startswith('linux'):
+                    import zipfile
+                    from markitdown_worker import MemoryLimitExceeded
+                    with tempfile.TemporaryDirectory() as temp_dir:
+                        epub_path = os.path.join(temp_dir, "big.epub")
+                        with zipfile.ZipFile(epub_path, 'w', zipfile.ZIP_DEFLATED) as epub_zip:
+                            epub_zip.writestr("OEBPS/images/big.png", b"\x89PNG" + bytes(256 * 1024 * 1024))
+                        # 内联图片时超出内存上限，整个文件失败，而不是当作没有图片
+                        try:
+                            worker.run(_inline_images_with_memory_limit, epub_path, temp_dir, 128)
+                            print("✗ 内联图片超出内存上限时应使转换失败")
+                            return False
+                        except MemoryLimitExceeded:
+                            pass
+                        if worker.run(_inline_images_with_memory_limit, epub_path, temp_dir, 2048) != 1:
+                            print("✗ 内存足够时图片应正常内联")
+                            return False
+                    print("✓ 图片处理超出内存上限时整个文件失败")
+        finally:
+            worker.stop()
+        
+        with WorkerPool(max_workers=1, timeout=0.5) as pool:
+            slow = pool.submit(time.sleep, 30)
+            fast = pool.submit(abs, -2)
+            if not isinstance(slow.exception(), ConversionTimeout) or fast.result() != 2:
+                print("✗ 进程池中超时的任务没有被跳过")
+                return False
+        print("✓ 进程池中超时的任务记为失败，队列继续执行")
+        
+        # 取消标志属于任务本身：在任务开始前取消同样有效，且不影响之后的任务
+        with WorkerPool(max_workers=1) as pool:
+            pool.start()
+            for _ in range(5):
+                slow = pool.submit(time.sleep, 30)
+                pool.cancel(slow)
+                next_task = pool.submit(abs, -4)
+                if not (slow.cancelled() or isinstance(slow.exception(timeout=10), ConversionCancelled)) \
+                        or next_task.result(timeout=10) != 4:
+                    print("✗ 任务开始前的取消没有生效或影响了下一个任务")
+                    return False
+        print("✓ 任务开始前的取消生效，不影响下一个任务")
+        
+        return True
+        
+    except Exception as e:
+        print(f"✗ 转换子进程测试失败: {e}")
+        return False
+
+def test_directory_sync():
+    """测试目录同步：清单、跳过未变化的文件、选项变化后重新转换、删除孤立的输出和图片"""
+    print("\n测试目录同步...")
+    
+    try:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import json
+        import markitdown_core
+        import markitdown_sync
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            source_dir = os.path.join(temp_dir, "source")
+            output_dir = os.path.join(temp_dir, "output")
+            os.makedirs(os.path.join(source_dir, "sub"))
+            
+            def write_source(relative, text):
+                with open(os.path.join(source_dir, relative), 'w', encoding='utf-8') as f:
+                    f.write(text * (1024 * 1024 // len(text) + 1))
+            
+            def sync(**overrides):
+                # 大于流式转换阈值的文本文件不需要markitdown即可转换
+                options = markitdown_core.make_options(use_cache=False, stream_threshold_mb=1, **overrides)
+                return markitdown_sync.sync_directory(source_dir, output_dir, options, max_workers=1)
+            
+            write_source("a.txt", "甲")
+            write_source(os.path.join("sub", "b.txt"), "乙")
+            summary = sync()
+            manifest_path = os.path.join(output_dir, markitdown_sync.MANIFEST_NAME)
+            if summary['converted'] != 2 or not os.path.exists(os.path.join(output_dir, "sub", "b.md")) \
+                    or set(markitdown_sync.load_manifest(manifest_path)['files']) != {"a.txt", "sub/b.txt"}:
+                print(f"✗ 首次同步结果不正确: {summary}")
+                return False
+            print("✓ 首次同步转换全部文件并写入清单")
+            
+            # 只改修改时间（内容不变）的文件按内容哈希判断为未变化
+            os.utime(os.path.join(source_dir, "a.txt"), (time.time() + 10, time.time() + 10))
+            write_source(os.path.join("sub", "b.txt"), "丙")
+            summary = sync()
+            if (summary['converted'], summary['unchanged']) != (1, 1):
+                print(f"✗ 再次同步应只转换修改过的文件: {summary}")
+                return False
+            print("✓ 只转换修改过的文件")
+            
+            summary = sync(chunk_size=1000)
+            chunks_path = os.path.join(output_dir, "a.chunks.jsonl")
+            if summary['converted'] != 2 or not os.path.exists(chunks_path):
+                print(f"✗ 选项变化后应全部重新转换: {summary}")
+                return False
+            summary = sync()
+            if summary['converted'] != 2 or os.path.exists(chunks_path):
+                print("✗ 关闭分块后应删除之前的分块文件")
+                return False
+            print("✓ 选项变化后全部重新转换，关闭分块时删除分块文件")
+            
+            # 源文件删除后删除其输出，以及不再被其他文件引用的图片
+            manifest = markitdown_sync.load_manifest(manifest_path)
+            manifest['files']['a.txt']['images'] = ["images/shared.png"]
+            manifest['files']['sub/b.txt']['images'] = ["images/shared.png", "images/only-b.png"]
+            markitdown_sync.save_manifest(manifest_path, manifest)
+            os.makedirs(os.path.join(output_dir, "images"))
+            for name in ("shared.png", "only-b.png"):
+                with open(os.path.join(output_dir, "images", name), 'wb') as f:
+                    f.write(b"png")
+            os.remove(os.path.join(source_dir, "sub", "b.txt"))
+            summary = sync()
+            if summary['deleted'] != 1 or os.path.exists(os.path.join(output_dir, "sub", "b.md")) \
+                    or os.path.exists(os.path.join(output_dir, "images", "only-b.png")) \
+                    or not os.path.exists(os.path.join(output_dir, "images", "shared.png")):
+                print(f"✗ 孤立的输出或图片删除不正确: {summary}")
+                return False
+            print("✓ 删除孤立的输出和不再引用的图片")
+            
+            # 转换结束时源文件已无法读取：记为失败，不中断同步
+            write_source("c.txt", "丁")
+            original_hash_file = markitdown_sync.hash_file
+            
+            def unreadable(path):
+                raise FileNotFoundError(path)
+            
+            markitdown_sync.hash_file = unreadable
+            try:
+                summary = sync()
+            finally:
+                markitdown_sync.hash_file = original_hash_file
+            with open(manifest_path, encoding='utf-8') as f:
+                entry = json.load(f)['files']['c.txt']
+            if summary['failed'] != 1 or entry['status'] != 'failed':
+                print(f"✗ 无法读取的源文件应记为失败: {summary}")
+                return False
+            print("✓ 无法读取的源文件记为失败，同步继续")
+        
+        return True
+        
+    except Exception as e:
+        print(f"✗ 目录同步测试失败: {e}")
+        return False
+
+def test_streaming_conversion():
+    """测试大文件流式转换的表格输出、原样输出和走流式转换的条件"""
+    print("\n测试流式转换...")
+    
+    try:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import tempfile
+        from markitdown_stream import can_stream, stream_convert
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            csv_path = os.path.join(temp_dir, "table.csv")
+            with open(csv_path, 'w', encoding='utf-8-sig', newline='') as f:
+                f.write('\n名称,说明\n\n甲,"a|b"\n乙,"多\n行",多余\n\n丙\n\n')
+            output_path = os.path.join(temp_dir, "table.md")
+            reports = []
+            written = stream_convert(csv_path, output_path, progress=lambda message, fraction: reports.append(fraction))
+            with open(output_path, encoding='utf-8') as f:
+                markdown = f.read()
+            expected = ("| 名称 | 说明 |  |\n| --- | --- | --- |\n| 甲 | a\\|b |  |\n"
+                        "| 乙 | 多 行 | 多余 |\n|  |  |  |\n| 丙 |  |  |")
+            if markdown != expected or written != len(expected) or reports[-1:] != [1.0]:
+                print("✗ CSV流式转换结果不正确")
+                return False
+            print("✓ CSV流式转换结果正确")
+            
+            json_path = os.path.join(temp_dir, "data.json")
+            with open(json_path, 'w', encoding='utf-8') as f:
+                f.write('{"键": "值"}\n')
+            stream_convert(json_path, output_path)
+            with open(output_path, encoding='utf-8') as f:
+                if f.read() != '{"键": "值"}\n':
+                    print("✗ JSON应原样输出")
+                    return False
+            
+            feed_path = os.path.join(temp_dir, "feed.xml")
+            with open(feed_path, 'w', encoding='utf-8') as f:
+                f.write('<?xml version="1.0"?><rss version="2.0"><channel></channel></rss>')
+            if not can_stream(json_path, 1) or can_stream(json_path, 1024 * 1024) or can_stream(json_path, 0):
+                print("✗ 小于阈值的文件不应走流式转换")
+                return False
+            if can_stream(feed_path, 1):
+                print("✗ RSS订阅应由MarkItDown转换")
+                return False
+            print("✓ 原样输出和流式转换条件正确")
+            
+            # 纯文本按块输出，每读取约一个块报告一次进度
+            text_path = os.path.join(temp_dir, "large.txt")
+            with open(text_path, 'w', encoding='utf-8') as f:
+                f.write("文本内容\n" * (1024 * 1024))
+            reports = []
+            stream_convert(text_path, output_path, progress=lambda message, fraction: reports.append(fraction))
+            if len(reports) < 5 or reports != sorted(reports) or reports[-1] != 1.0:
+                print(f"✗ 纯文本流式转换的进度报告不正确: {reports}")
+                return False
+            print("✓ 纯文本流式转换按读取的字节报告进度")
+        
+        return True
+        
+    except Exception as e:
+        print(f"✗ 流式转换测试失败: {e}")
+        return False
+
+def test_watch_folder():
+    """测试监视文件夹：检测新文件、等待写入完成后转换"""
+    print("\n测试监视文件夹...")
+    
+    try:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import threading
+        import markitdown_core
+        from markitdown_watch import create_watcher, watch_directory
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            watcher = create_watcher(temp_dir, poll_interval=0.2)
+            try:
+                watcher.read_changes(0.3)
+                input_path = os.path.join(temp_dir, "新文件.txt")
+                with open(input_path, 'w', encoding='utf-8') as f:
+                    f.write("内容")
+                changed = set()
+                deadline = time.time() + 5
+                while input_path not in changed and time.time() < deadline:
+                    changed |= watcher.read_changes(0.3)
+            finally:
+                watcher.close()
+            if input_path not in changed:
+                print(f"✗ {type(watcher).__name__} 没有检测到新文件")
+                return False
+            print(f"✓ {type(watcher).__name__} 检测到新文件")
+            
+            # 大于流式转换阈值的文本文件不需要markitdown即可转换
+            options = markitdown_core.make_options(use_cache=False, stream_threshold_mb=1)
+            stop_event = threading.Event()
+            results = []
+            thread = threading.Thread(target=watch_directory, args=(temp_dir, options), kwargs={
+                'max_workers': 1, 'on_result': lambda *result: results.append(result),
+                'stop_event': stop_event, 'debounce': 0.5, 'poll_interval': 0.2, 'convert_existing': False})
+            thread.start()
+            try:
+                time.sleep(0.5)
+                big_path = os.path.join(temp_dir, "导出.txt")
+                with open(big_path, 'w', encoding='utf-8') as f:
+                    f.write("a" * (1024 * 1024))
+                    f.flush()
+                    time.sleep(0.3)
+                    f.write("结尾")
+                deadline = time.time() + 20
+                while not results and time.time() < deadline:
+                    time.sleep(0.1)
+            finally:
+                stop_event.set()
+                thread.join()
+            
+            output_path = os.path.join(temp_dir, "导出.md")
+            if len(results) != 1 or results[0][2] is not None or not os.path.exists(output_path):
+                print(f"✗ 写入完成的文件没有被转换一次: {results}")
+                return False
+            with open(output_path, encoding='utf-8') as f:
+                if not f.read().endswith("结尾"):
+                    print("✗ 转换了写到一半的文件")
+                    return False
+            print("✓ 文件写入完成后自动转换")
+        
+        return True
+        
+    except Exception as e:
+        print(f"✗ 监视文件夹测试失败: {e}")
+        return False
+
+def test_conversion_server():
+    """测试HTTP转换服务：提交任务、查询状态、下载结果和上传大小限制"""
+    print("\n测试HTTP转换服务...")
+    
+    try:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import json
+        import threading
+        import http.client
+        import markitdown_core
+        from markitdown_server import ConversionService, create_server
+        
+        # 大于流式转换阈值的文本文件不需要markitdown即可转换
+        options = markitdown_core.make_options(use_cache=False, stream_threshold_mb=1)
+        service = ConversionService(options, max_workers=1, max_upload_bytes=4 * 1024 * 1024)
+        server = create_server(service, port=0, quiet=True)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        
+        def request(method, path, body=None):
+            connection = http.client.HTTPConnection('127.0.0.1', server.server_port, timeout=30)
+            try:
+                connection.request(method, path, body=body)
+                response = connection.getresponse()
+                return response.status, response.read()
+            finally:
+                connection.close()
+        
+        try:
+            content = "数据\n" * (400 * 1024)
+            status, body = request('POST', '/jobs?filename=export.txt', content.encode('utf-8'))
+            if status != 202:
+                print(f"✗ 提交任务失败: {status} {body[:200]}")
+                return False
+            job_id = json.loads(body)['id']
+            
+            deadline = time.time() + 30
+            job = {'status': 'queued'}
+            while job['status'] in ('queued', 'running') and time.time() < deadline:
+                time.sleep(0.2)
+                job = json.loads(request('GET', f'/jobs/{job_id}')[1])
+            status, markdown = request('GET', f'/jobs/{job_id}/markdown')
+            if job['status'] != 'done' or status != 200 or markdown.decode('utf-8') != content:
+                print(f"✗ 任务状态或转换结果不正确: {job}")
+                return False
+            print("✓ 提交任务、查询状态和下载结果正确")
+            
+            # 只发送请求头：根据 Content-Length 即可拒绝，不必等待上传
+            connection = http.client.HTTPConnection('127.0.0.1', server.server_port, timeout=30)
+            try:
+                connection.putrequest('POST', '/jobs?filename=big.txt')
+                connection.putheader('Content-Length', str(5 * 1024 * 1024))
+                connection.endheaders()
+                too_large_status = connection.getresponse().status
+            finally:
+                connection.close()
+            if too_large_status != 413:
+                print("✗ 超过大小上限的上传应返回 413")
+                return False
+            if request('DELETE', f'/jobs/{job_id}')[0] != 200 or request('GET', f'/jobs/{job_id}')[0] != 404:
+                print("✗ 删除任务失败")
+                return False
+            print("✓ 上传大小限制和删除任务正确")
+        finally:
+            server.shutdown()
+            server.server_close()
+            service.close()
+        
+        return True
+        
+    except Exception as e:
+        print(f"✗ HTTP转换服务测试失败: {e}")
+        return False
+
+def test_chunked_output():
+    """测试分块输出：按标题切分、大小上限和重叠、页码和幻灯片编号"""
+    print("\n测试分块输出...")
+    
+    try:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import io
+        import json
+        import markitdown_core
+        from markitdown_chunks import iter_chunks
+        
+        markdown = ("# 第一章\n引言\n\n## 背景\n" + "内容" * 120 + "\n\n```\n# 代码中的注释\n```\n"
+                    "\f第二页\n<!-- Slide number: 3 -->\n# 幻灯片标题\n要点\n")
+        chunks = list(iter_chunks(io.StringIO(markdown), 100, 20, page_breaks=True))
+        background = [chunk for chunk in chunks if chunk['heading_path'] == ['第一章', '背景']]
+        if chunks[0]['text'] != "# 第一章\n引言" or len(background) < 3:
+            print(f"✗ 按标题切分不正确: {[chunk['heading_path'] for chunk in chunks]}")
+            return False
+        if any(chunk['chars'] > 100 for chunk in chunks) or background[1]['text'][:20] != background[0]['text'][-20:]:
+            print("✗ 分块大小或重叠不正确")
+            return False
+        if '# 代码中的注释' not in background[-1]['text'] or background[-1]['page_end'] != 2:
+            print("✗ 代码块或页码不正确")
+            return False
+        if chunks[-1] != dict(chunks[-1], heading_path=['幻灯片标题'], slide=3, text="# 幻灯片标题\n要点"):
+            print(f"✗ 幻灯片分块不正确: {chunks[-1]}")
+            return False
+        print("✓ 按标题切分、大小上限、重叠、页码和幻灯片编号正确")
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            input_path = os.path.join(temp_dir, "长文.txt")
+            with open(input_path, 'w', encoding='utf-8') as f:
+                for index in range(2000):
+                    f.write(f"## 第{index}节\n" + "正文" * 300 + "\n")
+            # 大于流式转换阈值的文本文件不需要markitdown即可转换
+            options = markitdown_core.make_options(use_cache=False, stream_threshold_mb=1, chunk_size=256,
+                                                   chunk_overlap=32, chunk_unit='tokens')
+            info = markitdown_core.convert_to_file(input_path, os.path.join(temp_dir, "长文.md"), options)
+            with open(info['chunks_path'], encoding='utf-8') as f:
+                records = [json.loads(line) for line in f]
+            if len(records) != info['chunks'] or records[-1]['heading_path'] != ['第1999节'] \
+                    or records[0]['source'] != input_path or max(record['tokens'] for record in records) > 256:
+                print("✗ 转换时写出的分块文件不正确")
+                return False
+            print(f"✓ 转换时写出分块文件（{info['chunks']} 个分块）")
+        
+        return True
+        
+    except Exception as e:
+        print(f"✗ 分块输出测试失败: {e}")
+        return False
+
 def test_file_structure():
     """测试文件结构"""
     print("\n检查文件结构...")
     
     required_files = [
         'markitdown_gui.py',
+        'markitdown_core.py',
+        'markitdown_cli.py',
+        'markitdown_cache.py',
+        'markitdown_sync.py',
+        'markitdown_images.py',
+        'markitdown_stats.py',
+        'markitdown_worker.py',
+        'markitdown_stream.py',
+        'markitdown_detect.py',
+        'markitdown_watch.py',
+        'markitdown_server.py',
+        'markitdown_chunks.py',
         'build_exe.py',
         'build.bat'
     ]
@@ -116,6 +955,15 @@ def main():
         ("模块导入测试", test_imports),
         ("MarkItDown功能测试", test_markitdown_basic),
         ("GUI模块测试", test_gui_import),
+        ("转换核心测试", test_core_pipeline),
+        ("转换缓存测试", test_conversion_cache),
+        ("转换统计测试", test_conversion_stats),
+        ("转换子进程测试", test_conversion_worker),
+        ("目录同步测试", test_directory_sync),
+        ("流式转换测试", test_streaming_conversion),
+        ("监视文件夹测试", test_watch_folder),
+        ("HTTP转换服务测试", test_conversion_server),
+        ("分块输出测试", test_chunked_output),
     ]
     
     results = []